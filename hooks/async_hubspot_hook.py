@@ -0,0 +1,169 @@
+from airflow.exceptions import AirflowException
+from airflow.hooks.base_hook import BaseHook
+from HubspotPlugin.hooks.hubspot_hook import connectionSettings, \
+    connectionRateLimiter, connectionRetryPolicy, connectionTimeout, \
+    DEFAULT_POOL_SIZE
+from HubspotPlugin.utils.metrics import Metrics, metricName
+import asyncio
+import json
+import logging
+import time
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class AsyncHubspotHook(BaseHook):
+    """
+    Interact with the HubSpot API from asyncio code.
+
+    The asyncio counterpart of HubspotHook, for fan-outs that need many
+    requests in flight without a thread per request. Authentication is
+    handled the same way (a hapikey extra is sent as a query param,
+    otherwise the connection password is sent as a Bearer token) and
+    requests share the same process-wide rate limiter as HubspotHook
+    for the connection, so sync and async hooks never exceed the portal's
+    quota between them. Failed requests are retried with the same retry
+    policy and connection extras as HubspotHook, and recorded in
+    `metrics` the same way.
+
+    All requests go through a single aiohttp session whose connector
+    keeps up to `pool_size` connections open, and at most `concurrency`
+    requests are in flight at once. The hook must be used, and closed,
+    from a single event loop. Requires aiohttp.
+
+    :param hubspot_conn_id:     The Hubspot connection id.
+    :type hubspot_conn_id:      string
+    :param concurrency:         The maximum number of requests in flight.
+                                Defaults to the pool size.
+    :type concurrency:          int
+    :param pool_size:           Overrides the pool_size connection extra.
+    :type pool_size:            int
+    :param metrics:             The Metrics the hook records to. Defaults
+                                to a new Metrics.
+    :type metrics:              Metrics
+    """
+
+    def __init__(self, hubspot_conn_id, concurrency=None, pool_size=None,
+                 metrics=None):
+        if aiohttp is None:
+            raise Exception('aiohttp must be installed to use '
+                            'AsyncHubspotHook.')
+        super().__init__(source=None)
+        self.hubspot_conn_id = hubspot_conn_id
+        self.concurrency = concurrency
+        self.pool_size = pool_size
+        self.metrics = metrics or Metrics()
+        self.base_url = None
+        self.rate_limiter = None
+        self.retry_policy = None
+        self.session = None
+        self.auth_params = {}
+        self.auth_headers = {}
+        self._semaphore = None
+
+    async def get_conn(self):
+        """
+        Returns the shared session, creating it (and resolving the
+        connection and credentials) on first use.
+        """
+        if self.session is None:
+            conn = self.get_connection(self.hubspot_conn_id)
+            extras = conn.extra_dejson
+            (self.base_url,
+             self.auth_params,
+             self.auth_headers) = connectionSettings(conn)
+            self.rate_limiter = connectionRateLimiter(self.hubspot_conn_id,
+                                                      extras)
+            self.retry_policy = connectionRetryPolicy(extras)
+
+            pool_size = int(self.pool_size or
+                            extras.get('pool_size', DEFAULT_POOL_SIZE))
+            self._semaphore = asyncio.Semaphore(int(self.concurrency or
+                                                    pool_size))
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=pool_size),
+                timeout=aiohttp.ClientTimeout(
+                    total=connectionTimeout(extras)))
+        return self.session
+
+    async def run(self, endpoint, data=None, headers=None):
+        """
+        Makes a GET request to `endpoint` and returns the decoded JSON
+        body, or None if the body is empty. Raises an AirflowException
+        for any 4xx or 5xx response that is not (or can no longer be)
+        retried, as HttpHook does.
+        """
+        session = await self.get_conn()
+
+        if self.base_url and not self.base_url.endswith('/') and \
+           endpoint and not endpoint.startswith('/'):
+            url = self.base_url + '/' + endpoint
+        else:
+            url = self.base_url + endpoint
+
+        params = []
+        for key, value in dict(data or {}, **self.auth_params).items():
+            # Lists are sent as a repeated param, as requests does.
+            for e in (value if isinstance(value, (list, tuple)) else [value]):
+                params.append((key, e if isinstance(e, str) else str(e)))
+        request_headers = dict(headers or {}, **self.auth_headers)
+
+        name = metricName(endpoint)
+        attempt = 0
+        while True:
+            error = None
+            retry_after = None
+            async with self._semaphore:
+                wait = self.rate_limiter.reserve()
+                self.metrics.timing('throttle_wait', wait)
+                if wait:
+                    await asyncio.sleep(wait)
+                self.retry_policy.record_request()
+                start = time.monotonic()
+                try:
+                    async with session.get(url,
+                                           params=params,
+                                           headers=request_headers) as response:
+                        body = await response.read()
+                except asyncio.TimeoutError as e:
+                    reason = 'timeout'
+                    error = e
+                except aiohttp.ClientConnectionError as e:
+                    reason = 'connection'
+                    error = e
+                else:
+                    self.metrics.incr('requests.' + name)
+                    self.metrics.incr('bytes.' + name, len(body))
+                    self.rate_limiter.update_from_headers(response.headers)
+                    status = response.status
+                    if not self.retry_policy.retryable(status):
+                        if status >= 400:
+                            raise AirflowException(
+                                '{0}:{1}'.format(status, response.reason))
+                        return json.loads(body.decode('utf-8')) \
+                            if body.strip() else None
+                    reason = str(status)
+                    retry_after = response.headers.get('Retry-After')
+                finally:
+                    self.metrics.timing('latency.' + name,
+                                        time.monotonic() - start)
+
+            wait = self.retry_policy.wait(attempt, reason, retry_after)
+            if wait is None:
+                if error is not None:
+                    raise error
+                raise AirflowException('{0}:{1}'.format(status,
+                                                        response.reason))
+            self.metrics.incr('retries.' + reason)
+            logging.warning('Request to {0} failed ({1}), retrying in '
+                            '{2:.2f}s.'.format(endpoint, reason, wait))
+            await asyncio.sleep(wait)
+            attempt += 1
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
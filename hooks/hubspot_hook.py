@@ -1,17 +1,250 @@
 from airflow.hooks.http_hook import HttpHook
+from HubspotPlugin.utils.rate_limiter import get_rate_limiter
+from HubspotPlugin.utils.retry import RetryPolicy
+from HubspotPlugin.utils.metrics import Metrics, metricName
+from requests.adapters import HTTPAdapter
+import threading
+import logging
+import requests
+import time
+
+# HubSpot allows 10 requests per second per portal by default.
+DEFAULT_RATE_LIMIT = 10
+DEFAULT_POOL_SIZE = 10
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_RETRY_BACKOFF = 1.0
+DEFAULT_RETRY_MAX_BACKOFF = 60.0
+DEFAULT_RETRY_BUDGET = 100
+DEFAULT_RETRY_RATIO = 0.2
+DEFAULT_TIMEOUT = 60.0
+
+
+def connectionSettings(conn):
+    """
+    Resolves a HubSpot connection into its base url and the auth params
+    and headers added to every request. A hapikey in the connection
+    extras is sent as a query param, otherwise the connection password
+    is sent as a Bearer token.
+    """
+    if '://' in conn.host:
+        base_url = conn.host
+    else:
+        base_url = '{0}://{1}'.format(conn.schema or 'http', conn.host)
+    if conn.port:
+        base_url = '{0}:{1}'.format(base_url, conn.port)
+
+    extras = conn.extra_dejson
+    if extras.get('hapikey'):
+        return base_url, {'hapikey': extras.get('hapikey')}, {}
+    return base_url, {}, {"Authorization": "Bearer {0}".format(conn.password)}
+
+
+def connectionRateLimiter(conn_id, extras):
+    """
+    Returns the process-wide rate limiter for a HubSpot connection,
+    configured from its rate_limit and rate_limit_burst extras.
+    """
+    return get_rate_limiter(conn_id,
+                            float(extras.get('rate_limit', DEFAULT_RATE_LIMIT)),
+                            extras.get('rate_limit_burst') and
+                            float(extras['rate_limit_burst']))
+
+
+def connectionRetryPolicy(extras):
+    """
+    Returns a new retry policy for a HubSpot connection, configured from
+    its max_retries, retry_backoff, retry_max_backoff, retry_budget and
+    retry_ratio extras.
+    """
+    return RetryPolicy(
+        max_retries=int(extras.get('max_retries', DEFAULT_MAX_RETRIES)),
+        backoff=float(extras.get('retry_backoff', DEFAULT_RETRY_BACKOFF)),
+        max_backoff=float(extras.get('retry_max_backoff',
+                                     DEFAULT_RETRY_MAX_BACKOFF)),
+        budget=int(extras.get('retry_budget', DEFAULT_RETRY_BUDGET)),
+        ratio=float(extras.get('retry_ratio', DEFAULT_RETRY_RATIO)))
+
+
+def connectionTimeout(extras):
+    """
+    Returns the request timeout in seconds for a HubSpot connection, from
+    its timeout extra.
+    """
+    return float(extras.get('timeout', DEFAULT_TIMEOUT))
 
 
 class HubspotHook(HttpHook):
+    """
+    Interact with the HubSpot API.
+
+    The connection and credentials are resolved once per hook and all
+    requests go through a single keep-alive requests.Session, so paging
+    through an object does not hit the metadata database or open a new
+    TLS connection for every page. The hook can be shared by several
+    threads at once.
+
+    Requests are rate limited by a token bucket shared by every
+    HubspotHook in the process that uses the same connection. The hook is
+    configured from the connection extras:
+
+        - rate_limit:       Requests per second. Defaults to 10.
+        - rate_limit_burst: Largest burst of requests allowed.
+                            Defaults to rate_limit.
+        - pool_size:        The number of keep-alive connections kept
+                            open to HubSpot. Defaults to 10.
+        - max_retries:      Retries allowed per request. Defaults to 5.
+        - retry_backoff:    Base backoff in seconds. Defaults to 1.
+        - retry_max_backoff: Longest backoff in seconds. Defaults to 60.
+        - retry_budget:     Retries the hook can make back to back.
+                            Defaults to 100.
+        - retry_ratio:      The share of a retry every request adds
+                            back to the budget. Defaults to 0.2.
+        - timeout:          Seconds to wait for HubSpot to respond
+                            before retrying. Defaults to 60.
 
-    def __init__(self, hubspot_conn_id):
+    and the rate limit is then tuned from the X-HubSpot-RateLimit-*
+    headers on each response.
+
+    Throttled (429) and server error (5xx) responses, timeouts and
+    connection errors are retried with exponential backoff and jitter,
+    honouring any Retry-After header (see RetryPolicy). Retries are
+    counted in `retry_policy.metrics()`.
+
+    Every request's latency, bytes received and time spent waiting on the
+    rate limiter, and every retry, are recorded in `metrics` (see
+    Metrics), by endpoint.
+
+    :param hubspot_conn_id:     The Hubspot connection id.
+    :type hubspot_conn_id:      string
+    :param pool_size:           Overrides the pool_size connection extra.
+    :type pool_size:            int
+    :param metrics:             The Metrics the hook records to. Defaults
+                                to a new Metrics.
+    :type metrics:              Metrics
+    """
+
+    def __init__(self, hubspot_conn_id, pool_size=None, metrics=None):
         super().__init__(method='GET', http_conn_id=hubspot_conn_id)
+        self.pool_size = pool_size
+        self.metrics = metrics or Metrics()
+        self.rate_limiter = None
+        self.retry_policy = None
+        self.timeout = None
+        self.session = None
+        self.auth_params = {}
+        self.auth_headers = {}
+        self._session_lock = threading.Lock()
+
+    def get_conn(self, headers=None):
+        """
+        Returns the shared session, creating it (and resolving the
+        connection and credentials) on first use.
+        """
+        with self._session_lock:
+            if self.session is None:
+                conn = self.get_connection(self.http_conn_id)
+                extras = conn.extra_dejson
+                (self.base_url,
+                 self.auth_params,
+                 self.auth_headers) = connectionSettings(conn)
+                if self.auth_params:
+                    self.hapikey = self.auth_params['hapikey']
+                self.rate_limiter = connectionRateLimiter(self.http_conn_id,
+                                                          extras)
+                self.retry_policy = connectionRetryPolicy(extras)
+                self.timeout = connectionTimeout(extras)
+
+                pool_size = int(self.pool_size or
+                                extras.get('pool_size', DEFAULT_POOL_SIZE))
+                adapter = HTTPAdapter(pool_connections=pool_size,
+                                      pool_maxsize=pool_size)
+                session = requests.Session()
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self.session = session
+        return self.session
 
-    def run(self, endpoint, data=None, headers=None):
-        conn = self.get_connection(self.http_conn_id)
+    def run(self, endpoint, data=None, headers=None, extra_options=None):
+        session = self.get_conn()
 
-        if conn.extra_dejson.get('hapikey'):
-            self.hapikey = conn.extra_dejson.get('hapikey')
-            data['hapikey'] = self.hapikey
+        if self.base_url and not self.base_url.endswith('/') and \
+           endpoint and not endpoint.startswith('/'):
+            url = self.base_url + '/' + endpoint
         else:
-            headers = {"Authorization": "Bearer {0}".format(conn.password)}
-        return super().run(endpoint, data, headers)
+            url = self.base_url + endpoint
+
+        # Request specific params and headers are built per call rather
+        # than set on the session, which is shared between threads.
+        params = dict(data or {}, **self.auth_params)
+        request_headers = dict(headers or {}, **self.auth_headers)
+        prepped_request = session.prepare_request(
+            requests.Request(self.method,
+                             url,
+                             params=params,
+                             headers=request_headers))
+
+        extra_options = dict(extra_options or {})
+        check_response = extra_options.pop('check_response', True)
+        # The request is sent on the session directly rather than through
+        # HttpHook.run_and_check, which on some Airflow versions raises on
+        # any 4xx/5xx before a throttled or failed response can be retried.
+        settings = session.merge_environment_settings(
+            prepped_request.url,
+            extra_options.get('proxies', {}),
+            extra_options.get('stream', False),
+            extra_options.get('verify'),
+            extra_options.get('cert'))
+        send_options = {'timeout': extra_options.get('timeout',
+                                                     self.timeout),
+                        'allow_redirects': extra_options.get(
+                            'allow_redirects', True)}
+        send_options.update(settings)
+
+        name = metricName(endpoint)
+        attempt = 0
+        while True:
+            self.metrics.timing('throttle_wait', self.rate_limiter.acquire())
+            error = None
+            retry_after = None
+            self.retry_policy.record_request()
+            start = time.monotonic()
+            try:
+                response = session.send(prepped_request, **send_options)
+            except requests.exceptions.Timeout as e:
+                reason = 'timeout'
+                error = e
+            except requests.exceptions.ConnectionError as e:
+                reason = 'connection'
+                error = e
+            else:
+                self.metrics.incr('requests.' + name)
+                self.metrics.incr('bytes.' + name, len(response.content))
+                self.rate_limiter.update_from_headers(response.headers)
+                if not self.retry_policy.retryable(response.status_code):
+                    break
+                reason = str(response.status_code)
+                retry_after = response.headers.get('Retry-After')
+            finally:
+                self.metrics.timing('latency.' + name,
+                                    time.monotonic() - start)
+
+            wait = self.retry_policy.wait(attempt, reason, retry_after)
+            if wait is None:
+                if error is not None:
+                    raise error
+                break
+            self.metrics.incr('retries.' + reason)
+            logging.warning('Request to {0} failed ({1}), retrying in '
+                            '{2:.2f}s.'.format(endpoint, reason, wait))
+            time.sleep(wait)
+            attempt += 1
+
+        if check_response:
+            self.check_response(response)
+        return response
+
+    def close(self):
+        with self._session_lock:
+            if self.session is not None:
+                self.session.close()
+                self.session = None
@@ -1,16 +1,326 @@
 from airflow.utils.decorators import apply_defaults
 
-from airflow.models import BaseOperator, Variable, SkipMixin
-from airflow.hooks import S3Hook
+from airflow.models import BaseOperator, SkipMixin
 from HubspotPlugin.hooks.hubspot_hook import HubspotHook
+from HubspotPlugin.hooks.async_hubspot_hook import AsyncHubspotHook
+from HubspotPlugin.utils.output_sink import S3PartSink, DEFAULT_FLUSH_SIZE
+from HubspotPlugin.utils.parquet_sink import S3ParquetSink, \
+    DEFAULT_ROW_GROUP_SIZE
+from HubspotPlugin.utils.s3_writer import DEFAULT_PART_SIZE, \
+    validate_part_size
+from HubspotPlugin.utils.fanout import ordered_fan_out, prefetch, \
+    async_ordered_fan_out, iterate_async
+from HubspotPlugin.utils.serializers import get_serializer
+from HubspotPlugin.utils.compression import validate_compression
+from HubspotPlugin.utils.state_store import get_state_store
+from HubspotPlugin.utils.uploader import BackgroundUploader
+from HubspotPlugin.utils.metrics import Metrics, metricName
+from HubspotPlugin.schemas import hubspot_schema
 
 from flatten_json import flatten
+from collections import Counter, OrderedDict, deque
+from functools import lru_cache
+from itertools import chain, islice
 from os import path
 import datetime
 import logging
-import json
 import time
 import boa
+import re
+
+# Nested arrays that are moved into their own table. 'split' is the
+# (dot notation) path to the array, 'schema' is the sub-table's name in
+# schemas/hubspot_schema.py and 'retained' maps fields of the parent
+# record to columns copied onto every row of the sub-table.
+SUB_TABLE_MAPPING = [{'name': 'contacts',
+                      'split': 'form-submissions',
+                      'schema': 'contacts_formsubmissions',
+                      'retained': []
+                      },
+                     {'name': 'contacts',
+                      'split': 'identity-profiles',
+                      'schema': 'contacts_identityprofiles',
+                      'retained': [{"addedAt": "addedAt"}]
+                      },
+                     {'name': 'contacts',
+                      'split': 'merge-audits',
+                      'schema': 'contacts_mergeaudits',
+                      'retained': [{'vid': 'vid'}]
+                      },
+                     {'name': 'contacts',
+                      'split': 'merged-vids',
+                      'schema': 'contacts_mergedvids',
+                      'retained': [{"vid": "vid"}]
+                      },
+                     {'name': 'contacts',
+                      'split': 'list-memberships',
+                      'schema': 'contacts_listmemberships',
+                      'retained': []
+                      },
+                     {'name': 'deals',
+                      'split': 'associations.associatedVids',
+                      'schema': 'deals_associations_associatedvids',
+                      'retained': [{"dealId": "deal_id"}]
+                      },
+                     {'name': 'deals',
+                      'split': 'associations.associatedCompanyIds',
+                      'schema': 'deals_associations_associatedcompanyvids',
+                      'retained': [{"dealId": "deal_id"}]
+                      },
+                     {'name': 'deals',
+                      'split': 'associations.associatedDealIds',
+                      'schema': 'deals_associations_associateddealids',
+                      'retained': [{"dealId": "deal_id"}]
+                      },
+                     {'name': 'deal_pipelines',
+                      'split': 'stages',
+                      'schema': 'deal_pipelines_stages',
+                      'retained': [{"pipelineId": "pipeline_id"}]
+                      },
+                     {'name': 'forms',
+                      'split': 'formFieldGroups',
+                      'schema': 'forms_fieldgroups',
+                      'retained': [{'guid': 'form_id'}]
+                      },
+                     {'name': 'lists',
+                      'split': 'filters',
+                      'schema': 'lists_filters',
+                      'retained': []
+                      },
+                     {'name': 'owners',
+                      'split': 'remoteList',
+                      'schema': 'owners_remote_list',
+                      'retained': []
+                      },
+                     {'name': 'timeline',
+                      'split': 'changes',
+                      'schema': 'timeline_changes',
+                      'retained': [{'timestamp': 'timestamp'},
+                                   {'recipient': 'recipient'}]
+                      },
+                     {'name': 'workflows',
+                      'split': 'personaTagIds',
+                      'schema': 'workflows_personatagids',
+                      'retained': [{'id': 'workflow_id'}]
+                      },
+                     {'name': 'workflows',
+                      'split': 'contactListIds.steps',
+                      'schema': 'workflows_contactlistids_steps',
+                      'retained': [{'id': 'workflow_id'}]
+                      }]
+
+
+# Flattened keys the operator emits under a different name than the
+# column of schemas/hubspot_schema.py that holds them, by schema table.
+# Applied when projecting columns (and so for Parquet output).
+COLUMN_ALIASES = {'contacts': {'canonical_vid': 'canonicalvid',
+                               'is_contact': 'iscontact',
+                               'merged_vids': 'mergedvids',
+                               'portal_id': 'portalid',
+                               'profile_token': 'profiletoken',
+                               'profile_url': 'profileurl'},
+                  'contacts_formsubmissions': {'canonical_url': 'canonicalurl',
+                                               'content_type': 'contenttype',
+                                               'conversion_id': 'conversionid',
+                                               'form_id': 'formid',
+                                               'meta_data': 'metadata',
+                                               'page_id': 'pageid',
+                                               'page_title': 'pagetitle',
+                                               'page_url': 'pageurl',
+                                               'portal_id': 'portalid'},
+                  'contacts_identityprofiles': dict(
+                      [('deleted_changed_timestamp', 'deletedchangedtimestamp'),
+                       ('saved_at_timestamp', 'savedattimestamp')] +
+                      [('identities_{0}_is_{1}'.format(i, kind),
+                        'identities_{0}_is{1}'.format(i, kind))
+                       for i in range(4)
+                       for kind in ('primary', 'secondary')]),
+                  'contacts_mergeaudits': {'canonical_vid': 'canonicalvid',
+                                           'entity_id': 'entityid',
+                                           'first_name': 'firstname',
+                                           'last_name': 'lastname',
+                                           'num_properties_moved':
+                                           'numpropertiesmoved',
+                                           'user_id': 'userid',
+                                           'vid_to_merge': 'vidtomerge'},
+                  'contacts_mergedvids': {'merged_vids': 'merged_vid'},
+                  'contacts_by_company': {'vid': 'contact_id'},
+                  'deals_associations_associatedvids':
+                  {'associations_associatedvids': 'associated_vids'},
+                  'deals_associations_associatedcompanyvids':
+                  {'associations_associatedcompanyids':
+                   'associated_company_vids'},
+                  'deals_associations_associateddealids':
+                  {'associations_associateddealids': 'associated_deal_ids'},
+                  'forms_fieldgroups': {'form_id': 'form_guid'},
+                  'workflows': {'contact_list_ids_active':
+                                'contact_listids_active',
+                                'contact_list_ids_enrolled':
+                                'contact_listids_enrolled'}}
+
+# Endpoints that return recently modified records (newest first) for the
+# objects that support incremental syncs. 'modified' is the path to each
+# record's last modified timestamp (epoch milliseconds) and 'since' marks
+# endpoints that can filter on that timestamp server side. HubSpot only
+# serves the last 30 days (and at most 10k records) from these endpoints.
+INCREMENTAL_MAPPING = {'contacts': {'endpoint': 'contacts/v1/lists/'
+                                                'recently_updated/contacts/'
+                                                'recent',
+                                    'records': 'contacts',
+                                    'modified': ('properties',
+                                                 'lastmodifieddate',
+                                                 'value'),
+                                    'since': False},
+                       'companies': {'endpoint': 'companies/v2/companies/'
+                                                 'recent/modified',
+                                     'records': 'results',
+                                     'modified': ('properties',
+                                                  'hs_lastmodifieddate',
+                                                  'value'),
+                                     'since': False},
+                       'deals': {'endpoint': 'deals/v1/deal/recent/modified',
+                                 'records': 'results',
+                                 'modified': ('properties',
+                                              'hs_lastmodifieddate',
+                                              'value'),
+                                 'since': True},
+                       'engagements': {'endpoint': 'engagements/v1/engagements/'
+                                                   'recent/modified',
+                                       'records': 'results',
+                                       'modified': ('engagement',
+                                                    'lastUpdated'),
+                                       'since': True}}
+
+# The recently modified endpoints are paged 100 records at a time, and
+# only serve the last 30 days (in milliseconds) and 10k records.
+RECENT_PAGE_SIZE = 100
+RECENT_MAX_RECORDS = 10000
+RECENT_MAX_AGE = 30 * 24 * 60 * 60 * 1000
+
+# Query parameters that trim an endpoint's default response down to what
+# is loaded, used with payload_mode='lean'. 'property' is the endpoint's
+# (repeated) parameter selecting the properties returned, 'value_only'
+# is sent when the schema loads no property history (timestamps,
+# sources or versions) and 'params' are always sent.
+LEAN_PAYLOAD_MAPPING = {'contacts/v1/lists/all/contacts/all':
+                        {'property': 'property',
+                         'value_only': {'propertyMode': 'value_only'},
+                         'params': {'showListMemberships': 'false'}},
+                        'contacts/v1/lists/recently_updated/contacts/recent':
+                        {'property': 'property',
+                         'value_only': {'propertyMode': 'value_only'},
+                         'params': {'showListMemberships': 'false'}},
+                        'companies/v2/companies/paged':
+                        {'property': 'properties',
+                         'value_only': {},
+                         'params': {}},
+                        'deals/v1/deal/paged':
+                        {'property': 'properties',
+                         'value_only': {},
+                         'params': {'includeAssociations': 'true'}},
+                        'contacts/v1/contact/vids/batch/':
+                        {'property': 'property',
+                         'value_only': {'propertyMode': 'value_only'},
+                         'params': {'showListMemberships': 'false'}}}
+
+# contacts_by_company can be enriched with each contact's full record,
+# read in batches from HubSpot's batch by vid endpoint into this table.
+ENRICHED_TABLE = 'contacts'
+CONTACT_BATCH_ENDPOINT = 'contacts/v1/contact/vids/batch/'
+CONTACT_BATCH_SIZE = 100
+
+
+@lru_cache(maxsize=None)
+def compileSubTablePlan(hubspot_object):
+    """
+    Compiles the SUB_TABLE_MAPPING entries for a single object into
+    a plan with the dotted paths pre-split into tuples, so that no
+    per-record work is spent on entries for other objects.
+    """
+    return tuple({'split': entry['split'],
+                  'schema': entry['schema'],
+                  'path': tuple(entry['split'].split('.')),
+                  'column': entry['split'].lower().replace('.', '_'),
+                  'retained': tuple((k, v)
+                                    for item in entry['retained']
+                                    for k, v in item.items())}
+                 for entry in SUB_TABLE_MAPPING
+                 if entry['name'] == hubspot_object)
+
+
+# Every record of an object shares the same few hundred flattened keys,
+# so their snake_case conversion is cached rather than recomputed.
+@lru_cache(maxsize=2 ** 16)
+def constrictKey(key):
+    return boa.constrict(key)
+
+
+@lru_cache(maxsize=None)
+def schemaProperties(schema_name):
+    """
+    Returns the names of the HubSpot properties loaded into a table of
+    schemas/hubspot_schema.py, taken from its properties_<name>_<field>
+    columns, and whether only their values (rather than their
+    timestamps or sources too) are loaded.
+    """
+    names = []
+    values_only = True
+    for column in getattr(hubspot_schema, schema_name, []):
+        match = re.match(r'^properties_(.+?)_(value|timestamp|source_id|source)$',
+                         column['name'])
+        if match:
+            if match.group(1) not in names:
+                names.append(match.group(1))
+            if match.group(2) != 'value':
+                values_only = False
+    return tuple(names), values_only
+
+
+@lru_cache(maxsize=None)
+def compileFieldSelector(schema_name):
+    """
+    Compiles a field selector for a table in schemas/hubspot_schema.py.
+
+    The selector flattens a record exactly as flatten_json does (with
+    snake_case keys), but only descends into keys whose converted path
+    is a column of the table (or one of its COLUMN_ALIASES) or a prefix
+    of one. Unused branches such as property version histories are
+    skipped without being walked. Aliased keys are renamed to their
+    column.
+    """
+    columns = {column['name']: column['name']
+               for column in getattr(hubspot_schema, schema_name)}
+    columns.update(COLUMN_ALIASES.get(schema_name, {}))
+    prefixes = frozenset(name[:i]
+                         for name in columns
+                         for i, char in enumerate(name) if char == '_')
+
+    def select(record):
+        selected = {}
+
+        def walk(obj, key):
+            if obj and isinstance(obj, dict):
+                children = obj.items()
+            elif obj and isinstance(obj, (list, set, tuple)):
+                children = enumerate(obj)
+            else:
+                name = constrictKey(key)
+                if name in columns:
+                    selected[columns[name]] = obj
+                return
+            for child_key, child in children:
+                child_key = '{0}_{1}'.format(key, child_key)
+                name = constrictKey(child_key)
+                if name in columns or name in prefixes:
+                    walk(child, child_key)
+
+        for key, value in record.items():
+            name = constrictKey(str(key))
+            if name in columns or name in prefixes:
+                walk(value, str(key))
+        return selected
+
+    return select
 
 
 class HubspotToS3Operator(BaseOperator, SkipMixin):
@@ -60,6 +370,143 @@ class HubspotToS3Operator(BaseOperator, SkipMixin):
     :param s3_key:                   The S3 key to be used to store
                                      the Hubspot data.
     :type s3_key:                    string
+    :param s3_part_size:             The size (in bytes) of each part sent
+                                     to S3 in a multipart upload. Records
+                                     are serialized one at a time into
+                                     parts of this size, so it bounds the
+                                     memory used while writing output.
+                                     Must be at least 5MB. Defaults to 16MB.
+    :type s3_part_size:              int
+    :param fetch_concurrency:        The number of requests allowed in flight
+                                     at once when an object needs one request
+                                     per parent record (e.g. one per campaign).
+                                     All requests still share the hook's rate
+                                     limit. Defaults to 4.
+    :type fetch_concurrency:         int
+    :param json_serializer:          The JSON backend used to serialize
+                                     records. Either 'orjson' or 'json'
+                                     (the standard library). Both produce
+                                     compact UTF-8 output, but orjson writes
+                                     float exponents differently and NaN as
+                                     null (see utils/serializers.py). By
+                                     default orjson is used if installed.
+    :type json_serializer:           string
+    :param compression:              Compress the output files as they are
+                                     written. Either 'gzip' or 'zstd' (which
+                                     requires the zstandard package). The
+                                     matching extension ('.gz' or '.zst') is
+                                     appended to each S3 key and the object's
+                                     Content-Encoding is set. Defaults to None.
+    :type compression:               string
+    :param compression_level:        The compression level. Defaults to 6 for
+                                     gzip and 3 for zstd.
+    :type compression_level:         int
+    :param output_format:            Either 'ndjson' or 'parquet'. Parquet
+                                     files are typed from the matching table
+                                     in schemas/hubspot_schema.py and contain
+                                     only its columns. Tables without a schema
+                                     are still written as NDJSON. Parquet
+                                     files take a '.parquet' extension in
+                                     place of the s3_key's own. In parquet
+                                     mode 'compression' sets the Parquet codec
+                                     (snappy by default) instead. Defaults to
+                                     'ndjson'.
+    :type output_format:             string
+    :param row_group_size:           The number of rows in each Parquet row
+                                     group. Defaults to 10000.
+    :type row_group_size:            int
+    :param project_columns:          If True, only the columns listed for
+                                     each table in schemas/hubspot_schema.py
+                                     are written, and unused nested fields
+                                     are skipped before flattening. Tables
+                                     without a schema are written in full.
+                                     Fields named differently from their
+                                     column are renamed (see
+                                     COLUMN_ALIASES), and columns no record
+                                     had a field for are logged. Parquet
+                                     output is always projected. Defaults
+                                     to False.
+    :type project_columns:           bool
+    :param incremental:              If True, only records modified since the
+                                     previous successful run are pulled, using
+                                     HubSpot's recently modified endpoints.
+                                     The newest last modified date seen is
+                                     kept per task in the state store (by
+                                     default the Variable INCREMENTAL_KEY__
+                                     <dag_id>_<task_id>_lastmodifieddate) once
+                                     the run's output is in S3. The first
+                                     run (with no watermark) is a full pull,
+                                     as is any run whose changes are older
+                                     or more than the recently modified
+                                     endpoints serve (30 days, 10k records).
+                                     Supported for contacts, companies,
+                                     deals and engagements. Defaults to
+                                     False.
+    :type incremental:               bool
+    :param state_store:              Where state kept between runs (the
+                                     contacts vidOffset, the incremental
+                                     watermark and checkpoints) is stored.
+                                     Writes are batched: each flush saves
+                                     the keys of its part files before they
+                                     are uploaded, then the checkpoint once
+                                     they are in S3. Either 'variable' (Airflow
+                                     Variables, the default),
+                                     'sqlite:///path/to/state.db' or
+                                     's3://bucket/prefix' (one JSON object
+                                     per task, using s3_conn_id).
+    :type state_store:               string
+    :param upload_workers:           The number of threads uploading part
+                                     files to S3 in the background while
+                                     fetching continues. 0 uploads each
+                                     flush before fetching resumes.
+                                     Defaults to 2.
+    :type upload_workers:            int
+    :param upload_queue_size:        The maximum number of part files queued
+                                     or uploading at once. Fetching pauses
+                                     when the queue is full. Defaults to 4.
+    :type upload_queue_size:         int
+    :param prefetch_pages:           The number of pages fetched ahead, on a
+                                     background thread, while the current
+                                     page is split, flattened and
+                                     serialized. 0 fetches each page only
+                                     once the previous one is written.
+                                     Defaults to 1.
+    :type prefetch_pages:            int
+    :param async_fetch:              Fetch campaigns and contacts_by_company,
+                                     which need one request per campaign or
+                                     company, with an AsyncHubspotHook
+                                     instead of a thread pool. Up to
+                                     fetch_concurrency requests are in
+                                     flight at once. Requires aiohttp.
+                                     Defaults to False.
+    :type async_fetch:               boolean
+    :param payload_mode:             Either 'full' or 'lean'. In lean mode
+                                     contacts, companies and deals only
+                                     request the properties listed for them
+                                     in schemas/hubspot_schema.py, without
+                                     property history, and contacts are
+                                     requested without list memberships.
+                                     hubspot_args still take precedence.
+                                     Defaults to 'full'.
+    :type payload_mode:              string
+    :param enrich_contacts:          contacts_by_company only. If True, every
+                                     contact found is also read in full, 100
+                                     at a time and once per run, with the
+                                     batch by vid endpoint and written to a
+                                     'contacts' table alongside the company
+                                     mapping. Defaults to False.
+    :type enrich_contacts:           boolean
+    :param flush_size:               Part files are flushed to S3 once about
+                                     this many bytes (after compression) are
+                                     buffered across all tables. None
+                                     disables the size limit. Defaults to
+                                     64 MiB.
+    :type flush_size:                int
+    :param flush_records:            Part files are flushed to S3 once this
+                                     many rows are buffered across all
+                                     tables. None (the default) disables
+                                     the row limit.
+    :type flush_records:             int
     """
 
     template_fields = ('s3_key',
@@ -73,6 +520,24 @@ class HubspotToS3Operator(BaseOperator, SkipMixin):
                  s3_bucket,
                  s3_key,
                  hubspot_args={},
+                 s3_part_size=DEFAULT_PART_SIZE,
+                 fetch_concurrency=4,
+                 json_serializer=None,
+                 compression=None,
+                 compression_level=None,
+                 output_format='ndjson',
+                 row_group_size=DEFAULT_ROW_GROUP_SIZE,
+                 project_columns=False,
+                 incremental=False,
+                 state_store=None,
+                 upload_workers=2,
+                 upload_queue_size=4,
+                 prefetch_pages=1,
+                 async_fetch=False,
+                 payload_mode='full',
+                 enrich_contacts=False,
+                 flush_size=DEFAULT_FLUSH_SIZE,
+                 flush_records=None,
                  **kwargs):
         super().__init__(**kwargs)
         self.hubspot_conn_id = hubspot_conn_id
@@ -81,6 +546,24 @@ class HubspotToS3Operator(BaseOperator, SkipMixin):
         self.s3_conn_id = s3_conn_id
         self.s3_bucket = s3_bucket
         self.s3_key = s3_key
+        self.s3_part_size = s3_part_size
+        self.fetch_concurrency = fetch_concurrency
+        self.json_serializer = json_serializer
+        self.compression = compression
+        self.compression_level = compression_level
+        self.output_format = output_format.lower()
+        self.row_group_size = row_group_size
+        self.project_columns = project_columns
+        self.incremental = incremental
+        self.state_store = state_store
+        self.upload_workers = upload_workers
+        self.upload_queue_size = upload_queue_size
+        self.prefetch_pages = prefetch_pages
+        self.async_fetch = async_fetch
+        self.payload_mode = payload_mode.lower()
+        self.enrich_contacts = enrich_contacts
+        self.flush_size = flush_size
+        self.flush_records = flush_records
 
         if self.hubspot_object not in ('campaigns',
                                        'companies',
@@ -100,145 +583,794 @@ class HubspotToS3Operator(BaseOperator, SkipMixin):
             raise Exception('{0} is not a currently supported queryable object.'
                             .format(self.hubspot_object))
 
+        # Fail at DAG parse time rather than at run time if the requested
+        # serializer or compression is unknown or not installed, or the
+        # part size is too small for S3.
+        get_serializer(self.json_serializer)
+        validate_compression(self.compression)
+        validate_part_size(self.s3_part_size)
+
+        if self.incremental and self.hubspot_object not in INCREMENTAL_MAPPING:
+            raise Exception('Incremental syncs are not supported for {0}.'
+                            .format(self.hubspot_object))
+
+        if self.output_format not in ('ndjson', 'parquet'):
+            raise Exception('{0} is not a supported output format.'
+                            .format(self.output_format))
+
+        if self.payload_mode not in ('full', 'lean'):
+            raise Exception('{0} is not a supported payload mode.'
+                            .format(self.payload_mode))
+
+        if self.enrich_contacts and \
+           self.hubspot_object != 'contacts_by_company':
+            raise Exception('Contact enrichment is only supported for '
+                            'contacts_by_company.')
+
     def execute(self, context):
-        h = HubspotHook(self.hubspot_conn_id)
+        self.metrics = Metrics()
+        h = HubspotHook(self.hubspot_conn_id, metrics=self.metrics)
+        try:
+            return self.extractToS3(context, h)
+        finally:
+            h.close()
+
+    def extractToS3(self, context, h):
+        """
+        Pulls the object from HubSpot with `h` and writes it to S3.
+        """
         self.split = path.splitext(self.s3_key)
         self.total_output_files = 0
+        self.serializer = get_serializer(self.json_serializer)
+        self.state = get_state_store(self.state_store,
+                                     'INCREMENTAL_KEY__{0}_{1}'
+                                     .format(context['ti'].dag_id,
+                                             context['ti'].task_id),
+                                     s3_conn_id=self.s3_conn_id)
+        self.checkpoint = self.loadCheckpoint(context)
+        self.unmatched_columns = {}
+        self.async_retry_policies = []
+        # Pages (or, for fan-outs, parent records) already written
+        # to S3 by a previous attempt of this run.
+        done = self.checkpoint['page'] if self.checkpoint else 0
 
-        if self.hubspot_object == 'campaigns':
-            campaigns = self.retrieve_data(h,
-                                           context,
-                                           "email/public/v1/campaigns")
-            final_output = []
-            for campaign in campaigns[0]['core']:
-                logging.info("CAMPAIGN ID: " + str(campaign))
-                output = self.retrieve_data(h,
-                                            context,
-                                            campaign_id=campaign['id'])
-                output = output[0]['core']
-                final_output.extend(output)
-            self.outputManager(context,
-                               final_output,
-                               '{0}_core_final{1}'.format(self.split[0],
-                                                          self.split[1]),
-                               self.s3_bucket)
+        if self.async_fetch and self.hubspot_object in ('campaigns',
+                                                        'contacts_by_company'):
+            pages = self.numberPages(iterate_async(self.fanOutAsync(context,
+                                                                    done)),
+                                     done)
+        elif self.hubspot_object == 'campaigns':
+            campaign_ids = (campaign['id']
+                            for page in self.paginate_data(
+                                h,
+                                "email/public/v1/campaigns",
+                                self.buildPayload(context))
+                            for campaign in page['records'])
+
+            def fetch_campaign(campaign_id):
+                logging.info("CAMPAIGN ID: " + str(campaign_id))
+                endpoint = self.methodMapper('campaigns',
+                                             campaign_id=campaign_id)
+                return [h.run(endpoint, self.buildPayload(context)).json()]
+
+            # Results come back in the same order as the campaign list
+            # regardless of which request finishes first.
+            pages = self.numberPages(ordered_fan_out(fetch_campaign,
+                                                     islice(campaign_ids,
+                                                            done,
+                                                            None),
+                                                     self.fetch_concurrency),
+                                     done)
         elif self.hubspot_object == 'contacts_by_company':
-            companies = self.retrieve_data(h,
-                                           context,
-                                           endpoint=self.methodMapper('companies'))
+            company_ids = self.iterCompanyIds(h, context)
+            first_company_id = next(company_ids, None)
             logging.info('Received companies list...')
-            if not companies:
+            if first_company_id is None:
                 logging.info('No companies currently available.')
-                downstream_tasks = context['task'].get_flat_relatives(upstream=False)
-                logging.info('Skipping downstream tasks...')
-                logging.debug("Downstream task_ids %s", downstream_tasks)
-                if downstream_tasks:
-                    self.skip(context['dag_run'],
-                              context['ti'].execution_date,
-                              downstream_tasks)
+                self.skipDownstreamTasks(context)
+                self.pushMetrics(context, h)
                 return True
-            final_output = []
-
-            for company in companies[0]['core']:
-                output = self.retrieve_data(h,
-                                            context,
-                                            company_id=company['companyId'])
-                final_output.extend(output)
-            self.outputManager(context,
-                               output,
-                               '{0}_core_final{1}'.format(self.split[0],
-                                                          self.split[1]),
-                               self.s3_bucket)
+
+            # Companies are streamed from the paged endpoint straight into
+            # the worker pool and each company's vids are written as soon
+            # as they arrive, rather than after every company is fetched.
+            pages = self.numberPages(ordered_fan_out(
+                lambda company_id: self.fetchCompanyVids(h, company_id),
+                islice(chain([first_company_id], company_ids), done, None),
+                self.fetch_concurrency),
+                done)
+        elif self.incremental:
+            pages = self.paginateIncremental(h, context)
         else:
-            output = self.retrieve_data(h, context)
+            pages = self.resumePages(h,
+                                     self.methodMapper(self.hubspot_object),
+                                     self.buildPayload(context))
 
-            for e in output:
-                for k, v in e.items():
-                    if k == 'core':
-                        key = '{0}_core_final{1}'.format(self.split[0],
-                                                         self.split[1])
-                    else:
-                        key = '{0}_{1}_final{2}'.format(self.split[0],
-                                                        k.lower().replace('.',
-                                                                          '_'),
-                                                        self.split[1])
+        if self.prefetch_pages:
+            # Cursor paginated endpoints can't be fetched in parallel, but
+            # the next page can be in flight while this one is processed.
+            pages = prefetch(pages, self.prefetch_pages)
+        pages = self.splitStage(pages)
+        if self.enrich_contacts:
+            pages = self.enrichStage(h, pages)
+        pages = self.serializeStage(pages)
+        try:
+            self.outputManager(context, pages)
+        finally:
+            # Stop any background fetching straight away if the output
+            # fails, rather than whenever the pipeline is collected.
+            pages.close()
 
-                    self.outputManager(context,
-                                       v,
-                                       key,
-                                       self.s3_bucket)
+        logging.info('Total Output File Count: ' + str(self.total_output_files))
+        self.warnUnmatchedColumns()
+        self.pushMetrics(context, h)
 
-            logging.info('Total Output File Count: ' + str(self.total_output_files))
+    def pushMetrics(self, context, h):
+        """
+        Logs the run's metrics and pushes them to XCom as
+        'hubspot_metrics', so a run's throughput can be compared with
+        earlier runs without StatsD.
+        """
+        summary = self.metrics.summary()
+        # The async fan-out retries on its own hook's policy.
+        policies = [e for e in [h.retry_policy] + self.async_retry_policies
+                    if e is not None]
+        if policies:
+            retries = {'retries': 0,
+                       'retries_by_reason': Counter(),
+                       'retry_wait': 0.0,
+                       'retries_exhausted': 0}
+            for policy in policies:
+                metrics = policy.metrics()
+                retries['retries'] += metrics['retries']
+                retries['retries_by_reason'].update(
+                    metrics['retries_by_reason'])
+                retries['retry_wait'] += metrics['retry_wait']
+                retries['retries_exhausted'] += metrics['retries_exhausted']
+            retries['retries_by_reason'] = dict(retries['retries_by_reason'])
+            summary['retries'] = retries
+        logging.info('Metrics: ' + str(summary))
+        context['ti'].xcom_push(key='hubspot_metrics', value=summary)
 
-    def outputManager(self, context, output, key, bucket):
-        if len(output) == 0 or output is None:
-            if self.total_output_files == 0:
-                logging.info("No records pulled from Hubspot.")
+    def skipDownstreamTasks(self, context):
+        downstream_tasks = context['task'].get_flat_relatives(upstream=False)
 
-                downstream_tasks = context['task'].get_flat_relatives(upstream=False)
+        logging.info('Skipping downstream tasks...')
+        logging.debug("Downstream task_ids %s", downstream_tasks)
 
-                logging.info('Skipping downstream tasks...')
-                logging.debug("Downstream task_ids %s", downstream_tasks)
+        if downstream_tasks:
+            self.skip(context['dag_run'],
+                      context['ti'].execution_date,
+                      downstream_tasks)
 
-                if downstream_tasks:
-                    self.skip(context['dag_run'],
-                              context['ti'].execution_date,
-                              downstream_tasks)
-        else:
-            logging.info('Logging {0} to S3...'.format(key))
-
-            output = [flatten(e) for e in output]
-            output = '\n'.join([json.dumps({boa.constrict(k): v
-                               for k, v in i.items()}) for i in output])
-
-            s3 = S3Hook(self.s3_conn_id)
-            s3.load_string(
-                string_data=str(output),
-                key=key,
-                bucket_name=bucket,
-                replace=True
-            )
-            s3.connection.close()
-
-            self.total_output_files += 1
-
-    def retrieve_data(self,
-                      h,
-                      context,
-                      endpoint=None,
-                      company_id=None,
-                      campaign_id=None):
-        if endpoint is None:
-            endpoint = self.methodMapper(self.hubspot_object,
-                                         company_id=company_id,
-                                         campaign_id=campaign_id)
+    def numberPages(self, record_lists, done=0):
+        """
+        Wraps each list of records from a fan-out in a page,
+        as yielded by paginate_data.
+        """
+        for number, records in enumerate(record_lists, done + 1):
+            yield {'number': number,
+                   'records': records,
+                   'cursor': None,
+                   'next': None}
 
+    def resumePages(self, h, endpoint, payload):
+        """
+        Pages through `endpoint`, starting from the cursor of the last
+        checkpoint if a previous attempt of this run saved one.
+        """
+        payload = dict(self.leanPayload(endpoint), **payload)
+        if not self.checkpoint:
+            return self.paginate_data(h, endpoint, payload)
+        if self.checkpoint['next'] is None:
+            # The previous attempt had already received the last page.
+            return iter([])
+        logging.info('Resuming from checkpoint after page {0}: {1}'
+                     .format(self.checkpoint['page'],
+                             self.checkpoint['next']))
+        payload.update(self.checkpoint['next'])
         return self.paginate_data(h,
                                   endpoint,
-                                  context,
-                                  company_id=company_id,
-                                  campaign_id=campaign_id)
+                                  payload,
+                                  first_number=self.checkpoint['page'])
 
-    def paginate_data(self,
-                      h,
-                      endpoint,
-                      context,
-                      company_id=None,
-                      campaign_id=None):
+    def leanPayload(self, endpoint, schema_name=None):
         """
-        This method takes care of request building and pagination.
-        It retrieves 100 at a time and continues to make
-        subsequent requests until it retrieves less than 100 records.
+        Returns the query parameters that select only the properties
+        loaded into `schema_name` (the object's core table by default)
+        from `endpoint` in lean payload mode (see LEAN_PAYLOAD_MAPPING),
+        or nothing in full mode or if the endpoint has no such
+        parameters.
+        """
+        if self.payload_mode != 'lean' or \
+           endpoint not in LEAN_PAYLOAD_MAPPING:
+            return {}
+        mapping = LEAN_PAYLOAD_MAPPING[endpoint]
+        names, values_only = schemaProperties(schema_name or
+                                              self.hubspot_object)
+        names = list(names)
+        # The last modified date is needed to move the watermark on.
+        if self.incremental:
+            modified = INCREMENTAL_MAPPING[self.hubspot_object]['modified']
+            if modified[0] == 'properties' and modified[1] not in names:
+                names.append(modified[1])
+
+        payload = dict(mapping['params'])
+        if values_only:
+            payload.update(mapping['value_only'])
+        if names:
+            payload[mapping['property']] = names
+        return payload
+
+    def paginateIncremental(self, h, context):
+        """
+        Pages through the records modified since the task's watermark
+        using the object's recently modified endpoint. Records are
+        returned newest first, so paging stops at the first record no
+        newer than the watermark, and the newest last modified date is
+        tracked so it can be saved once the output is in S3.
+
+        Without a watermark, with one older than the endpoint serves or
+        once the endpoint's record cap is reached before the watermark,
+        this is a full pull instead, and the new watermark is the time
+        the pull started.
+
+        Each page records whether it came from a full pull and the new
+        watermark as of that page, under 'full_pull' and 'watermark', as
+        it is yielded. Pages can be fetched well ahead of the flush that
+        checkpoints them, so the checkpoint is built from these rather
+        than from the generator's current state.
+        """
+        mapping = INCREMENTAL_MAPPING[self.hubspot_object]
+        watermark = self.getWatermark()
+        started = int(time.time() * 1000)
+        if self.checkpoint:
+            self.full_pull = self.checkpoint.get('full_pull',
+                                                 watermark is None)
+            self.new_watermark = self.checkpoint.get('watermark')
+        else:
+            self.full_pull = watermark is None or \
+                watermark < started - RECENT_MAX_AGE
+            self.new_watermark = started if self.full_pull else watermark
+
+        def full_pull_pages(pages):
+            for page in pages:
+                page['full_pull'] = True
+                page['watermark'] = self.new_watermark
+                yield page
+
+        if self.full_pull:
+            if self.checkpoint and self.checkpoint.get('full_pull'):
+                logging.info('Resuming the full pull of all records.')
+            elif watermark is None:
+                logging.info('No watermark found, pulling all records.')
+            else:
+                logging.info('Watermark {0} is older than the recently '
+                             'modified endpoint serves, pulling all records.'
+                             .format(watermark))
+            yield from full_pull_pages(
+                self.resumePages(h,
+                                 self.methodMapper(self.hubspot_object),
+                                 self.buildPayload(context)))
+            return
+
+        number = self.checkpoint['page'] if self.checkpoint else 0
+        # A retry whose checkpoint is already at the endpoint's cap goes
+        # straight on to the full pull.
+        if number * RECENT_PAGE_SIZE < RECENT_MAX_RECORDS:
+            logging.info('Pulling records modified after: ' + str(watermark))
+            payload = self.buildPayload(context)
+            payload['count'] = RECENT_PAGE_SIZE
+            if mapping['since']:
+                payload['since'] = watermark
+            pages = self.resumePages(h, mapping['endpoint'], payload)
+
+            for page in pages:
+                records = []
+                reached_watermark = False
+                for record in page['records']:
+                    modified = record
+                    try:
+                        for key in mapping['modified']:
+                            modified = modified[key]
+                        modified = int(modified)
+                    except (KeyError, TypeError, ValueError):
+                        modified = None
+                    if modified is not None:
+                        if watermark is not None and modified <= watermark:
+                            reached_watermark = True
+                            continue
+                        if self.new_watermark is None or \
+                           modified > self.new_watermark:
+                            self.new_watermark = modified
+                    records.append(record)
+                page['records'] = records
+                page['full_pull'] = False
+                page['watermark'] = self.new_watermark
+                number = page['number']
+                yield page
+                if reached_watermark:
+                    pages.close()
+                    return
+                if number * RECENT_PAGE_SIZE >= RECENT_MAX_RECORDS:
+                    pages.close()
+                    break
+
+            if number * RECENT_PAGE_SIZE < RECENT_MAX_RECORDS:
+                return
+        # Older changes are past the endpoint's cap and can only be found
+        # by pulling everything. Records already read are written twice.
+        # The full pull's pages carry on the numbering, and their own
+        # cursors, so a retry resumes it from its own checkpoints.
+        logging.warning('Over {0} records were modified after {1}, pulling '
+                        'all records.'.format(RECENT_MAX_RECORDS, watermark))
+        self.full_pull = True
+        self.new_watermark = started
+        endpoint = self.methodMapper(self.hubspot_object)
+        yield from full_pull_pages(
+            self.paginate_data(h,
+                               endpoint,
+                               dict(self.leanPayload(endpoint),
+                                    **self.buildPayload(context)),
+                               first_number=number))
+
+    def splitStage(self, pages):
+        """
+        Pipeline stage that splits the records on each page into the
+        core table and any sub-tables (see subTableMapper).
+        """
+        for page in pages:
+            page['tables'] = {}
+            if page['records']:
+                for e in self.subTableMapper(page['records']):
+                    page['tables'].update(e)
+            del page['records']
+            yield page
+
+    def enrichStage(self, h, pages):
+        """
+        Pipeline stage for contacts_by_company that reads the full record
+        of every contact on the pages from the batch by vid endpoint and
+        adds them to the pages as the ENRICHED_TABLE table.
+
+        Vids are only read once per run, CONTACT_BATCH_SIZE at a time,
+        so pages are held back until they hold a full batch of new vids
+        (or run out). The held pages are then released in order with the
+        contacts on the last of them, so a page is never checkpointed
+        before its contacts are written.
+        """
+        seen = set()
+        held = []
+        vids = []
+
+        def fetch_batch(batch):
+            payload = dict(self.leanPayload(CONTACT_BATCH_ENDPOINT,
+                                            'contacts'),
+                           vid=batch)
+            response = h.run(CONTACT_BATCH_ENDPOINT, payload).json() or {}
+            return [response[str(vid)] for vid in batch
+                    if str(vid) in response]
+
+        def release():
+            batches = [vids[i:i + CONTACT_BATCH_SIZE]
+                       for i in range(0, len(vids), CONTACT_BATCH_SIZE)]
+            contacts = [contact
+                        for records in ordered_fan_out(fetch_batch,
+                                                       batches,
+                                                       self.fetch_concurrency)
+                        for contact in records]
+            if contacts:
+                held[-1]['tables'][ENRICHED_TABLE] = contacts
+            released = list(held)
+            del held[:]
+            del vids[:]
+            return released
+
+        for page in pages:
+            for row in page['tables'].get('core', []):
+                if row['vid'] not in seen:
+                    seen.add(row['vid'])
+                    vids.append(row['vid'])
+            held.append(page)
+            if len(vids) >= CONTACT_BATCH_SIZE:
+                yield from release()
+        if held:
+            yield from release()
+
+    def serializeStage(self, pages):
+        """
+        Pipeline stage that flattens each record and serializes it
+        to a line of JSON. Parquet output is encoded by the sink, so
+        in that mode records are only flattened.
+        """
+        flatteners = {}
+        for page in pages:
+            tables = {}
+            for table, records in page['tables'].items():
+                if table not in flatteners:
+                    flatteners[table] = self.tableFlattener(table)
+                self.metrics.incr('records.{0}.{1}'
+                                  .format(self.hubspot_object,
+                                          metricName(table)),
+                                  len(records))
+                flatten_record = flatteners[table]
+                if self.output_format == 'parquet':
+                    tables[table] = [flatten_record(e) for e in records]
+                else:
+                    tables[table] = [self.serializer.dumps(flatten_record(e))
+                                     for e in records]
+            page['tables'] = tables
+            yield page
+
+    def tableFlattener(self, table):
+        """
+        Returns the function used to flatten the records of a table:
+        the table's field selector when projecting columns, or
+        flattenRecord otherwise. Schema columns the selector never
+        fills are tracked in `unmatched_columns` until they are seen.
+        """
+        if self.project_columns or self.output_format == 'parquet':
+            name = self.tableSchemaName(table)
+            columns = getattr(hubspot_schema, name, None)
+            if columns:
+                select = compileFieldSelector(name)
+                unmatched = self.unmatched_columns.setdefault(
+                    name, set(column['name'] for column in columns))
+
+                def select_record(record):
+                    row = select(record)
+                    if unmatched:
+                        unmatched.difference_update(row)
+                    return row
+                return select_record
+        return self.flattenRecord
+
+    def warnUnmatchedColumns(self):
+        """
+        Warns about every schema column that no record of the run had a
+        field for. Those columns are empty in the output, which usually
+        means the field is missing from COLUMN_ALIASES.
+        """
+        for name, columns in sorted(self.unmatched_columns.items()):
+            if columns:
+                logging.warning('No field matched columns {0} of {1}; they '
+                                'are empty in the output.'
+                                .format(sorted(columns), name))
+
+    def flattenRecord(self, record):
+        return {constrictKey(k): v
+                for k, v in flatten(record).items()}
+
+    def tableSchemaName(self, table):
+        """
+        Returns the name of an output table in schemas/hubspot_schema.py.
+        """
+        if table == 'core':
+            return self.hubspot_object
+        if self.enrich_contacts and table == ENRICHED_TABLE:
+            return 'contacts'
+        return [entry['schema']
+                for entry in compileSubTablePlan(self.hubspot_object)
+                if entry['split'] == table][0]
+
+    def tableColumns(self, table):
+        """
+        Returns the columns of an output table from
+        schemas/hubspot_schema.py, or None if it has no schema.
         """
-        output = []
+        return getattr(hubspot_schema, self.tableSchemaName(table), None)
+
+    def createSink(self, uploader):
+        sink = S3PartSink(uploader,
+                          compression=(None if self.output_format == 'parquet'
+                                       else self.compression),
+                          compression_level=self.compression_level)
+        if self.output_format == 'parquet':
+            sink = S3ParquetSink(uploader,
+                                 self.tableColumns,
+                                 sink,
+                                 self.serializer,
+                                 row_group_size=self.row_group_size,
+                                 compression=self.compression)
+        return sink
+
+    def outputManager(self, context, pages):
+        """
+        Final pipeline stage. Writes each serialized page to the S3 sink,
+        flushing a part file for every table, numbered after the page,
+        whenever flushDue says so and a "final" part file once the pages
+        are exhausted.
+
+        Part files are uploaded in the background while fetching carries
+        on. The offset and checkpoint for a flush are only saved once all
+        of its part files (and those of earlier flushes) are in S3.
+
+        The keys of every flush are saved (under pendingKeysName, so
+        separately for every run) before its uploads start, until they
+        are checkpointed. A failed attempt can leave some of them in S3,
+        and as a retry may flush at different pages they would duplicate
+        its rows, so a retry of the same run deletes them before anything
+        else is written. Other runs of the task never touch them.
+        """
+        uploader = BackgroundUploader(self.s3_conn_id,
+                                      self.s3_bucket,
+                                      part_size=self.s3_part_size,
+                                      workers=self.upload_workers,
+                                      max_pending=self.upload_queue_size,
+                                      metrics=self.metrics)
+        sink = self.createSink(uploader)
+        cursor = None
+        keys = self.checkpoint['keys'] if self.checkpoint else []
+        # Flushes whose uploads may still be running, oldest first.
+        flushes = deque()
+        pending_name = self.pendingKeysName(context)
+        stale = [e for e in self.state.get(pending_name, [])
+                 if e not in keys]
+        if stale:
+            logging.info('Deleting part files left by a failed attempt: {0}'
+                         .format(stale))
+            uploader.delete(stale)
+        pending = []
+
+        def submit_flush(part):
+            key_for_table = lambda table: self.outputKey(table, part)
+            pending.extend(sink.flush_keys(key_for_table))
+            self.state.set(pending_name, list(pending))
+            self.state.flush()
+            return sink.flush(key_for_table)
+
+        def commit_flushes(wait=False):
+            while flushes and (wait or all(e.done() for e in flushes[0][0])):
+                futures, page = flushes.popleft()
+                committed = [e.result() for e in futures]
+                keys.extend(committed)
+                for key in committed:
+                    pending.remove(key)
+                self.state.set(pending_name, list(pending))
+                self.saveOffset(page['cursor'])
+                self.saveCheckpoint(context, page, keys)
+                self.state.flush()
+
         try:
-            initial_offset = Variable.get('INCREMENTAL_KEY__{0}_{1}_vidOffset'.format(context['ti'].dag_id,
-                                                                                      context['ti'].task_id))
-            print('INITIAL OFFSET: ' + str(initial_offset))
-        except:
-            initial_offset = 0
+            for page in pages:
+                for table, rows in page['tables'].items():
+                    for row in rows:
+                        sink.write(table, row)
+                cursor = page['cursor']
+                if self.flushDue(sink):
+                    logging.info('Sending to Output Manager...')
+                    self.recordFlush(sink)
+                    futures = submit_flush(page['number'])
+                    flushes.append((futures, {'number': page['number'],
+                                              'cursor': page['cursor'],
+                                              'next': page['next'],
+                                              'full_pull':
+                                              page.get('full_pull'),
+                                              'watermark':
+                                              page.get('watermark')}))
+                commit_flushes()
+            self.recordFlush(sink)
+            submit_flush('final')
+            uploader.wait()
+            commit_flushes(wait=True)
+            self.saveOffset(cursor)
+            # Recently modified records arrive newest first, so the
+            # watermark is only safe to move once every page is in S3.
+            if self.incremental:
+                self.saveWatermark()
+            if self.checkpoint:
+                self.state.delete(self.checkpointName(context))
+            self.state.delete(pending_name)
+            self.state.flush()
+        finally:
+            uploader.close()
+            sink.close()
+
+        self.total_output_files += sink.total_output_files
+        if self.total_output_files == 0 and not keys:
+            logging.info("No records pulled from Hubspot.")
+            self.skipDownstreamTasks(context)
+
+    def flushDue(self, sink):
+        """
+        Whether the rows buffered in `sink` should be flushed, i.e.
+        whether they have reached flush_size bytes or flush_records rows.
+        Only checked between pages, so a flush may overshoot either
+        limit by up to a page.
+        """
+        if self.flush_size and sink.buffered_bytes >= self.flush_size:
+            return True
+        return bool(self.flush_records and
+                    sink.buffered_records >= self.flush_records)
+
+    def recordFlush(self, sink):
+        """
+        Records the size of the flush `sink` is about to make, if any.
+        """
+        if not sink.buffered_records:
+            return
+        self.metrics.gauge('flush_bytes', sink.buffered_bytes)
+        self.metrics.gauge('flush_records', sink.buffered_records)
+
+    def outputKey(self, table, part):
+        if table == 'core':
+            name = 'core'
+        elif part == 'final':
+            name = table.lower().replace('.', '_')
+        else:
+            name = constrictKey(table)
+        return '{0}_{1}_{2}{3}'.format(self.split[0],
+                                       name,
+                                       str(part),
+                                       self.split[1])
 
-        final_payload = {'vidOffset': initial_offset}
+    def saveOffset(self, offset):
+        """
+        Only contacts carry their vidOffset from one run to the next.
+        This is called once the records up to `offset` are in S3.
+        """
+        if self.hubspot_object != 'contacts' or offset is None \
+           or self.incremental:
+            return
+        if offset == 0:
+            logging.info('No new records received.')
+        else:
+            logging.info('New offset is now: ' + str(offset))
+            self.state.set('vidOffset', offset)
+
+    def loadCheckpoint(self, context):
+        """
+        Returns the checkpoint saved by a failed attempt of the same
+        run (i.e. the same execution date), or None.
+        """
+        checkpoint = self.state.get(self.checkpointName(context))
+        if not checkpoint or \
+           checkpoint.get('run') != str(context['ti'].execution_date):
+            return None
+        logging.info('Found checkpoint after page {0} with {1} part files.'
+                     .format(checkpoint['page'], len(checkpoint['keys'])))
+        return checkpoint
+
+    def checkpointName(self, context):
+        """
+        Returns the state key holding the checkpoint of this run (i.e.
+        this execution date), so runs of the task never resume from, or
+        overwrite, each other's checkpoints.
+        """
+        return 'checkpoint_{0}'.format(context['ti'].execution_date)
+
+    def pendingKeysName(self, context):
+        """
+        Returns the state key holding the part files this run (i.e. this
+        execution date) has submitted but not yet checkpointed.
+        """
+        return 'pending_keys_{0}'.format(context['ti'].execution_date)
+
+    def saveCheckpoint(self, context, page, keys):
+        """
+        Records how far this run has got once every part file up to
+        `page` is in S3: the page number, the cursor parameters that
+        request the next page and the keys written so far. A retry
+        resumes from the next page and continues the part numbering,
+        so part files are neither duplicated nor lost. Incremental syncs
+        also record whether `page` came from a full pull (and so which
+        endpoint its cursor belongs to) and the new watermark as of
+        `page`.
+        """
+        self.checkpoint = {'run': str(context['ti'].execution_date),
+                           'page': page['number'],
+                           'next': page['next'],
+                           'keys': list(keys)}
+        if self.incremental:
+            self.checkpoint['watermark'] = page['watermark']
+            self.checkpoint['full_pull'] = page['full_pull']
+        self.state.set(self.checkpointName(context), self.checkpoint)
+
+    def getWatermark(self):
+        try:
+            return int(self.state.get('lastmodifieddate'))
+        except (TypeError, ValueError):
+            return None
+
+    def saveWatermark(self):
+        if self.new_watermark is None:
+            logging.info('No modified records received.')
+            return
+        logging.info('New watermark is now: ' + str(self.new_watermark))
+        self.state.set('lastmodifieddate', self.new_watermark)
+
+    def companiesPayload(self, context):
+        """
+        Returns the payload paging through the companies whose contacts
+        contacts_by_company fetches: 250 companies a page, unless
+        hubspot_args say otherwise.
+        """
+        payload = {'limit': 250}
+        payload.update(self.buildPayload(context))
+        return payload
+
+    def iterCompanyIds(self, h, context):
+        """
+        Lazily pages through every company in the portal and
+        yields each company id.
+        """
+        for page in self.paginate_data(h,
+                                       self.methodMapper('companies'),
+                                       self.companiesPayload(context)):
+            for company in page['records']:
+                yield company['companyId']
+
+    def fetchCompanyVids(self, h, company_id):
+        """
+        Retrieves every contact vid associated with a single company,
+        paging through the results with the endpoint's vidOffset cursor.
+        """
+        endpoint = self.methodMapper('contacts_by_company',
+                                     company_id=company_id)
+        return [{"vid": e, "company_id": company_id}
+                for page in self.paginate_data(h, endpoint, {'count': 100})
+                for e in page['records']]
+
+    async def fanOutAsync(self, context, done=0):
+        """
+        Async execution path for the objects that need one request per
+        parent record (campaigns and contacts_by_company). Pages through
+        the parent list and fetches each parent's records on a single
+        AsyncHubspotHook, with up to `fetch_concurrency` parents in
+        flight. Yields each parent's list of records in list order,
+        skipping the first `done` parents.
+        """
+        h = AsyncHubspotHook(self.hubspot_conn_id,
+                             concurrency=self.fetch_concurrency,
+                             metrics=self.metrics)
+
+        if self.hubspot_object == 'campaigns':
+            endpoint = "email/public/v1/campaigns"
+            payload = self.buildPayload(context)
+            id_key = 'id'
+
+            async def fetch(campaign_id):
+                logging.info("CAMPAIGN ID: " + str(campaign_id))
+                endpoint = self.methodMapper('campaigns',
+                                             campaign_id=campaign_id)
+                return [await h.run(endpoint, self.buildPayload(context))]
+        else:
+            endpoint = self.methodMapper('companies')
+            payload = self.companiesPayload(context)
+            id_key = 'companyId'
+
+            async def fetch(company_id):
+                endpoint = self.methodMapper('contacts_by_company',
+                                             company_id=company_id)
+                return [{"vid": e, "company_id": company_id}
+                        async for page in self.paginateDataAsync(
+                            h, endpoint, {'count': 100})
+                        for e in page['records']]
+
+        async def parent_ids():
+            seen = 0
+            async for page in self.paginateDataAsync(h, endpoint, payload):
+                for record in page['records']:
+                    seen += 1
+                    if seen > done:
+                        yield record[id_key]
+
+        try:
+            async for records in async_ordered_fan_out(fetch,
+                                                       parent_ids(),
+                                                       self.fetch_concurrency):
+                yield records
+        finally:
+            self.async_retry_policies.append(h.retry_policy)
+            await h.close()
+
+    def buildPayload(self, context):
+        final_payload = {}
+
+        if self.hubspot_object == 'contacts' and not self.incremental:
+            initial_offset = self.state.get('vidOffset', 0)
+            logging.info('INITIAL OFFSET: ' + str(initial_offset))
+            final_payload['vidOffset'] = initial_offset
 
         if self.hubspot_object in ('events', 'timeline'):
             final_payload['limit'] = 1000
@@ -248,153 +1380,131 @@ class HubspotToS3Operator(BaseOperator, SkipMixin):
             final_payload['count'] = 100
 
         for param in self.hubspot_args:
+            value = self.hubspot_args[param]
             # If time used as filter in request and is a string object
             # (e.g. when using {{ execution_date}}), convert the timestamp
-            # to Hubspot formatting as needed by Hubspot API.
-            if param in ('startTimestamp', 'endTimestamp'):
-                param_time = datetime.datetime.strptime(self.hubspot_args[param],
+            # to Hubspot formatting as needed by Hubspot API. The converted
+            # value is not written back to hubspot_args as this method can
+            # be called several times (and from several threads) per run.
+            if param in ('startTimestamp', 'endTimestamp')\
+             and isinstance(value, str):
+                param_time = datetime.datetime.strptime(value,
                                                         "%Y-%m-%d %H:%M:%S")
-                self.hubspot_args[param] = int(time.mktime(param_time.timetuple())
-                                               * 1000)
-            final_payload[param] = self.hubspot_args[param]
+                value = int(time.mktime(param_time.timetuple()) * 1000)
+            final_payload[param] = value
+        return final_payload
+
+    def paginate_data(self, h, endpoint, payload, first_number=0):
+        """
+        This method takes care of request building and pagination.
+        It is a generator that requests one page at a time and
+        continues to make subsequent requests, following the
+        endpoint's offset cursor, until Hubspot reports no more
+        records. Each page is yielded as soon as it is received as
+        a dict of:
+            - number:   The page number, counting on from `first_number`.
+            - records:  The list of records on the page.
+            - cursor:   The offset returned with the page, if any.
+            - next:     The parameters that request the following
+                        page, or None if this is the last page.
+        """
+        final_payload = dict(payload)
         logging.info('FINAL PAYLOAD: ' + str(final_payload))
-        response = h.run(endpoint, final_payload).json()
-        if not response:
-            logging.info('Resource Unavailable.')
-            return ''
-        if self.hubspot_object == 'owners':
-            output.extend([e for e in response])
-            # output = [self.filterMapper(record) for record in output]
-            output = self.subTableMapper(output)
-            return output
-        elif self.hubspot_object == 'engagements':
-            output.extend([e for e in response['results']])
-        elif self.hubspot_object == 'contacts_by_company':
-            if endpoint == 'companies/v2/companies/paged':
-                if response['companies']:
-                    output.extend([e for e in response['companies']])
-                else:
-                    logging.info('No companies currently available.')
-                    return ''
-            else:
-                output.extend([{"vid": e, "company_id": company_id}
-                               for e in response['vids']])
-        elif self.hubspot_object == 'campaigns':
-            if 'email/public/v1/campaigns/' in endpoint:
-                output.append(response)
-        elif self.hubspot_object in ('deal_pipelines', 'social'):
-                output.extend([e for e in response])
-        else:
-            output.extend([e for e in response[self.hubspot_object]])
+        number = first_number
 
-        if isinstance(response, dict):
-            if 'hasMore' in list(response.keys()):
-                more = 'hasMore'
-            elif 'has-more' in list(response.keys()):
-                more = 'has-more'
-            else:
-                more = 'has-more'
-                response['has-more'] = False
-            n = 0
-
-            if 'vid-offset' in list(response.keys()):
-                offset_variable = 'vid-offset'
-            elif 'offset' in list(response.keys()):
-                offset_variable = 'offset'
-
-            while response[more] is True:
-                if offset_variable == 'vid-offset':
-                    final_payload['vidOffset'] = response['vid-offset']
-                    logging.info('Retrieving: ' + str(response['vid-offset']))
-                elif offset_variable == 'offset':
-                    final_payload['offset'] = response['offset']
-                    logging.info('Retrieving: ' + str(response['offset']))
-                try:
-                    response = h.run(endpoint, final_payload).json()
-                except:
-                    pass
+        while True:
+            response = h.run(endpoint, final_payload).json()
+            if not response:
+                if number == first_number:
+                    logging.info('Resource Unavailable.')
+                return
+            number += 1
+            self.metrics.incr('pages.' + metricName(endpoint))
+            cursor, next_params = self.nextPageParams(response)
 
-                if endpoint == 'companies/v2/companies/paged':
-                    if response['companies']:
-                        output.extend([e for e in response['companies']])
-                else:
-                    output.extend([e for e in response[self.hubspot_object]])
-
-                n += 1
-                time.sleep(0.2)
-                if n % 50 == 0:
-                    # output = [self.filterMapper(record) for record in output]
-                    output = self.subTableMapper(output)
-                    if self.hubspot_object == 'contacts_by_company':
-                        companies = self.retrieve_data(h, self.methodMapper('companies'))
-                        if not companies:
-                            logging.info('No companies currently available.')
-                            downstream_tasks = context['task'].get_flat_relatives(upstream=False)
-                            logging.info('Skipping downstream tasks...')
-                            logging.debug("Downstream task_ids %s", downstream_tasks)
-                            if downstream_tasks:
-                                self.skip(context['dag_run'], context['ti'].execution_date, downstream_tasks)
-                            return True
-                        final_output = []
-                        for company in companies:
-                            final_output.extend(output)
-                        key = '{0}_core_{1}{2}'.format(self.split[0],
-                                                       str(n),
-                                                       self.split[1])
-                        self.outputManager(context,
-                                           output,
-                                           key,
-                                           self.s3_bucket)
+            yield {'number': number,
+                   'records': self.recordsFromResponse(response, endpoint),
+                   'cursor': cursor,
+                   'next': next_params}
 
-                    else:
-                        for e in output:
-                            for k, v in e.items():
-                                if k == 'core':
-                                    key = '{0}_core_{1}{2}'.format(self.split[0],
-                                                                   str(n),
-                                                                   self.split[1])
-                                else:
-                                    key = '{0}_{1}_{2}{3}'.format(self.split[0],
-                                                                  boa.constrict(k),
-                                                                  str(n),
-                                                                  self.split[1])
-                                logging.info('Sending to Output Manager...')
-                                self.outputManager(context,
-                                                   v,
-                                                   key,
-                                                   self.s3_bucket)
-                                if self.hubspot_object == 'contacts':
-                                    if response[offset_variable] == 0:
-                                        logging.info('No new records received.')
-                                        logging.info('Offset variable is still: ' + str(initial_offset))
-                                    else:
-                                        new_offset = ('INCREMENTAL_KEY__{0}_{1}_vidOffset'
-                                                      .format(context['ti'].dag_id,
-                                                              context['ti'].task_id))
-                                        logging.info('New Variable offset is now: ' +\
-                                                     str(response[offset_variable]))
-
-                                        Variable.set(new_offset, response[offset_variable])
-
-                    output = []
-
-            if self.hubspot_object == 'contacts':
-                if response[offset_variable] == 0:
-                    logging.info('No new records received.')
-                    logging.info('Offset variable is still: ' + str(initial_offset))
-                else:
-                    new_offset = ('INCREMENTAL_KEY__{0}_{1}_vidOffset'
-                                  .format(context['ti'].dag_id,
-                                          context['ti'].task_id))
-                    logging.info('New Variable offset is now: ' + str(response[offset_variable]))
+            if next_params is None:
+                return
+            final_payload.update(next_params)
+            logging.info('Retrieving: ' + str(cursor))
+
+    async def paginateDataAsync(self, h, endpoint, payload):
+        """
+        The asyncio counterpart of paginate_data, for an AsyncHubspotHook.
+        """
+        final_payload = dict(payload)
+        logging.info('FINAL PAYLOAD: ' + str(final_payload))
+        number = 0
 
-                    Variable.set(new_offset, response[offset_variable])
+        while True:
+            response = await h.run(endpoint, final_payload)
+            if not response:
+                if number == 0:
+                    logging.info('Resource Unavailable.')
+                return
+            number += 1
+            self.metrics.incr('pages.' + metricName(endpoint))
+            cursor, next_params = self.nextPageParams(response)
 
+            yield {'number': number,
+                   'records': self.recordsFromResponse(response, endpoint),
+                   'cursor': cursor,
+                   'next': next_params}
 
-        # output = [self.filterMapper(record) for record in output]
-        output = self.subTableMapper(output)
+            if next_params is None:
+                return
+            final_payload.update(next_params)
+            logging.info('Retrieving: ' + str(cursor))
 
-        return output
+    def nextPageParams(self, response):
+        """
+        Reads the offset cursor from a single page of results. Returns
+        the cursor and the parameters that request the following page,
+        or None for the parameters if this is the last page.
+        """
+        more = False
+        cursor = None
+        next_params = {}
+        if isinstance(response, dict):
+            more = response.get('hasMore', response.get('has-more'))
+            for offset_variable, param in (('vid-offset', 'vidOffset'),
+                                           ('vidOffset', 'vidOffset'),
+                                           ('offset', 'offset')):
+                if offset_variable in response:
+                    cursor = response[offset_variable]
+                    next_params[param] = cursor
+                    break
+            # The recently updated contacts endpoint pages with a
+            # time offset alongside the vid offset.
+            if 'time-offset' in response:
+                next_params['timeOffset'] = response['time-offset']
+        if more is not True or cursor is None:
+            next_params = None
+        return cursor, next_params
+
+    def recordsFromResponse(self, response, endpoint):
+        """
+        Extracts the list of records from a single page of results.
+        """
+        if isinstance(response, list):
+            return response
+        elif self.hubspot_object in INCREMENTAL_MAPPING and \
+            endpoint == INCREMENTAL_MAPPING[self.hubspot_object]['endpoint']:
+            return response.get(INCREMENTAL_MAPPING[self.hubspot_object]
+                                ['records']) or []
+        elif endpoint == self.methodMapper('companies'):
+            return response.get('companies') or []
+        elif self.hubspot_object == 'contacts_by_company':
+            return response.get('vids') or []
+        elif self.hubspot_object == 'campaigns':
+            return response.get('campaigns') or []
+        elif self.hubspot_object == 'engagements':
+            return response.get('results') or []
+        return response.get(self.hubspot_object) or []
 
     def methodMapper(self, hubspot_object, company_id=None, campaign_id=None):
         """
@@ -427,128 +1537,46 @@ class HubspotToS3Operator(BaseOperator, SkipMixin):
         This mapper expects a list of either dictionaries
         or string values as specified in the 'split' value
         of the mapping and then outputs them to a new object.
-        """
-        mapping = [{'name': 'contacts',
-                    'split': 'form-submissions',
-                    'retained': []
-                    },
-                   {'name': 'contacts',
-                    'split': 'identity-profiles',
-                    'retained': [{"addedAt": "addedAt"}]
-                    },
-                   {'name': 'contacts',
-                    'split': 'merge-audits',
-                    'retained': [{'vid': 'vid'}]
-                    },
-                   {'name': 'contacts',
-                    'split': 'merged-vids',
-                    'retained': [{"vid": "vid"}]
-                    },
-                   {'name': 'contacts',
-                    'split': 'list-memberships',
-                    'retained': []
-                    },
-                   {'name': 'deals',
-                    'split': 'associations.associatedVids',
-                    'retained': [{"dealId": "deal_id"}]
-                    },
-                   {'name': 'deals',
-                    'split': 'associations.associatedCompanyIds',
-                    'retained': [{"dealId": "deal_id"}]
-                    },
-                   {'name': 'deals',
-                    'split': 'associations.associatedDealIds',
-                    'retained': [{"dealId": "deal_id"}]
-                    },
-                   {'name': 'deal_pipelines',
-                    'split': 'stages',
-                    'retained': [{"pipelineId": "pipeline_id"}]
-                    },
-                   {'name': 'forms',
-                    'split': 'formFieldGroups',
-                    'retained': [{'guid': 'form_id'}]
-                    },
-                   {'name': 'lists',
-                    'split': 'filters',
-                    'retained': []
-                    },
-                   {'name': 'owners',
-                    'split': 'remoteList',
-                    'retained': []
-                    },
-                   {'name': 'timeline',
-                    'split': 'changes',
-                    'retained': [{'timestamp': 'timestamp'},
-                                 {'recipient': 'recipient'}]
-                    },
-                   {'name': 'workflows',
-                    'split': 'personaTagIds',
-                    'retained': [{'id': 'workflow_id'}]
-                    },
-                   {'name': 'workflows',
-                    'split': 'contactListIds.steps',
-                    'retained': [{'id': 'workflow_id'}]
-                    }]
 
-        def process_record(record, mapping):
-            final_returnable_dict = {}
+        The mapping is compiled once per object (see
+        compileSubTablePlan) and each record is routed into
+        all of its sub-tables in a single pass.
+        """
+        plan = compileSubTablePlan(self.hubspot_object)
+        core = []
+        tables = OrderedDict((entry['split'], []) for entry in plan)
 
-            def getByDotNotation(obj, ref):
-                val = obj
+        for record in output:
+            for entry in plan:
+                subtable_data = record
                 try:
-                    for key in ref.split('.'):
-                        val = val[key]
-                except:
-                    val = False
-                return val
+                    for key in entry['path']:
+                        subtable_data = subtable_data[key]
+                except (KeyError, IndexError, TypeError):
+                    continue
+                if not subtable_data:
+                    continue
+                rows = tables[entry['split']]
+                for item in subtable_data:
+                    if isinstance(item, dict):
+                        row = item
+                    elif isinstance(item, (str, int)):
+                        row = {entry['column']: item}
+                    else:
+                        row = {}
+                    for k, v in entry['retained']:
+                        try:
+                            row[v] = record[k]
+                        except KeyError:
+                            logging.info('Retained field {0} missing from {1}'
+                                         .format(k, record))
+                    rows.append(row)
+            core.append(record)
 
-            for entry in mapping:
-                returnable_list = []
-                subtable_data = getByDotNotation(record, entry['split'])
-                if ((entry['name'] == self.hubspot_object) and subtable_data):
-                    final_key_split = entry['split'].lower().replace('.', '_')
-                    for item in subtable_data:
-                        returnable_dict = {}
-                        if isinstance(item, dict):
-                            returnable_dict = item
-                        elif isinstance(item, str) or isinstance(item, int):
-                            returnable_dict[final_key_split] = item
-                        for item in entry['retained']:
-                            for k, v in item.items():
-                                try:
-                                    returnable_dict[v] = record[k]
-                                except KeyError:
-                                    logging.info(record)
-                                    logging.info(returnable_dict[v])
-                        returnable_list.append(returnable_dict)
-
-                if returnable_list:
-                    final_returnable_dict[entry['split']] = returnable_list
-
-                final_returnable_dict['core'] = record
-            return final_returnable_dict
-
-        def process_data(output):
-            output = [process_record(record, mapping) for record in output]
-            output_list = []
-            output_dict = {}
-            output_dict['core'] = [e.pop('core') for e in output]
-            output_list.append(output_dict)
-            for entry in mapping:
-                output_dict = {}
-                if (entry['name'] == self.hubspot_object):
-                    output_dict[entry['split']] = [e.pop(entry['split']) for e in output
-                                                   if (entry['split'] in list(e.keys()))]
-                    output_dict[entry['split']] = [item for sublist in output_dict[entry['split']]
-                                                   for item in sublist]
-                    if not output_dict[entry['split']]:
-                        del output_dict[entry['split']]
-                    output_list.append(output_dict)
-            output_list = [e for e in output_list if e]
-
-            return output_list
-
-        return process_data(output)
+        output_list = [{'core': core}]
+        output_list.extend({split: rows} for split, rows in tables.items()
+                           if rows)
+        return output_list
 
     def filterMapper(self, record):
         """
@@ -0,0 +1,84 @@
+"""
+Serializer benchmark
+
+Times every available JSON backend in utils/serializers.py against
+flattened records built from the fixtures in responses/, checks that
+all backends produce identical bytes, and reports records per second.
+
+Each backend is warmed up and then timed serializing the records
+`repeat` times, and the fastest pass is reported, so only dumps() is
+measured and not the garbage collector or anything else on the machine.
+
+Usage:
+    python bench_serializers.py [record_count] [repeat]
+"""
+from HubspotPlugin.utils.serializers import SERIALIZERS, orjson
+from flatten_json import flatten
+from os import path
+import glob
+import hashlib
+import json
+import sys
+import timeit
+
+RESPONSES = path.join(path.dirname(path.abspath(__file__)), 'responses')
+
+
+def load_records():
+    records = []
+    for filename in sorted(glob.glob(path.join(RESPONSES, '*.json'))):
+        with open(filename) as f:
+            response = json.load(f)
+        if isinstance(response, dict):
+            lists = [v for v in response.values() if isinstance(v, list)]
+            response = lists[0] if lists else [response]
+        records.extend(flatten(e) if isinstance(e, dict) else {'value': e}
+                       for e in response)
+    return records
+
+
+def digest(serializer, records):
+    """
+    Returns a hash and the total size of `records` serialized with
+    `serializer`, without holding the whole output in memory.
+    """
+    h = hashlib.sha256()
+    size = 0
+    for e in records:
+        data = serializer.dumps(e)
+        h.update(data)
+        h.update(b'\n')
+        size += len(data) + 1
+    return h.hexdigest(), size
+
+
+def main(record_count=100000, repeat=5):
+    sample = load_records()
+    records = (sample * (record_count // len(sample) + 1))[:record_count]
+
+    names = [e for e in sorted(SERIALIZERS) if e != 'orjson' or orjson]
+    digests = {}
+    for name in names:
+        serializer = SERIALIZERS[name]()
+        dumps = serializer.dumps
+
+        def run():
+            for e in records:
+                dumps(e)
+
+        # The first pass is an untimed warm up, which also checks the
+        # output against the other backends.
+        digests[name], size = digest(serializer, records)
+        elapsed = min(timeit.repeat(run, number=1, repeat=repeat))
+        print('{0:<8} {1:>10,.0f} records/s  {2:>8.3f}s  {3:>12,} bytes'
+              .format(name, len(records) / elapsed, elapsed, size))
+
+    if len(set(digests.values())) > 1:
+        print('WARNING: serializers produced different output.')
+        return 1
+    print('All serializers produced identical output.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[int(e) for e in sys.argv[1:]]))
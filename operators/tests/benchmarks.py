@@ -0,0 +1,362 @@
+"""
+Operator benchmarks
+
+Times the operator against synthetic records built from the fixtures in
+responses/ (see fixtures.py), without any network or S3 access:
+
+    - paginate:     paginate_data, i.e. parsing and paging through
+                    the responses.
+    - split:        subTableMapper on every page of records.
+    - output:       outputManager writing serialized pages to S3.
+    - execute:      execute, end to end.
+
+HubSpot is replaced by a hook serving the synthetic pages and S3 by an
+in-memory bucket. Every benchmark runs in its own process and reports
+records per second and peak RSS, and the peak memory allocated according
+to tracemalloc from a second, traced, run.
+
+Results can be saved as a baseline and later runs compared against it.
+Any benchmark more than --threshold slower, or using that much more
+memory, than its baseline is reported as a regression.
+
+Usage:
+    python benchmarks.py [--records 10000,100000] [--objects contacts,deals]
+                         [--benchmarks paginate,split,output,execute]
+                         [--save baseline.json] [--compare baseline.json]
+                         [--threshold 0.1] [--no-allocations]
+"""
+from HubspotPlugin.operators.tests.fixtures import PAGED_FIXTURES, \
+    SyntheticPages
+import HubspotPlugin.operators.hubspot_to_s3_operator as operator_module
+import HubspotPlugin.utils.uploader as uploader_module
+from HubspotPlugin.utils.state_store import get_state_store
+from HubspotPlugin.utils.serializers import get_serializer
+from HubspotPlugin.utils.metrics import Metrics
+from urllib.parse import urlparse
+from os import path
+import argparse
+import datetime
+import platform
+import resource
+import subprocess
+import tempfile
+import tracemalloc
+import json
+import sys
+import os
+import time
+
+BENCHMARKS = ('paginate', 'split', 'output', 'execute')
+DEFAULT_OBJECTS = ('contacts', 'companies', 'deals', 'engagements', 'events')
+DEFAULT_RECORDS = (10 ** 4, 10 ** 5)
+
+
+class FixtureResponse(object):
+
+    def __init__(self, content):
+        self.content = content
+        self.status_code = 200
+        self.headers = {}
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class FixtureHook(object):
+    """
+    Stands in for HubspotHook, serving `total_records` synthetic records
+    of every paged object and empty responses for anything else.
+    """
+    total_records = 0
+
+    def __init__(self, *args, **kwargs):
+        self.retry_policy = None
+        self.pages = {urlparse(mapping['endpoint']).path.strip('/'):
+                      SyntheticPages(name, self.total_records)
+                      for name, mapping in PAGED_FIXTURES.items()}
+        self.bytes_received = 0
+
+    def run(self, endpoint, data=None, headers=None, extra_options=None):
+        pages = self.pages.get(endpoint.strip('/'))
+        content = pages.respond(data or {}) if pages else b'{}'
+        self.bytes_received += len(content)
+        return FixtureResponse(content)
+
+    def close(self):
+        pass
+
+
+class MemoryS3Hook(object):
+    """
+    Stands in for S3Hook, keeping the size of every object written.
+    """
+    objects = {}
+
+    def __init__(self, *args, **kwargs):
+        self.connection = self
+
+    def get_bucket(self, bucket_name):
+        return self
+
+    def close(self):
+        pass
+
+    def new_key(self, key):
+        return MemoryUpload(key)
+
+    def initiate_multipart_upload(self, key, headers=None):
+        return MemoryUpload(key)
+
+
+class MemoryUpload(object):
+
+    def __init__(self, key):
+        self.key = key
+        self.size = 0
+
+    def set_contents_from_string(self, data, headers=None, replace=True):
+        MemoryS3Hook.objects[self.key] = len(data)
+
+    def upload_part_from_file(self, fp, part_num):
+        self.size += len(fp.read())
+
+    def complete_upload(self):
+        MemoryS3Hook.objects[self.key] = self.size
+
+    def cancel_upload(self):
+        pass
+
+
+class BenchmarkInstance(object):
+    dag_id = 'benchmarks'
+    task_id = 'benchmark'
+    execution_date = datetime.datetime(2018, 1, 1)
+
+    def xcom_push(self, key, value):
+        pass
+
+
+class BenchmarkTask(object):
+
+    def get_flat_relatives(self, upstream=False):
+        return []
+
+
+def make_operator(hubspot_object, state_dir):
+    return operator_module.HubspotToS3Operator(
+        task_id='benchmark',
+        hubspot_conn_id='hubspot',
+        hubspot_object=hubspot_object,
+        s3_conn_id='s3',
+        s3_bucket='benchmarks',
+        s3_key='benchmarks/{0}.json'.format(hubspot_object),
+        state_store='sqlite:///' + path.join(state_dir, 'state.db'))
+
+
+def prepare(operator, context):
+    """
+    Sets up the state execute would before calling the stage under test.
+    """
+    operator.split = path.splitext(operator.s3_key)
+    operator.total_output_files = 0
+    operator.serializer = get_serializer(operator.json_serializer)
+    operator.state = get_state_store(operator.state_store, 'benchmark')
+    operator.checkpoint = None
+    operator.metrics = Metrics()
+    operator.unmatched_columns = {}
+
+
+def bench_paginate(operator, context, records):
+    hook = FixtureHook()
+    count = 0
+    start = time.perf_counter()
+    for page in operator.paginate_data(hook,
+                                       operator.methodMapper(
+                                           operator.hubspot_object),
+                                       operator.buildPayload(context)):
+        count += len(page['records'])
+    return count, time.perf_counter() - start
+
+
+def bench_split(operator, context, records):
+    hook = FixtureHook()
+    count = 0
+    elapsed = 0.0
+    for page in operator.paginate_data(hook,
+                                       operator.methodMapper(
+                                           operator.hubspot_object),
+                                       operator.buildPayload(context)):
+        start = time.perf_counter()
+        operator.subTableMapper(page['records'])
+        elapsed += time.perf_counter() - start
+        count += len(page['records'])
+    return count, elapsed
+
+
+def bench_output(operator, context, records):
+    # Every page is the same serialized page, so producing them costs
+    # nothing and only outputManager is timed.
+    page_size = 100
+    sample = SyntheticPages(operator.hubspot_object, page_size)
+    template = next(operator.serializeStage(operator.splitStage(
+        iter([{'number': 1,
+               'records': sample.records(page_size),
+               'cursor': None,
+               'next': None}]))))
+
+    def pages():
+        for number in range(1, records // page_size + 1):
+            yield {'number': number,
+                   'tables': template['tables'],
+                   'cursor': number * page_size,
+                   'next': {'offset': number * page_size}}
+
+    start = time.perf_counter()
+    operator.outputManager(context, pages())
+    return (records // page_size) * page_size, time.perf_counter() - start
+
+
+def bench_execute(operator, context, records):
+    operator_module.HubspotHook = FixtureHook
+    start = time.perf_counter()
+    operator.execute(context)
+    return records, time.perf_counter() - start
+
+
+def run_benchmark(benchmark, hubspot_object, records, trace=False):
+    """
+    Runs one benchmark in this process and returns its results.
+    """
+    FixtureHook.total_records = records
+    uploader_module.S3Hook = MemoryS3Hook
+    context = {'ti': BenchmarkInstance(),
+               'task': BenchmarkTask(),
+               'dag_run': None}
+
+    with tempfile.TemporaryDirectory() as state_dir:
+        operator = make_operator(hubspot_object, state_dir)
+        prepare(operator, context)
+        if trace:
+            tracemalloc.start()
+        count, elapsed = globals()['bench_' + benchmark](operator,
+                                                          context,
+                                                          records)
+        result = {'records': count,
+                  'seconds': elapsed,
+                  'records_per_second': count / elapsed if elapsed else 0,
+                  'peak_rss_mb': resource.getrusage(
+                      resource.RUSAGE_SELF).ru_maxrss / 1024,
+                  'bytes_written': sum(MemoryS3Hook.objects.values())}
+        if trace:
+            result['peak_allocated_mb'] = \
+                tracemalloc.get_traced_memory()[1] / 1024 ** 2
+            tracemalloc.stop()
+    return result
+
+
+def run_isolated(benchmark, hubspot_object, records, trace=False):
+    """
+    Runs one benchmark in a new process, so that peak RSS only covers
+    that benchmark.
+    """
+    command = [sys.executable, path.abspath(__file__),
+               '--run', benchmark, hubspot_object, str(records)]
+    if trace:
+        command.append('--trace')
+    # The child imports the plugin the same way this process did.
+    env = dict(os.environ,
+               PYTHONPATH=os.pathsep.join(e or os.getcwd() for e in sys.path))
+    output = subprocess.check_output(command, env=env)
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def compare(results, baseline, threshold):
+    """
+    Returns a description of every result that regressed against the
+    baseline by more than `threshold`.
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        if name not in baseline:
+            continue
+        base = baseline[name]
+        if result['records_per_second'] < \
+           base['records_per_second'] * (1 - threshold):
+            regressions.append('{0}: {1:,.0f} records/s, baseline {2:,.0f}'
+                               .format(name,
+                                       result['records_per_second'],
+                                       base['records_per_second']))
+        for metric in ('peak_rss_mb', 'peak_allocated_mb'):
+            if metric in result and metric in base and \
+               result[metric] > base[metric] * (1 + threshold):
+                regressions.append('{0}: {1} {2:,.1f}, baseline {3:,.1f}'
+                                   .format(name, metric,
+                                           result[metric], base[metric]))
+    return regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Operator benchmarks.')
+    parser.add_argument('--records',
+                        default=','.join(str(e) for e in DEFAULT_RECORDS))
+    parser.add_argument('--objects', default=','.join(DEFAULT_OBJECTS))
+    parser.add_argument('--benchmarks', default=','.join(BENCHMARKS))
+    parser.add_argument('--save')
+    parser.add_argument('--compare')
+    parser.add_argument('--threshold', type=float, default=0.1)
+    parser.add_argument('--no-allocations', action='store_true')
+    parser.add_argument('--run', nargs=3, help=argparse.SUPPRESS)
+    parser.add_argument('--trace', action='store_true',
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run:
+        benchmark, hubspot_object, records = args.run
+        print(json.dumps(run_benchmark(benchmark,
+                                       hubspot_object,
+                                       int(records),
+                                       args.trace)))
+        return 0
+
+    results = {}
+    print('{0:<32} {1:>14} {2:>9} {3:>10} {4:>10}'
+          .format('benchmark', 'records/s', 'seconds', 'rss MB', 'alloc MB'))
+    for records in [int(e) for e in args.records.split(',')]:
+        for hubspot_object in args.objects.split(','):
+            for benchmark in args.benchmarks.split(','):
+                name = '{0}:{1}:{2}'.format(benchmark, hubspot_object, records)
+                result = run_isolated(benchmark, hubspot_object, records)
+                if not args.no_allocations:
+                    result['peak_allocated_mb'] = run_isolated(
+                        benchmark, hubspot_object, records,
+                        trace=True)['peak_allocated_mb']
+                results[name] = result
+                print('{0:<32} {1:>14,.0f} {2:>9.3f} {3:>10.1f} {4:>10}'
+                      .format(name,
+                              result['records_per_second'],
+                              result['seconds'],
+                              result['peak_rss_mb'],
+                              '{0:.1f}'.format(result['peak_allocated_mb'])
+                              if 'peak_allocated_mb' in result else '-'))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'python': platform.python_version(),
+                       'platform': platform.platform(),
+                       'results': results}, f, indent=2, sort_keys=True)
+        print('Saved baseline to {0}.'.format(args.save))
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold)
+        for e in regressions:
+            print('REGRESSION ' + e)
+        if regressions:
+            return 1
+        print('No regressions against {0}.'.format(args.compare))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,200 @@
+"""
+Shared pytest fixtures
+
+The tests run HubspotHook and the operator against a local HubspotServer
+(see hubspot_server.py) and write S3 output to an in-memory bucket, so
+they need neither HubSpot nor S3.
+"""
+from HubspotPlugin.operators.tests.hubspot_server import HubspotServer
+from HubspotPlugin.operators.hubspot_to_s3_operator import \
+    HubspotToS3Operator
+import HubspotPlugin.utils.state_store as state_store_module
+import HubspotPlugin.utils.uploader as uploader_module
+from airflow.hooks.base_hook import BaseHook
+from airflow.models import Connection
+import datetime
+import itertools
+import json
+import pytest
+
+_conn_ids = itertools.count()
+
+
+class MemoryS3Hook(object):
+    """
+    Stands in for S3Hook, keeping every object written in `objects` and
+    the headers it was written with in `headers`.
+    """
+    objects = {}
+    headers = {}
+
+    def __init__(self, *args, **kwargs):
+        self.connection = self
+
+    def get_bucket(self, bucket_name):
+        return self
+
+    def close(self):
+        pass
+
+    def new_key(self, key):
+        return MemoryUpload(key)
+
+    def initiate_multipart_upload(self, key, headers=None):
+        return MemoryUpload(key, headers)
+
+    def delete_keys(self, keys):
+        for key in keys:
+            MemoryS3Hook.objects.pop(key, None)
+            MemoryS3Hook.headers.pop(key, None)
+
+    def get_key(self, key):
+        return MemoryUpload(key) if key in MemoryS3Hook.objects else None
+
+    def load_string(self, string_data, key, bucket_name=None, replace=False):
+        MemoryS3Hook.objects[key] = string_data.encode('utf-8')
+
+
+class MemoryUpload(object):
+
+    def __init__(self, key, headers=None):
+        self.key = key
+        self.headers = headers or {}
+        self.parts = {}
+
+    def set_contents_from_string(self, data, headers=None, replace=True):
+        MemoryS3Hook.objects[self.key] = bytes(data)
+        MemoryS3Hook.headers[self.key] = headers or {}
+
+    def get_contents_as_string(self):
+        return MemoryS3Hook.objects[self.key]
+
+    def upload_part_from_file(self, fp, part_num):
+        self.parts[part_num] = fp.read()
+
+    def complete_upload(self):
+        MemoryS3Hook.objects[self.key] = b''.join(self.parts[e] for e in
+                                                  sorted(self.parts))
+        MemoryS3Hook.headers[self.key] = self.headers
+
+    def cancel_upload(self):
+        pass
+
+
+class FakeTaskInstance(object):
+    dag_id = 'hubspot_tests'
+    task_id = 'hubspot_to_s3'
+    execution_date = datetime.datetime(2018, 1, 1)
+
+    def __init__(self):
+        self.xcom = {}
+
+    def xcom_push(self, key, value):
+        self.xcom[key] = value
+
+
+class FakeTask(object):
+
+    def get_flat_relatives(self, upstream=False):
+        return []
+
+
+@pytest.fixture
+def hubspot_server():
+    """
+    Returns a function that starts a HubspotServer with the given
+    arguments. Every server started is stopped after the test.
+    """
+    servers = []
+
+    def start(**kwargs):
+        server = HubspotServer(**kwargs).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+@pytest.fixture
+def hubspot_conn(monkeypatch):
+    """
+    Returns a function that registers a HubSpot connection to a server,
+    with the given connection extras, and returns its id. Retries back
+    off for a millisecond and the rate limit is high enough not to slow
+    the tests, unless the extras say otherwise.
+    """
+    connections = {}
+    monkeypatch.setattr(BaseHook,
+                        'get_connection',
+                        classmethod(lambda cls, conn_id:
+                                    connections[conn_id]))
+
+    def register(server, **extras):
+        # Rate limiters are shared by connection id for the whole
+        # process, so every connection gets its own.
+        conn_id = 'hubspot_test_{0}'.format(next(_conn_ids))
+        extras = dict({'hapikey': 'test',
+                       'rate_limit': 1000,
+                       'retry_backoff': 0.001},
+                      **extras)
+        connections[conn_id] = Connection(conn_id=conn_id,
+                                          conn_type='http',
+                                          host=server.url,
+                                          extra=json.dumps(extras))
+        return conn_id
+
+    return register
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    """
+    Replaces S3 with an in-memory bucket, returned as a dict of key to
+    the bytes written.
+    """
+    monkeypatch.setattr(uploader_module, 'S3Hook', MemoryS3Hook)
+    monkeypatch.setattr(state_store_module, 'S3Hook', MemoryS3Hook)
+    monkeypatch.setattr(MemoryS3Hook, 'objects', {})
+    monkeypatch.setattr(MemoryS3Hook, 'headers', {})
+    return MemoryS3Hook.objects
+
+
+@pytest.fixture
+def s3_headers(s3):
+    """
+    Returns the headers every object in the in-memory bucket was written
+    with, by key.
+    """
+    return MemoryS3Hook.headers
+
+
+@pytest.fixture
+def context():
+    return {'ti': FakeTaskInstance(),
+            'task': FakeTask(),
+            'dag_run': None}
+
+
+@pytest.fixture
+def make_operator(tmp_path):
+    """
+    Returns a function that builds a HubspotToS3Operator writing to the
+    'hubspot' bucket, with its state in a SQLite database shared by
+    every operator of the test.
+    """
+    state_store = 'sqlite:///' + str(tmp_path / 'state.db')
+
+    def make(conn_id, hubspot_object, **kwargs):
+        kwargs.setdefault('state_store', state_store)
+        kwargs.setdefault('s3_key', 'hubspot/{0}.json'.format(hubspot_object))
+        return HubspotToS3Operator(task_id=FakeTaskInstance.task_id,
+                                   hubspot_conn_id=conn_id,
+                                   hubspot_object=hubspot_object,
+                                   s3_conn_id='s3',
+                                   s3_bucket='hubspot',
+                                   **kwargs)
+
+    return make
+
@@ -0,0 +1,196 @@
+"""
+Synthetic HubSpot responses
+
+Builds pages of any size from the fixtures in responses/, for the
+benchmarks and the local HubSpot server. Records are repeated from the
+fixture response and every page carries the endpoint's own cursor
+fields, so the operator pages through them exactly as it would through
+HubSpot.
+"""
+from os import path
+import json
+
+RESPONSES = path.join(path.dirname(path.abspath(__file__)), 'responses')
+
+# The paged endpoints, their fixture, the key holding their records
+# (and the fixture's key for them, if different), their has more and
+# offset keys and the parameter setting the page size. Paged objects are
+# listed under their own name.
+PAGED_FIXTURES = {'contacts': {'endpoint': 'contacts/v1/lists/all/'
+                                           'contacts/all',
+                               'fixture': 'get_contacts.json',
+                               'records': 'contacts',
+                               'more': 'has-more',
+                               'offset': 'vid-offset',
+                               'page_size': 'count'},
+                  'companies': {'endpoint': 'companies/v2/companies/paged',
+                                'fixture': 'get_companies.json',
+                                'records': 'companies',
+                                'more': 'has-more',
+                                'offset': 'offset',
+                                'page_size': 'limit'},
+                  'deals': {'endpoint': 'deals/v1/deal/paged',
+                            'fixture': 'get_deals.json',
+                            'records': 'deals',
+                            'more': 'hasMore',
+                            'offset': 'offset',
+                            'page_size': 'limit'},
+                  'engagements': {'endpoint': 'engagements/v1/engagements/'
+                                              'paged',
+                                  'fixture': 'get_engagements.json',
+                                  'records': 'results',
+                                  'more': 'hasMore',
+                                  'offset': 'offset',
+                                  'page_size': 'limit'},
+                  'events': {'endpoint': 'email/public/v1/events',
+                             'fixture': 'get_email_events.json',
+                             'records': 'events',
+                             'more': 'hasMore',
+                             'offset': 'offset',
+                             'page_size': 'limit'},
+                  'timeline': {'endpoint': 'email/public/v1/subscriptions/'
+                                           'timeline',
+                               'fixture': 'get_subscription_changes.json',
+                               'records': 'timeline',
+                               'more': 'hasMore',
+                               'offset': 'offset',
+                               'page_size': 'limit'},
+                  'lists': {'endpoint': 'contacts/v1/lists',
+                            'fixture': 'get_contact_lists.json',
+                            'records': 'lists',
+                            'more': 'has-more',
+                            'offset': 'offset',
+                            'page_size': 'count'},
+                  'campaign_ids': {'endpoint': 'email/public/v1/campaigns',
+                                   'fixture': 'get_campaigns.json',
+                                   'records': 'campaigns',
+                                   'more': 'hasMore',
+                                   'offset': 'offset',
+                                   'page_size': 'limit'},
+                  'contacts_recent': {'endpoint': 'contacts/v1/lists/'
+                                                  'recently_updated/'
+                                                  'contacts/recent',
+                                      'fixture': 'get_contacts.json',
+                                      'records': 'contacts',
+                                      'more': 'has-more',
+                                      'offset': 'vid-offset',
+                                      'page_size': 'count'},
+                  'companies_recent': {'endpoint': 'companies/v2/companies/'
+                                                   'recent/modified',
+                                       'fixture': 'get_companies.json',
+                                       'records': 'results',
+                                       'fixture_records': 'companies',
+                                       'more': 'hasMore',
+                                       'offset': 'offset',
+                                       'page_size': 'count'},
+                  'deals_recent': {'endpoint': 'deals/v1/deal/recent/'
+                                               'modified',
+                                   'fixture': 'get_deals.json',
+                                   'records': 'results',
+                                   'fixture_records': 'deals',
+                                   'more': 'hasMore',
+                                   'offset': 'offset',
+                                   'page_size': 'count'},
+                  'engagements_recent': {'endpoint': 'engagements/v1/'
+                                                     'engagements/recent/'
+                                                     'modified',
+                                         'fixture': 'get_engagements.json',
+                                         'records': 'results',
+                                         'more': 'hasMore',
+                                         'offset': 'offset',
+                                         'page_size': 'count'}}
+
+DEFAULT_PAGE_SIZE = 100
+
+# The fixture holding each object's records, and the key holding them
+# (None if the fixture is the list of records, or a single record).
+OBJECT_FIXTURES = {'campaigns': ('get_campaign_data.json', None),
+                   'companies': ('get_companies.json', 'companies'),
+                   'contacts': ('get_contacts.json', 'contacts'),
+                   'contacts_by_company': ('get_contacts_by_company.json',
+                                           'vids'),
+                   'deals': ('get_deals.json', 'deals'),
+                   'engagements': ('get_engagements.json', 'results'),
+                   'events': ('get_email_events.json', 'events'),
+                   'forms': ('get_forms.json', None),
+                   'keywords': ('get_keywords.json', 'keywords'),
+                   'lists': ('get_contact_lists.json', 'lists'),
+                   'owners': ('get_owners.json', None),
+                   'timeline': ('get_subscription_changes.json', 'timeline'),
+                   'workflows': ('get_workflows.json', 'workflows')}
+
+
+def load_fixture(filename):
+    with open(path.join(RESPONSES, filename)) as f:
+        return json.load(f)
+
+
+def fixture_records(hubspot_object):
+    """
+    Returns the records of an object's fixture as the operator splits
+    them into tables, i.e. contacts_by_company's vids as one record per
+    vid of a single company.
+    """
+    filename, key = OBJECT_FIXTURES[hubspot_object]
+    records = load_fixture(filename)
+    if key:
+        records = records[key]
+    if isinstance(records, dict):
+        records = [records]
+    if hubspot_object == 'contacts_by_company':
+        records = [{'vid': vid, 'company_id': 1} for vid in records]
+    return records
+
+
+class SyntheticPages(object):
+    """
+    Serves `total_records` records of a paged object as pages of JSON.
+
+    Each page is built from the fixture's records, encoded once per
+    page size, so producing a page costs next to nothing compared to
+    parsing and processing it.
+
+    :param hubspot_object:  One of PAGED_FIXTURES.
+    :type hubspot_object:   string
+    :param total_records:   The number of records served in total.
+    :type total_records:    int
+    """
+
+    def __init__(self, hubspot_object, total_records):
+        self.mapping = PAGED_FIXTURES[hubspot_object]
+        self.total_records = int(total_records)
+        self.template = load_fixture(self.mapping['fixture'])[
+            self.mapping.get('fixture_records', self.mapping['records'])]
+        self._encoded = {}
+
+    def records(self, count):
+        """
+        Returns `count` records repeated from the fixture.
+        """
+        return [self.template[i % len(self.template)] for i in range(count)]
+
+    def page(self, offset=0, page_size=None):
+        """
+        Returns the JSON body (as bytes) of the page starting at record
+        `offset`.
+        """
+        offset = int(offset or 0)
+        page_size = int(page_size or DEFAULT_PAGE_SIZE)
+        count = max(min(page_size, self.total_records - offset), 0)
+        if count not in self._encoded:
+            self._encoded[count] = json.dumps(self.records(count))
+        next_offset = offset + count
+        return '{{"{0}":{1},"{2}":{3},"{4}":{5}}}'.format(
+            self.mapping['records'],
+            self._encoded[count],
+            self.mapping['more'],
+            'true' if next_offset < self.total_records else 'false',
+            self.mapping['offset'],
+            next_offset).encode('utf-8')
+
+    def respond(self, params):
+        """
+        Returns the page requested by a set of query parameters.
+        """
+        offset = params.get('vidOffset', params.get('offset'))
+        return self.page(offset, params.get(self.mapping['page_size']))
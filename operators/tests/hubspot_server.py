@@ -0,0 +1,363 @@
+"""
+Local HubSpot API stand-in
+
+Serves every endpoint the operator uses (see methodMapper) from the
+fixtures in responses/, so throughput and resilience can be tested
+against HubspotHook, AsyncHubspotHook or the whole operator without the
+live portal.
+
+    - Paged endpoints serve `records` synthetic records (see fixtures.py)
+      as multi-page hasMore / has-more and offset / vid-offset cursors.
+    - contacts_by_company serves `vids_per_company` vids per company,
+      paged with vidOffset.
+    - campaigns/{id}, the contact batch by vid endpoint and the unpaged
+      endpoints are served from their fixtures. Endpoints without a
+      fixture (deal pipelines and social) return an empty list.
+
+Faults can be injected into any request:
+
+    - latency:          Seconds added to every response, plus up to
+                        `latency_jitter` seconds at random.
+    - throttle_rate:    The fraction of requests answered with a 429
+                        and a Retry-After of `retry_after` seconds.
+    - error_rate:       The fraction of requests answered with a 502,
+                        503 or 504.
+    - rate_limit:       Requests per second served before answering
+                        with 429s, with X-HubSpot-RateLimit-Secondly
+                        headers on every response.
+    - fail_requests:    Answers given requests with a 404, which is not
+                        retried, by path pattern and request number
+                        (e.g. {r'companies/v2/companies/paged': [3]} fails
+                        the third request for a page of companies).
+
+Run it standalone and point a HubSpot connection's host at it:
+
+    python hubspot_server.py --port 8080 --records 100000 --latency 0.05 \\
+                             --throttle-rate 0.01 --error-rate 0.01
+
+or start it from a test:
+
+    with HubspotServer(records=1000, error_rate=0.1) as server:
+        ...  # connection host server.url
+        print(server.stats)
+"""
+from HubspotPlugin.operators.tests.fixtures import PAGED_FIXTURES, \
+    SyntheticPages, load_fixture
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from collections import Counter
+from urllib.parse import urlparse, parse_qs
+import argparse
+import copy
+import json
+import random
+import re
+import sys
+import threading
+import time
+
+CAMPAIGN_PATH = re.compile(r'^email/public/v1/campaigns/(\d+)$')
+COMPANY_VIDS_PATH = re.compile(r'^companies/v2/companies/(\d+)/vids$')
+CONTACT_BATCH_PATH = 'contacts/v1/contact/vids/batch'
+STATIC_FIXTURES = {'forms/v2/forms': 'get_forms.json',
+                   'keywords/v1/keywords': 'get_keywords.json',
+                   'owners/v2/owners': 'get_owners.json',
+                   'automation/v3/workflows': 'get_workflows.json'}
+EMPTY_PATHS = ('deals/v1/pipelines',
+               'broadcast/v1/channels/setting/publish/current')
+ERROR_STATUSES = (502, 503, 504)
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients closing keep-alive connections is expected.
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class HubspotServer(object):
+    """
+    A local HTTP server standing in for the HubSpot API. See the module
+    docstring for what it serves and the faults it can inject.
+
+    Every request is counted in `stats` by path and by status, and its
+    path and parsed query are appended to `queries`.
+
+    :param host:                The interface to listen on.
+    :type host:                 string
+    :param port:                The port to listen on. 0 picks a free one.
+    :type port:                 int
+    :param records:             Records served by every paged endpoint.
+    :type records:              int
+    :param vids_per_company:    Vids served for every company.
+    :type vids_per_company:     int
+    :param latency:             Seconds added to every response.
+    :type latency:              float
+    :param latency_jitter:      Up to this many more seconds, at random.
+    :type latency_jitter:       float
+    :param throttle_rate:       The fraction of requests answered with 429.
+    :type throttle_rate:        float
+    :param retry_after:         The Retry-After sent with injected 429s.
+    :type retry_after:          float
+    :param error_rate:          The fraction of requests answered with 5xx.
+    :type error_rate:           float
+    :param rate_limit:          Requests served per second before 429s.
+    :type rate_limit:           int
+    :param fail_requests:       The request numbers (counting from 1) to
+                                answer with a 404, by regular expression
+                                matching the whole path.
+    :type fail_requests:        dict
+    :param seed:                Seeds the random faults and jitter.
+    :type seed:                 int
+    """
+
+    def __init__(self,
+                 host='127.0.0.1',
+                 port=0,
+                 records=1000,
+                 vids_per_company=10,
+                 latency=0.0,
+                 latency_jitter=0.0,
+                 throttle_rate=0.0,
+                 retry_after=1,
+                 error_rate=0.0,
+                 rate_limit=None,
+                 fail_requests=None,
+                 seed=None):
+        self.records = records
+        self.vids_per_company = vids_per_company
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.fail_requests = [(re.compile(pattern), frozenset(numbers))
+                              for pattern, numbers
+                              in (fail_requests or {}).items()]
+        self.stats = Counter()
+        self.queries = []
+
+        self.pages = {mapping['endpoint']: SyntheticPages(name, records)
+                      for name, mapping in PAGED_FIXTURES.items()}
+        self.campaign = load_fixture('get_campaign_data.json')
+        self.contacts = list(load_fixture('get_contacts_by_vid.json')
+                             .values())
+        self.static = {endpoint: json.dumps(load_fixture(filename))
+                       .encode('utf-8')
+                       for endpoint, filename in STATIC_FIXTURES.items()}
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._window = None
+        self._window_count = 0
+        self._fail_counts = Counter()
+        self._thread = None
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body are written separately, which Nagle's
+            # algorithm would hold back for a delayed ACK on every
+            # keep-alive request.
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                status, headers, body = server.handle(url.path,
+                                                      parse_qs(url.query))
+                self.send_response(status)
+                headers['Content-Type'] = 'application/json;charset=utf-8'
+                headers['Content-Length'] = str(len(body))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return 'http://{0}:{1}'.format(host, port)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever,
+                                        name='hubspot-server',
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def handle(self, path, query):
+        """
+        Returns the status, headers and body of the response to a GET of
+        `path` with the parsed `query`.
+        """
+        path = path.strip('/')
+        params = {key: values[0] for key, values in query.items()}
+
+        with self._lock:
+            throttled = self._random.random() < self.throttle_rate
+            failed = self._random.random() < self.error_rate
+            delay = self.latency + self._random.uniform(0,
+                                                        self.latency_jitter)
+            error_status = self._random.choice(ERROR_STATUSES)
+            headers, limited = self._rate_limit()
+            not_found = self._injected_failure(path)
+        if delay:
+            time.sleep(delay)
+
+        if not_found:
+            status = 404
+            body = b'{"status":"error","message":"Injected failure."}'
+        elif limited or throttled:
+            status = 429
+            headers['Retry-After'] = '{0:g}'.format(self.retry_after)
+            body = json.dumps({'status': 'error',
+                               'message': 'You have reached your secondly '
+                                          'limit.',
+                               'errorType': 'RATE_LIMIT'}).encode('utf-8')
+        elif failed:
+            status = error_status
+            body = b'{"status":"error","message":"Injected error."}'
+        else:
+            status = 200
+            body = self.respond(path, params, query)
+            if body is None:
+                status = 404
+                body = b'{"status":"error","message":"Not found."}'
+
+        with self._lock:
+            self.stats['requests'] += 1
+            self.stats[status] += 1
+            self.stats[path] += 1
+            self.queries.append((path, query))
+        return status, headers, body
+
+    def respond(self, path, params, query):
+        """
+        Returns the JSON body served for `path`, or None if it is not a
+        HubSpot endpoint the operator uses.
+        """
+        if path in self.pages:
+            return self.pages[path].respond(params)
+        if path in self.static:
+            return self.static[path]
+        if path in EMPTY_PATHS:
+            return b'[]'
+
+        match = CAMPAIGN_PATH.match(path)
+        if match:
+            campaign = dict(self.campaign, id=int(match.group(1)))
+            return json.dumps(campaign).encode('utf-8')
+
+        match = COMPANY_VIDS_PATH.match(path)
+        if match:
+            offset = int(params.get('vidOffset') or 0)
+            count = max(min(int(params.get('count') or 100),
+                            self.vids_per_company - offset), 0)
+            base = int(match.group(1)) * self.vids_per_company
+            return json.dumps({'vids': [base + offset + i
+                                        for i in range(count)],
+                               'vidOffset': offset + count,
+                               'hasMore': offset + count <
+                               self.vids_per_company}).encode('utf-8')
+
+        if path == CONTACT_BATCH_PATH:
+            contacts = {}
+            for i, vid in enumerate(query.get('vid', [])):
+                contact = copy.deepcopy(self.contacts[i % len(self.contacts)])
+                contact['vid'] = contact['canonical-vid'] = int(vid)
+                contacts[vid] = contact
+            return json.dumps(contacts).encode('utf-8')
+        return None
+
+    def _injected_failure(self, path):
+        """
+        Counts a request against fail_requests. Returns whether it must
+        fail. Must be called with the lock held.
+        """
+        failed = False
+        for pattern, numbers in self.fail_requests:
+            if pattern.fullmatch(path):
+                self._fail_counts[pattern.pattern] += 1
+                if self._fail_counts[pattern.pattern] in numbers:
+                    failed = True
+        return failed
+
+    def _rate_limit(self):
+        """
+        Counts a request against the per second rate limit. Returns the
+        rate limit headers and whether the request is over the limit.
+        Must be called with the lock held.
+        """
+        if not self.rate_limit:
+            return {}, False
+        window = int(time.monotonic())
+        if window != self._window:
+            self._window = window
+            self._window_count = 0
+        self._window_count += 1
+        remaining = max(self.rate_limit - self._window_count, 0)
+        headers = {'X-HubSpot-RateLimit-Secondly': str(self.rate_limit),
+                   'X-HubSpot-RateLimit-Secondly-Remaining': str(remaining)}
+        return headers, self._window_count > self.rate_limit
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local HubSpot API '
+                                                 'stand-in.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--records', type=int, default=1000)
+    parser.add_argument('--vids-per-company', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--latency-jitter', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--retry-after', type=float, default=1)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit', type=int)
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    server = HubspotServer(host=args.host,
+                           port=args.port,
+                           records=args.records,
+                           vids_per_company=args.vids_per_company,
+                           latency=args.latency,
+                           latency_jitter=args.latency_jitter,
+                           throttle_rate=args.throttle_rate,
+                           retry_after=args.retry_after,
+                           error_rate=args.error_rate,
+                           rate_limit=args.rate_limit,
+                           seed=args.seed)
+    print('Serving HubSpot on {0}'.format(server.url))
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        print(dict(server.stats))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+"""
+The aiohttp fetch path (AsyncHubspotHook, async_ordered_fan_out,
+iterate_async and the operator's fanOutAsync) against a local
+HubspotServer.
+"""
+from HubspotPlugin.operators.tests.test_checkpoint_resume import table_rows
+from HubspotPlugin.utils.fanout import async_ordered_fan_out, iterate_async
+from HubspotPlugin.utils.metrics import Metrics
+from airflow.exceptions import AirflowException
+import asyncio
+import time
+import pytest
+
+pytest.importorskip('aiohttp')
+from HubspotPlugin.hooks.async_hubspot_hook import \
+    AsyncHubspotHook  # noqa: E402
+
+COMPANIES = 'companies/v2/companies/paged'
+
+
+async def aiter_items(items):
+    for item in items:
+        yield item
+
+
+def fetch_pages(hook, offsets, concurrency):
+    """
+    Fetches a page of companies for every offset, `concurrency` at a time,
+    and returns them in the order of `offsets`.
+    """
+    async def fetch_all():
+        try:
+            return [page async for page in async_ordered_fan_out(
+                lambda offset: hook.run(COMPANIES, {'offset': offset}),
+                aiter_items(offsets),
+                concurrency)]
+        finally:
+            await hook.close()
+    return asyncio.run(fetch_all())
+
+
+def test_yields_in_order(hubspot_server, hubspot_conn):
+    # Later requests often finish first.
+    server = hubspot_server(records=1000, latency=0.001,
+                            latency_jitter=0.02, seed=5)
+    hook = AsyncHubspotHook(hubspot_conn(server), concurrency=8)
+    offsets = [i % 10 * 100 for i in range(40)]
+
+    pages = fetch_pages(hook, offsets, 8)
+
+    assert [e['offset'] for e in pages] == [e + 100 for e in offsets]
+    assert server.stats[200] == 40
+
+
+@pytest.mark.parametrize('faults,statuses', [
+    ({'throttle_rate': 0.3, 'retry_after': 0}, (429,)),
+    ({'error_rate': 0.3}, (502, 503, 504))])
+def test_retries(hubspot_server, hubspot_conn, faults, statuses):
+    server = hubspot_server(records=1000, seed=6, **faults)
+    hook = AsyncHubspotHook(hubspot_conn(server, max_retries=20),
+                            concurrency=8)
+
+    pages = fetch_pages(hook, [i % 10 * 100 for i in range(40)], 8)
+
+    assert len(pages) == 40 and all(e['companies'] for e in pages)
+    retried = sum(server.stats[e] for e in statuses)
+    assert retried > 0
+    metrics = hook.retry_policy.metrics()
+    assert metrics['retries'] == retried
+    assert set(metrics['retries_by_reason']) <= {str(e) for e in statuses}
+
+
+def test_raises_once_retries_are_exhausted(hubspot_server, hubspot_conn):
+    server = hubspot_server(error_rate=1.0)
+    hook = AsyncHubspotHook(hubspot_conn(server, max_retries=2))
+
+    with pytest.raises(AirflowException):
+        fetch_pages(hook, [0], 1)
+
+    assert server.stats['requests'] == 3
+    assert hook.retry_policy.metrics()['retries_exhausted'] == 1
+    assert hook.session is None
+
+
+def test_does_not_retry_client_errors(hubspot_server, hubspot_conn):
+    server = hubspot_server(fail_requests={COMPANIES: [1]})
+    hook = AsyncHubspotHook(hubspot_conn(server))
+
+    with pytest.raises(AirflowException):
+        fetch_pages(hook, [0], 1)
+
+    assert server.stats[404] == 1
+    assert hook.retry_policy.metrics()['retries'] == 0
+
+
+def test_cancels_fetches_when_the_consumer_stops(hubspot_server,
+                                                hubspot_conn):
+    server = hubspot_server(records=1000)
+    hook = AsyncHubspotHook(hubspot_conn(server), concurrency=4)
+    cancelled = []
+
+    async def fetch(offset):
+        try:
+            page = await hook.run(COMPANIES, {'offset': offset})
+            if offset:
+                # Every page but the first takes far longer to process.
+                await asyncio.sleep(10)
+            return page
+        except asyncio.CancelledError:
+            cancelled.append(offset)
+            raise
+
+    async def first_page():
+        fan_out = async_ordered_fan_out(fetch,
+                                        aiter_items(range(0, 1000, 100)),
+                                        4)
+        try:
+            page = await fan_out.__anext__()
+        finally:
+            await fan_out.aclose()
+            await hook.close()
+        # Cancelled by the fan-out, rather than by asyncio.run on exit.
+        return page, sorted(cancelled)
+
+    start = time.monotonic()
+    page, cancelled_on_close = asyncio.run(first_page())
+
+    assert page['offset'] == 100
+    assert cancelled_on_close == [100, 200, 300]
+    assert time.monotonic() - start < 5
+    assert server.stats['requests'] == 4
+
+
+def test_cleans_up_when_the_consumer_stops(hubspot_server, hubspot_conn,
+                                           make_operator, context):
+    server = hubspot_server(records=100, vids_per_company=10,
+                            latency_jitter=0.01, seed=7)
+    operator = make_operator(hubspot_conn(server), 'contacts_by_company',
+                             async_fetch=True, fetch_concurrency=8)
+    operator.metrics = Metrics()
+    operator.async_retry_policies = []
+
+    fan_out = operator.fanOutAsync(context)
+    pages = iterate_async(fan_out)
+    received = [next(pages) for _ in range(3)]
+    pages.close()
+
+    # The fan-out's in-flight fetches are cancelled and its hook closed.
+    assert len(operator.async_retry_policies) == 1
+    assert fan_out.ag_frame is None
+    # Requests cancelled in flight may still be counted by the server,
+    # but no new ones are sent.
+    time.sleep(0.1)
+    requests = server.stats['requests']
+    time.sleep(0.2)
+    assert server.stats['requests'] == requests < 100
+    # The company ids are served in the fixture's order.
+    company_ids = [e[0]['company_id'] for e in received]
+    assert company_ids[0] != company_ids[1] and \
+        company_ids[0] == company_ids[2]
+
+
+def test_matches_the_threaded_fan_out(hubspot_server, hubspot_conn,
+                                      make_operator, s3, context):
+    server = hubspot_server(records=50, vids_per_company=250,
+                            latency_jitter=0.01, throttle_rate=0.1,
+                            retry_after=0, seed=8)
+    conn_id = hubspot_conn(server, max_retries=20)
+
+    make_operator(conn_id, 'contacts_by_company',
+                  flush_records=1000).execute(context)
+    threaded = table_rows(s3)
+    s3.clear()
+    make_operator(conn_id, 'contacts_by_company', flush_records=1000,
+                  async_fetch=True, fetch_concurrency=8).execute(context)
+
+    assert len(threaded) == 50 * 250
+    assert table_rows(s3) == threaded
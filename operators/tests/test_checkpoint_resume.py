@@ -0,0 +1,214 @@
+"""
+Checkpoint and resume of HubspotToS3Operator runs that fail part way,
+against a local HubspotServer.
+"""
+import HubspotPlugin.operators.hubspot_to_s3_operator as operator_module
+from HubspotPlugin.operators.tests.conftest import FakeTaskInstance
+from HubspotPlugin.utils.state_store import get_state_store
+from airflow.exceptions import AirflowException
+import datetime
+import json
+import pytest
+
+COMPANIES = r'companies/v2/companies/paged'
+RECENT_COMPANIES = r'companies/v2/companies/recent/modified'
+COMPANY_VIDS = r'companies/v2/companies/\d+/vids'
+
+
+def table_rows(objects, table='core'):
+    """
+    Returns the rows of every NDJSON part file of `table` in `objects`.
+    """
+    rows = []
+    for key, data in sorted(objects.items()):
+        if '_{0}_'.format(table) in key and data:
+            rows.extend(json.loads(line) for line in data.split(b'\n'))
+    return rows
+
+
+def sort_rows(rows):
+    return sorted(rows, key=lambda row: json.dumps(row, sort_keys=True))
+
+
+def run_until_it_fails(operator, context):
+    with pytest.raises(AirflowException):
+        operator.execute(context)
+
+
+def test_resumes_paged_objects(hubspot_server, hubspot_conn, make_operator,
+                               s3, context):
+    # 10 pages of 100 companies, flushed every other page. The sixth
+    # page fails, after the flushes of pages 2 and 4.
+    server = hubspot_server(records=1000, fail_requests={COMPANIES: [6]})
+    conn_id = hubspot_conn(server)
+
+    failed = make_operator(conn_id, 'companies', flush_records=200)
+    run_until_it_fails(failed, context)
+    assert failed.state.get(failed.checkpointName(context))['page'] in (2, 4)
+    operator = make_operator(conn_id, 'companies', flush_records=200)
+    operator.execute(context)
+
+    assert len(table_rows(s3)) == 1000
+    # The retry picked up after the last checkpoint rather than from the
+    # first page.
+    assert server.stats[COMPANIES] < 6 + 10
+    assert operator.state.get(operator.checkpointName(context)) is None
+    assert operator.state.get(operator.pendingKeysName(context)) is None
+
+
+def test_resumes_fan_outs(hubspot_server, hubspot_conn, make_operator,
+                          s3, context, tmp_path):
+    # 50 companies of 10 vids each, fetched one company at a time and
+    # flushed every 10 companies. The 25th company fails.
+    server = hubspot_server(records=50,
+                            vids_per_company=10,
+                            fail_requests={COMPANY_VIDS: [25]})
+    conn_id = hubspot_conn(server)
+    options = {'flush_records': 100, 'fetch_concurrency': 1}
+
+    failed = make_operator(conn_id, 'contacts_by_company', **options)
+    run_until_it_fails(failed, context)
+    assert failed.state.get(failed.checkpointName(context))['page'] in (10, 20)
+    make_operator(conn_id, 'contacts_by_company', **options).execute(context)
+
+    rows = table_rows(s3)
+    # Only the companies after the checkpoint are fetched again.
+    assert sum(count for path, count in server.stats.items()
+               if isinstance(path, str) and path.endswith('/vids')) < 25 + 50
+
+    # The output matches a run that never failed.
+    s3.clear()
+    make_operator(hubspot_conn(hubspot_server(records=50,
+                                              vids_per_company=10)),
+                  'contacts_by_company',
+                  state_store='sqlite:///' + str(tmp_path / 'clean.db'),
+                  **options).execute(context)
+    assert len(rows) == 500
+    assert sort_rows(rows) == sort_rows(table_rows(s3))
+
+
+def test_deletes_part_files_left_by_a_failed_attempt(hubspot_server,
+                                                     hubspot_conn,
+                                                     make_operator,
+                                                     s3, context):
+    server = hubspot_server(records=1000, fail_requests={COMPANIES: [6]})
+    conn_id = hubspot_conn(server)
+
+    # Uploads run synchronously, so both flushes are checkpointed.
+    operator = make_operator(conn_id, 'companies', flush_records=200,
+                             upload_workers=0)
+    run_until_it_fails(operator, context)
+    assert operator.state.get(operator.checkpointName(context))['page'] == 4
+    # Stand in for a flush whose upload finished after the failure, but
+    # was never checkpointed. The retry flushes at different pages.
+    orphan = 'hubspot/companies_core_5.json'
+    s3[orphan] = s3['hubspot/companies_core_4.json']
+    pending_name = operator.pendingKeysName(context)
+    operator.state.set(pending_name,
+                       operator.state.get(pending_name, []) + [orphan])
+    operator.state.flush()
+
+    make_operator(conn_id, 'companies', flush_records=300).execute(context)
+
+    assert orphan not in s3
+    assert len(table_rows(s3)) == 1000
+
+
+def test_keeps_the_part_files_of_other_runs(hubspot_server, hubspot_conn,
+                                            make_operator, s3, context):
+    server = hubspot_server(records=1000, fail_requests={COMPANIES: [6]})
+    conn_id = hubspot_conn(server)
+
+    failed = make_operator(conn_id, 'companies', flush_records=200,
+                           upload_workers=0)
+    run_until_it_fails(failed, context)
+    # Stand in for a flush of the first run still being uploaded when
+    # another run of the task starts.
+    uploading = 'hubspot/companies_core_6.json'
+    s3[uploading] = s3['hubspot/companies_core_4.json']
+    pending_name = failed.pendingKeysName(context)
+    failed.state.set(pending_name,
+                     failed.state.get(pending_name, []) + [uploading])
+    failed.state.flush()
+
+    other_context = dict(context, ti=FakeTaskInstance())
+    other_context['ti'].execution_date = datetime.datetime(2018, 1, 2)
+    other = make_operator(conn_id, 'companies', flush_records=200,
+                          s3_key='hubspot/2018-01-02/companies.json')
+    other.execute(other_context)
+
+    assert uploading in s3
+    assert other.state.get(pending_name) == \
+        failed.state.get(pending_name)
+    assert len(table_rows({key: data for key, data in s3.items()
+                           if key.startswith('hubspot/2018-01-02/')})) \
+        == 1000
+
+    # The first run's own retry still cleans up after it.
+    make_operator(conn_id, 'companies', flush_records=300).execute(context)
+    assert uploading not in s3
+    assert len(table_rows({key: data for key, data in s3.items()
+                           if not key.startswith('hubspot/2018-01-02/')})) \
+        == 1000
+
+
+def run_ahead(items, depth=1):
+    """
+    Stands in for prefetch, fetching every page (up to a failure) before
+    the first one is written, as far ahead as prefetching and background
+    uploads could ever let the fetching get.
+    """
+    fetched = []
+    error = None
+    try:
+        for item in items:
+            fetched.append(item)
+    except Exception as e:
+        error = e
+    yield from fetched
+    if error is not None:
+        raise error
+
+
+def test_resumes_the_full_pull_after_the_recent_cap(hubspot_server,
+                                                    hubspot_conn,
+                                                    make_operator,
+                                                    s3, context, tmp_path,
+                                                    monkeypatch):
+    # The recently modified endpoint caps out at 10 pages, before
+    # reaching the watermark, so every company is pulled instead. The
+    # first page of the full pull fails after the last recent page was
+    # fetched but before it was written.
+    monkeypatch.setattr(operator_module, 'RECENT_MAX_RECORDS', 1000)
+    monkeypatch.setattr(operator_module, 'prefetch', run_ahead)
+    server = hubspot_server(records=1050, fail_requests={COMPANIES: [1]})
+    conn_id = hubspot_conn(server)
+    state_store = 'sqlite:///' + str(tmp_path / 'state.db')
+    state = get_state_store(state_store,
+                            'INCREMENTAL_KEY__{0}_{1}'
+                            .format(context['ti'].dag_id,
+                                    context['ti'].task_id))
+    watermark = int(operator_module.time.time() * 1000) - 60 * 1000
+    state.set('lastmodifieddate', watermark)
+    state.flush()
+    options = {'incremental': True,
+               'flush_records': 100,
+               'upload_workers': 0,
+               'state_store': state_store}
+
+    failed = make_operator(conn_id, 'companies', **options)
+    run_until_it_fails(failed, context)
+    checkpoint = failed.state.get(failed.checkpointName(context))
+    assert checkpoint['page'] == 10
+    assert checkpoint['full_pull'] is False
+    assert checkpoint['watermark'] == watermark
+
+    operator = make_operator(conn_id, 'companies', **options)
+    operator.execute(context)
+
+    # The 1000 recently modified companies, then all 1050 companies.
+    assert len(table_rows(s3)) == 1000 + 1050
+    # The retry goes straight on to the full pull.
+    assert server.stats[RECENT_COMPANIES] == 10
+    assert operator.state.get(operator.checkpointName(context)) is None
+    assert operator.state.get('lastmodifieddate') > watermark
@@ -0,0 +1,42 @@
+"""
+Compressed NDJSON output, against a local HubspotServer.
+"""
+import gzip
+import pytest
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def decompress(compression, data):
+    if compression == 'gzip':
+        return gzip.decompress(data)
+    return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+
+
+@pytest.mark.parametrize('compression,extension', [('gzip', '.gz'),
+                                                   ('zstd', '.zst')])
+def test_compresses_part_files(hubspot_server, hubspot_conn, make_operator,
+                               s3, s3_headers, context, compression,
+                               extension):
+    if compression == 'zstd' and zstandard is None:
+        pytest.skip('zstandard is not installed.')
+    conn_id = hubspot_conn(hubspot_server(records=1000))
+
+    make_operator(conn_id, 'companies', flush_records=300).execute(context)
+    uncompressed = dict(s3)
+    s3.clear()
+    make_operator(conn_id, 'companies',
+                  flush_records=300,
+                  compression=compression,
+                  compression_level=1).execute(context)
+
+    assert sorted(s3) == sorted(key + extension for key in uncompressed)
+    for key, data in s3.items():
+        assert decompress(compression, data) == \
+            uncompressed[key[:-len(extension)]]
+        assert s3_headers[key] == {'Content-Encoding': compression}
+    assert sum(len(e) for e in s3.values()) < \
+        sum(len(e) for e in uncompressed.values()) / 2
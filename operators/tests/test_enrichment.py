@@ -0,0 +1,65 @@
+"""
+Enriching contacts_by_company with full contact records, against a local
+HubspotServer.
+"""
+from HubspotPlugin.operators.tests.test_checkpoint_resume import \
+    run_until_it_fails, table_rows
+
+BATCH = 'contacts/v1/contact/vids/batch'
+
+
+def batch_sizes(server):
+    return [len(query['vid']) for path, query in server.queries
+            if path == BATCH]
+
+
+def test_reads_every_contact_once(hubspot_server, hubspot_conn,
+                                  make_operator, s3, context):
+    # 30 companies (of two distinct ids) of 100 vids each.
+    server = hubspot_server(records=30, vids_per_company=100)
+
+    make_operator(hubspot_conn(server), 'contacts_by_company',
+                  enrich_contacts=True,
+                  flush_records=500).execute(context)
+
+    core = table_rows(s3)
+    contacts = table_rows(s3, 'contacts')
+    assert len(core) == 3000
+    assert sorted(e['vid'] for e in contacts) == \
+        sorted({e['vid'] for e in core})
+    assert batch_sizes(server) == [100, 100]
+
+
+def test_resumes_enrichment(hubspot_server, hubspot_conn, make_operator, s3,
+                            context):
+    server = hubspot_server(records=30, vids_per_company=100,
+                            fail_requests={BATCH: [2]})
+    conn_id = hubspot_conn(server)
+    options = {'enrich_contacts': True, 'flush_records': 500}
+
+    run_until_it_fails(make_operator(conn_id, 'contacts_by_company',
+                                     **options),
+                       context)
+    make_operator(conn_id, 'contacts_by_company', **options).execute(context)
+
+    core = table_rows(s3)
+    assert len(core) == 3000
+    # Every contact of a checkpointed page was written before the
+    # checkpoint, so none is lost to the retry.
+    assert {e['vid'] for e in table_rows(s3, 'contacts')} == \
+        {e['vid'] for e in core}
+
+
+def test_lean_batches(hubspot_server, hubspot_conn, make_operator, s3,
+                      context):
+    server = hubspot_server(records=2, vids_per_company=10)
+
+    make_operator(hubspot_conn(server), 'contacts_by_company',
+                  enrich_contacts=True,
+                  payload_mode='lean').execute(context)
+
+    queries = [query for path, query in server.queries if path == BATCH]
+    assert len(queries) == 1
+    assert queries[0]['property']
+    assert queries[0]['propertyMode'] == ['value_only']
+    assert len(table_rows(s3, 'contacts')) == 20
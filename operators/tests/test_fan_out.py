@@ -0,0 +1,24 @@
+"""
+contacts_by_company, which pages through the companies and fetches each
+company's contact vids, against a local HubspotServer.
+"""
+import pytest
+
+COMPANIES = 'companies/v2/companies/paged'
+
+
+@pytest.mark.parametrize('async_fetch', [False, True])
+def test_pages_companies_with_hubspot_args(hubspot_server, hubspot_conn,
+                                           make_operator, s3, context,
+                                           async_fetch):
+    server = hubspot_server(records=100, vids_per_company=1)
+    conn_id = hubspot_conn(server)
+
+    make_operator(conn_id, 'contacts_by_company',
+                  hubspot_args={'limit': 20},
+                  async_fetch=async_fetch).execute(context)
+
+    # 20 companies a page rather than the default 250.
+    assert server.stats[COMPANIES] == 5
+    assert sum(count for path, count in server.stats.items()
+               if isinstance(path, str) and path.endswith('/vids')) == 100
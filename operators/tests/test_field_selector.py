@@ -0,0 +1,44 @@
+"""
+compileFieldSelector against flattening every field and then keeping the
+schema's columns, on the records of every response fixture.
+"""
+from HubspotPlugin.operators.tests.fixtures import OBJECT_FIXTURES, \
+    fixture_records
+from HubspotPlugin.operators.hubspot_to_s3_operator import \
+    HubspotToS3Operator, COLUMN_ALIASES, compileFieldSelector
+from HubspotPlugin.schemas import hubspot_schema
+from flatten_json import flatten
+import boa
+import pytest
+
+
+def flatten_then_filter(schema_name, record):
+    columns = set(column['name']
+                  for column in getattr(hubspot_schema, schema_name))
+    aliases = COLUMN_ALIASES.get(schema_name, {})
+    flattened = {boa.constrict(k): v for k, v in flatten(record).items()}
+    return {aliases.get(k, k): v for k, v in flattened.items()
+            if aliases.get(k, k) in columns}
+
+
+@pytest.mark.parametrize('hubspot_object', sorted(OBJECT_FIXTURES))
+def test_selector_matches_flatten_then_filter(hubspot_object):
+    operator = HubspotToS3Operator(task_id='field_selector',
+                                   hubspot_conn_id='hubspot',
+                                   hubspot_object=hubspot_object,
+                                   s3_conn_id='s3',
+                                   s3_bucket='hubspot',
+                                   s3_key='hubspot/output.json')
+    tables = {}
+    for e in operator.subTableMapper(fixture_records(hubspot_object)):
+        tables.update(e)
+
+    selected = 0
+    for table, records in tables.items():
+        schema_name = operator.tableSchemaName(table)
+        select = compileFieldSelector(schema_name)
+        for record in records:
+            expected = flatten_then_filter(schema_name, record)
+            assert select(record) == expected
+            selected += len(expected)
+    assert selected
@@ -0,0 +1,149 @@
+"""
+HubspotHook retries against a local HubspotServer.
+"""
+from HubspotPlugin.hooks.hubspot_hook import HubspotHook
+import HubspotPlugin.hooks.hubspot_hook as hook_module
+from airflow.exceptions import AirflowException
+import pytest
+
+COMPANIES = 'companies/v2/companies/paged'
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """
+    Records the hook's backoff waits instead of sleeping through them.
+    """
+    waits = []
+    monkeypatch.setattr(hook_module.time, 'sleep', waits.append)
+    return waits
+
+
+def run_requests(hook, count):
+    try:
+        return [hook.run(COMPANIES, {'offset': i % 10 * 100}).json()
+                for i in range(count)]
+    finally:
+        hook.close()
+
+
+def test_retries_throttled_requests(hubspot_server, hubspot_conn):
+    server = hubspot_server(throttle_rate=0.3, retry_after=0, seed=1)
+    hook = HubspotHook(hubspot_conn(server))
+
+    responses = run_requests(hook, 30)
+
+    assert all(e['companies'] for e in responses)
+    metrics = hook.retry_policy.metrics()
+    assert server.stats[429] > 0
+    assert metrics['retries_by_reason'] == {'429': server.stats[429]}
+    assert server.stats[200] == 30
+
+
+def test_retries_server_errors(hubspot_server, hubspot_conn):
+    server = hubspot_server(error_rate=0.3, seed=2)
+    hook = HubspotHook(hubspot_conn(server))
+
+    responses = run_requests(hook, 30)
+
+    assert all(e['companies'] for e in responses)
+    metrics = hook.retry_policy.metrics()
+    errors = sum(server.stats[e] for e in (502, 503, 504))
+    assert errors > 0
+    assert metrics['retries'] == errors
+    assert set(metrics['retries_by_reason']) <= {'502', '503', '504'}
+
+
+def test_honours_retry_after(hubspot_server, hubspot_conn, sleeps):
+    server = hubspot_server(throttle_rate=1.0, retry_after=7)
+    hook = HubspotHook(hubspot_conn(server, max_retries=2))
+
+    with pytest.raises(AirflowException):
+        run_requests(hook, 1)
+
+    # Retry-After is honoured in full, even past retry_max_backoff.
+    assert sleeps == [7, 7]
+    assert server.stats[429] == 3
+    assert hook.retry_policy.metrics()['retries_exhausted'] == 1
+
+
+def test_backs_off_exponentially(hubspot_server, hubspot_conn, sleeps):
+    server = hubspot_server(error_rate=1.0)
+    hook = HubspotHook(hubspot_conn(server,
+                                    max_retries=4,
+                                    retry_backoff=1,
+                                    retry_max_backoff=5))
+
+    with pytest.raises(AirflowException):
+        run_requests(hook, 1)
+
+    assert len(sleeps) == 4
+    for attempt, wait in enumerate(sleeps):
+        assert 0 <= wait <= min(5, 2 ** attempt)
+
+
+def test_stops_when_the_retry_budget_is_spent(hubspot_server, hubspot_conn,
+                                              sleeps):
+    server = hubspot_server(error_rate=1.0)
+    hook = HubspotHook(hubspot_conn(server,
+                                    max_retries=5,
+                                    retry_budget=3,
+                                    retry_ratio=0))
+
+    with pytest.raises(AirflowException):
+        run_requests(hook, 1)
+    assert server.stats['requests'] == 4
+
+    # With the budget spent and nothing refilling it, the next request
+    # fails without a retry.
+    hook = HubspotHook(hook.http_conn_id)
+    hook.get_conn()
+    hook.retry_policy.tokens = 0
+    with pytest.raises(AirflowException):
+        run_requests(hook, 1)
+    assert server.stats['requests'] == 5
+    metrics = hook.retry_policy.metrics()
+    assert metrics['retries'] == 0
+    assert metrics['retries_exhausted'] == 1
+
+
+def test_refills_the_retry_budget(hubspot_server, hubspot_conn, sleeps):
+    server = hubspot_server(throttle_rate=0.5, retry_after=0, seed=3)
+    hook = HubspotHook(hubspot_conn(server,
+                                    max_retries=20,
+                                    retry_budget=2,
+                                    retry_ratio=1))
+
+    responses = run_requests(hook, 20)
+
+    # Far more retries than the budget holds, as every request refills it.
+    assert len(responses) == 20
+    assert hook.retry_policy.metrics()['retries'] > 2
+
+
+def test_does_not_retry_client_errors(hubspot_server, hubspot_conn):
+    server = hubspot_server()
+    hook = HubspotHook(hubspot_conn(server))
+
+    with pytest.raises(AirflowException):
+        try:
+            hook.run('not/a/hubspot/endpoint')
+        finally:
+            hook.close()
+
+    assert server.stats[404] == 1
+    assert hook.retry_policy.metrics()['retries'] == 0
+
+
+def test_retries_without_check_response(hubspot_server, hubspot_conn):
+    server = hubspot_server(throttle_rate=1.0, retry_after=0)
+    hook = HubspotHook(hubspot_conn(server, max_retries=1))
+
+    try:
+        response = hook.run(COMPANIES,
+                            extra_options={'check_response': False})
+    finally:
+        hook.close()
+
+    assert response.status_code == 429
+    assert server.stats[429] == 2
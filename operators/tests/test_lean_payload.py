@@ -0,0 +1,87 @@
+"""
+Lean payload mode's query parameters, against a local HubspotServer.
+"""
+from HubspotPlugin.operators.hubspot_to_s3_operator import schemaProperties
+import pytest
+
+ENDPOINTS = {'contacts': 'contacts/v1/lists/all/contacts/all',
+             'companies': 'companies/v2/companies/paged',
+             'deals': 'deals/v1/deal/paged'}
+
+
+def page_queries(server, hubspot_object):
+    return [query for path, query in server.queries
+            if path == ENDPOINTS[hubspot_object]]
+
+
+@pytest.mark.parametrize('hubspot_object,property_param', [
+    ('contacts', 'property'),
+    ('companies', 'properties'),
+    ('deals', 'properties')])
+def test_requests_only_loaded_properties(hubspot_server, hubspot_conn,
+                                         make_operator, s3, context,
+                                         hubspot_object, property_param):
+    server = hubspot_server(records=300)
+    conn_id = hubspot_conn(server)
+
+    make_operator(conn_id, hubspot_object,
+                  payload_mode='lean').execute(context)
+
+    names, values_only = schemaProperties(hubspot_object)
+    queries = page_queries(server, hubspot_object)
+    assert len(queries) > 1
+    for query in queries:
+        assert query[property_param] == list(names)
+    if hubspot_object == 'contacts':
+        assert values_only
+        assert all(query['propertyMode'] == ['value_only'] and
+                   query['showListMemberships'] == ['false']
+                   for query in queries)
+    if hubspot_object == 'deals':
+        assert all(query['includeAssociations'] == ['true']
+                   for query in queries)
+
+
+def test_requests_everything_by_default(hubspot_server, hubspot_conn,
+                                        make_operator, s3, context):
+    server = hubspot_server(records=300)
+    conn_id = hubspot_conn(server)
+
+    make_operator(conn_id, 'contacts').execute(context)
+
+    for query in page_queries(server, 'contacts'):
+        assert not {'property', 'propertyMode', 'showListMemberships'} & \
+            set(query)
+
+
+def test_hubspot_args_take_precedence(hubspot_server, hubspot_conn,
+                                      make_operator, s3, context):
+    server = hubspot_server(records=300)
+    conn_id = hubspot_conn(server)
+
+    make_operator(conn_id, 'contacts',
+                  payload_mode='lean',
+                  hubspot_args={'showListMemberships': 'true',
+                                'property': ['email']}).execute(context)
+
+    for query in page_queries(server, 'contacts'):
+        assert query['showListMemberships'] == ['true']
+        assert query['property'] == ['email']
+        assert query['propertyMode'] == ['value_only']
+
+
+def test_requests_the_last_modified_date_incrementally(hubspot_server,
+                                                       hubspot_conn,
+                                                       make_operator, s3,
+                                                       context):
+    server = hubspot_server(records=300)
+    conn_id = hubspot_conn(server)
+
+    make_operator(conn_id, 'companies', payload_mode='lean',
+                  incremental=True).execute(context)
+
+    names, _ = schemaProperties('companies')
+    queries = page_queries(server, 'companies')
+    assert queries
+    for query in queries:
+        assert set(query['properties']) == set(names) | {'hs_lastmodifieddate'}
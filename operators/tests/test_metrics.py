@@ -0,0 +1,56 @@
+"""
+The metrics summary the operator pushes to XCom, against a local
+HubspotServer.
+"""
+import pytest
+
+COMPANIES = 'companies/v2/companies/paged'
+COMPANIES_METRIC = 'companies.v2.companies.paged'
+
+
+def test_summarizes_the_run(hubspot_server, hubspot_conn, make_operator, s3,
+                            context):
+    server = hubspot_server(records=1000)
+    conn_id = hubspot_conn(server)
+
+    make_operator(conn_id, 'companies', flush_records=500).execute(context)
+
+    summary = context['ti'].xcom['hubspot_metrics']
+    counters = summary['counters']
+    assert counters['requests.' + COMPANIES_METRIC] == server.stats[COMPANIES]
+    assert counters['pages.' + COMPANIES_METRIC] == server.stats[COMPANIES]
+    assert counters['records.companies.core'] == 1000
+    assert counters['s3_files'] == len(s3)
+    assert counters['s3_bytes'] == sum(len(e) for e in s3.values())
+    assert summary['gauges']['flush_records']['total'] == 1000
+    assert summary['timers']['latency.' + COMPANIES_METRIC]['count'] == \
+        server.stats[COMPANIES]
+    assert summary['retries']['retries'] == 0
+
+
+@pytest.mark.parametrize('async_fetch', [False, True])
+def test_counts_retries(hubspot_server, hubspot_conn, make_operator, s3,
+                        context, async_fetch):
+    server = hubspot_server(records=20, throttle_rate=0.3, retry_after=0,
+                            seed=4)
+    conn_id = hubspot_conn(server, max_retries=20)
+
+    make_operator(conn_id, 'contacts_by_company',
+                  async_fetch=async_fetch).execute(context)
+
+    retries = context['ti'].xcom['hubspot_metrics']['retries']
+    assert server.stats[429] > 0
+    assert retries['retries'] == server.stats[429]
+    assert retries['retries_by_reason'] == {'429': server.stats[429]}
+
+
+def test_summarizes_runs_without_companies(hubspot_server, hubspot_conn,
+                                           make_operator, s3, context):
+    server = hubspot_server(records=0)
+    conn_id = hubspot_conn(server)
+
+    assert make_operator(conn_id, 'contacts_by_company').execute(context)
+
+    counters = context['ti'].xcom['hubspot_metrics']['counters']
+    assert counters['requests.' + COMPANIES_METRIC] == 1
+    assert s3 == {}
@@ -0,0 +1,70 @@
+"""
+S3ParquetSink's size estimates, which decide when part files are flushed,
+and the coercion of JSON values to the Parquet column types.
+"""
+from HubspotPlugin.utils.output_sink import S3PartSink
+from HubspotPlugin.utils.serializers import get_serializer
+from concurrent.futures import Future
+import pytest
+
+pytest.importorskip('pyarrow')
+from HubspotPlugin.utils.parquet_sink import S3ParquetSink  # noqa: E402
+from HubspotPlugin.utils.parquet_sink import column_type  # noqa: E402
+
+COLUMNS = [{'name': 'id', 'type': 'bigint'},
+           {'name': 'name', 'type': 'varchar(256)'}]
+
+
+class SizeUploader(object):
+    """
+    Stands in for BackgroundUploader, keeping the size of every file.
+    """
+    part_size = 5 * 1024 * 1024
+
+    def __init__(self):
+        self.sizes = {}
+
+    def submit(self, key, fileobj, headers=None):
+        self.sizes[key] = len(fileobj.read())
+        fileobj.close()
+        future = Future()
+        future.set_result(key)
+        return future
+
+
+def test_sizes_rows_before_the_first_row_group():
+    uploader = SizeUploader()
+    sink = S3ParquetSink(uploader,
+                         lambda table: COLUMNS,
+                         S3PartSink(uploader),
+                         get_serializer('json'),
+                         row_group_size=10000)
+    rows = [{'id': i, 'name': 'company {0}'.format(i)} for i in range(1000)]
+
+    for row in rows:
+        sink.write('core', row)
+    # No row group is written yet, so the rows are sized as NDJSON.
+    assert sink.buffered_bytes >= 1000 * len(b'{"id":0,"name":"company 0"}')
+    sink.flush(lambda table: 'hubspot/{0}_1.json'.format(table))
+    size = uploader.sizes['hubspot/core_1.parquet']
+
+    for row in rows:
+        sink.write('core', row)
+    # Later files are sized from the bytes per row of the last one.
+    assert abs(sink.buffered_bytes - size) <= size * 0.1
+
+
+def test_coerces_values_to_the_column_types():
+    _, to_bigint = column_type('bigint')
+    assert to_bigint(2.0) == 2
+    assert to_bigint('2') == 2
+    # Neither truncated nor rounded.
+    assert to_bigint(1.9) is None
+    assert to_bigint(float('inf')) is None
+    assert to_bigint(2 ** 63) is None
+
+    _, to_varchar = column_type('varchar(256)')
+    assert to_varchar({'value': 'a', 'timestamp': 1}) == \
+        '{"value": "a", "timestamp": 1}'
+    assert to_varchar(['a', None]) == '["a", null]'
+    assert to_varchar(True) == 'True'
@@ -0,0 +1,96 @@
+"""
+Prefetching pages on a background thread, against a local HubspotServer.
+"""
+from HubspotPlugin.hooks.hubspot_hook import HubspotHook
+from HubspotPlugin.utils.fanout import prefetch
+from airflow.exceptions import AirflowException
+import threading
+import time
+import pytest
+
+COMPANIES = 'companies/v2/companies/paged'
+
+
+def fetch_pages(hook, count, closed=None):
+    """
+    Yields `count` pages of companies, setting `closed` once the
+    generator is closed.
+    """
+    try:
+        for i in range(count):
+            yield hook.run(COMPANIES, {'offset': i * 100}).json()
+    finally:
+        if closed is not None:
+            closed.set()
+
+
+def prefetch_threads():
+    return [e for e in threading.enumerate() if e.name == 'prefetch']
+
+
+def test_fetches_ahead_in_order(hubspot_server, hubspot_conn):
+    server = hubspot_server(records=1000)
+    hook = HubspotHook(hubspot_conn(server))
+    try:
+        pages = prefetch(fetch_pages(hook, 10), depth=2)
+        first = next(pages)
+        time.sleep(0.3)
+        # Two pages are waiting and a third is fetched, waiting for room.
+        assert server.stats[COMPANIES] == 1 + 2 + 1
+        offsets = [first['offset']] + [e['offset'] for e in pages]
+    finally:
+        hook.close()
+
+    assert offsets == [(i + 1) * 100 for i in range(10)]
+    assert server.stats[COMPANIES] == 10
+
+
+def test_stops_fetching_when_the_consumer_stops(hubspot_server, hubspot_conn):
+    server = hubspot_server(records=1000)
+    hook = HubspotHook(hubspot_conn(server))
+    closed = threading.Event()
+    try:
+        pages = prefetch(fetch_pages(hook, 10, closed), depth=1)
+        next(pages)
+        pages.close()
+    finally:
+        hook.close()
+
+    assert closed.is_set()
+    assert not prefetch_threads()
+    fetched = server.stats[COMPANIES]
+    time.sleep(0.2)
+    assert server.stats[COMPANIES] == fetched < 10
+
+
+def test_raises_fetch_errors_in_order(hubspot_server, hubspot_conn):
+    server = hubspot_server(records=1000, fail_requests={COMPANIES: [3]})
+    hook = HubspotHook(hubspot_conn(server))
+    received = []
+    try:
+        with pytest.raises(AirflowException):
+            for page in prefetch(fetch_pages(hook, 10), depth=4):
+                received.append(page['offset'])
+    finally:
+        hook.close()
+
+    # The pages before the failure are still delivered first.
+    assert received == [100, 200]
+    assert not prefetch_threads()
+
+
+def test_operator_output_matches_without_prefetch(hubspot_server,
+                                                  hubspot_conn,
+                                                  make_operator, s3,
+                                                  context):
+    conn_id = hubspot_conn(hubspot_server(records=1000, latency=0.005))
+
+    make_operator(conn_id, 'companies', flush_records=200,
+                  prefetch_pages=0).execute(context)
+    without_prefetch = dict(s3)
+    s3.clear()
+    make_operator(conn_id, 'companies', flush_records=200,
+                  prefetch_pages=3).execute(context)
+
+    assert len(without_prefetch) == 5
+    assert s3 == without_prefetch
@@ -0,0 +1,62 @@
+"""
+Rate limiting from HubSpot's X-HubSpot-RateLimit-* headers, against a
+local HubspotServer.
+"""
+from HubspotPlugin.hooks.hubspot_hook import HubspotHook
+from HubspotPlugin.utils.rate_limiter import TokenBucket, get_rate_limiter
+import time
+
+COMPANIES = 'companies/v2/companies/paged'
+
+
+def test_follows_the_secondly_limit(hubspot_server, hubspot_conn):
+    # The connection allows far more than the portal's 5 a second.
+    server = hubspot_server(rate_limit=5)
+    hook = HubspotHook(hubspot_conn(server, rate_limit=1000))
+
+    start = time.monotonic()
+    try:
+        for _ in range(12):
+            hook.run(COMPANIES)
+    finally:
+        hook.close()
+
+    # Once a second's requests are spent, the hook waits for the next
+    # second rather than being throttled.
+    assert server.stats[429] == 0
+    assert server.stats[200] == 12
+    assert time.monotonic() - start >= 2
+    assert hook.rate_limiter.rate == 5
+
+
+def test_raises_the_rate_again():
+    limiter = TokenBucket(100)
+
+    limiter.update_from_headers({'X-HubSpot-RateLimit-Secondly': '5'})
+    assert (limiter.rate, limiter.capacity) == (5, 5)
+    limiter.update_from_headers({'X-HubSpot-RateLimit-Secondly': '20'})
+    assert (limiter.rate, limiter.capacity) == (20, 20)
+    # Never above the configured rate.
+    limiter.update_from_headers({'X-HubSpot-RateLimit-Secondly': '500'})
+    assert (limiter.rate, limiter.capacity) == (100, 100)
+
+
+def test_waits_for_the_interval_to_reset():
+    limiter = TokenBucket(100)
+
+    limiter.update_from_headers({
+        'X-HubSpot-RateLimit-Max': '100',
+        'X-HubSpot-RateLimit-Interval-Milliseconds': '10000',
+        'X-HubSpot-RateLimit-Remaining': '0'})
+
+    assert limiter.rate == 10
+    assert limiter.reserve() >= 10
+
+
+def test_reconfigures_shared_limiters():
+    limiter = get_rate_limiter('test_reconfigures_shared_limiters', 10)
+
+    assert get_rate_limiter('test_reconfigures_shared_limiters', 10) \
+        is limiter
+    get_rate_limiter('test_reconfigures_shared_limiters', 50, 100)
+    assert (limiter.rate, limiter.capacity) == (50, 100)
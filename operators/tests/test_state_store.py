@@ -0,0 +1,105 @@
+"""
+The Variable and S3 state stores, on their own and behind the operator
+against a local HubspotServer.
+"""
+import HubspotPlugin.utils.state_store as state_store_module
+from HubspotPlugin.utils.state_store import get_state_store
+import json
+import pytest
+
+STATE_KEY = 'state/INCREMENTAL_KEY__hubspot_tests_hubspot_to_s3.json'
+
+
+class MemoryVariable(object):
+    """
+    Stands in for Airflow's Variable, keeping every Variable set in
+    `variables` as the string Airflow would store.
+    """
+    variables = {}
+
+    @classmethod
+    def get(cls, key, default_var=None, deserialize_json=False):
+        if key not in cls.variables:
+            if default_var is None:
+                raise KeyError('Variable {0} does not exist'.format(key))
+            return default_var
+        value = cls.variables[key]
+        return json.loads(value) if deserialize_json else value
+
+    @classmethod
+    def set(cls, key, value, serialize_json=False):
+        cls.variables[key] = json.dumps(value) if serialize_json else value
+
+    @classmethod
+    def delete(cls, key):
+        cls.variables.pop(key)
+
+
+@pytest.fixture
+def variables(monkeypatch):
+    monkeypatch.setattr(state_store_module, 'Variable', MemoryVariable)
+    monkeypatch.setattr(MemoryVariable, 'variables', {})
+    return MemoryVariable.variables
+
+
+def test_variable_store(variables):
+    state = get_state_store('variable', 'INCREMENTAL_KEY__dag_task')
+
+    state.set('vidOffset', 100)
+    state.set('checkpoint', {'page': 2})
+    assert variables == {}
+    state.flush()
+    assert variables == {'INCREMENTAL_KEY__dag_task_vidOffset': '100',
+                         'INCREMENTAL_KEY__dag_task_checkpoint':
+                         '{"page": 2}'}
+
+    state = get_state_store('variable', 'INCREMENTAL_KEY__dag_task')
+    assert state.get('checkpoint') == {'page': 2}
+    state.delete('checkpoint')
+    state.flush()
+    # The Variable is deleted rather than set to null.
+    assert variables == {'INCREMENTAL_KEY__dag_task_vidOffset': '100'}
+    assert state.get('checkpoint') is None
+    assert get_state_store('variable', 'INCREMENTAL_KEY__dag_task') \
+        .get('checkpoint', 'missing') == 'missing'
+
+
+def test_s3_store(s3):
+    state = get_state_store('s3://hubspot/state', 'INCREMENTAL_KEY__dag_task',
+                            s3_conn_id='s3')
+
+    state.set('vidOffset', 100)
+    state.set('checkpoint', {'page': 2})
+    assert s3 == {}
+    state.flush()
+    assert json.loads(s3['state/INCREMENTAL_KEY__dag_task.json']) == \
+        {'vidOffset': 100, 'checkpoint': {'page': 2}}
+
+    state = get_state_store('s3://hubspot/state', 'INCREMENTAL_KEY__dag_task',
+                            s3_conn_id='s3')
+    assert state.get('checkpoint') == {'page': 2}
+    state.delete('checkpoint')
+    state.flush()
+    assert json.loads(s3['state/INCREMENTAL_KEY__dag_task.json']) == \
+        {'vidOffset': 100}
+
+
+@pytest.mark.parametrize('state_store', ['variable', 's3://hubspot/state'])
+def test_operator_state(hubspot_server, hubspot_conn, make_operator, s3,
+                        context, variables, state_store):
+    conn_id = hubspot_conn(hubspot_server(records=1000))
+
+    operator = make_operator(conn_id, 'companies', flush_records=200,
+                             incremental=True, state_store=state_store)
+    operator.execute(context)
+
+    state = get_state_store(state_store,
+                            'INCREMENTAL_KEY__hubspot_tests_hubspot_to_s3',
+                            s3_conn_id='s3')
+    assert state.get('lastmodifieddate') > 0
+    # Nothing is left of the run's checkpoint or pending part files.
+    if state_store == 'variable':
+        assert list(variables) == \
+            ['INCREMENTAL_KEY__hubspot_tests_hubspot_to_s3_lastmodifieddate']
+    else:
+        assert list(json.loads(s3[STATE_KEY])) == ['lastmodifieddate']
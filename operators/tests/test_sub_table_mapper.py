@@ -0,0 +1,134 @@
+"""
+subTableMapper against the original, uncompiled, sub-table mapper on the
+records of every response fixture.
+"""
+from HubspotPlugin.operators.tests.fixtures import OBJECT_FIXTURES, \
+    fixture_records
+from HubspotPlugin.operators.hubspot_to_s3_operator import \
+    HubspotToS3Operator
+import copy
+import pytest
+
+LEGACY_MAPPING = [{'name': 'contacts',
+                   'split': 'form-submissions',
+                   'retained': []
+                   },
+                  {'name': 'contacts',
+                   'split': 'identity-profiles',
+                   'retained': [{"addedAt": "addedAt"}]
+                   },
+                  {'name': 'contacts',
+                   'split': 'merge-audits',
+                   'retained': [{'vid': 'vid'}]
+                   },
+                  {'name': 'contacts',
+                   'split': 'merged-vids',
+                   'retained': [{"vid": "vid"}]
+                   },
+                  {'name': 'contacts',
+                   'split': 'list-memberships',
+                   'retained': []
+                   },
+                  {'name': 'deals',
+                   'split': 'associations.associatedVids',
+                   'retained': [{"dealId": "deal_id"}]
+                   },
+                  {'name': 'deals',
+                   'split': 'associations.associatedCompanyIds',
+                   'retained': [{"dealId": "deal_id"}]
+                   },
+                  {'name': 'deals',
+                   'split': 'associations.associatedDealIds',
+                   'retained': [{"dealId": "deal_id"}]
+                   },
+                  {'name': 'deal_pipelines',
+                   'split': 'stages',
+                   'retained': [{"pipelineId": "pipeline_id"}]
+                   },
+                  {'name': 'forms',
+                   'split': 'formFieldGroups',
+                   'retained': [{'guid': 'form_id'}]
+                   },
+                  {'name': 'lists',
+                   'split': 'filters',
+                   'retained': []
+                   },
+                  {'name': 'owners',
+                   'split': 'remoteList',
+                   'retained': []
+                   },
+                  {'name': 'timeline',
+                   'split': 'changes',
+                   'retained': [{'timestamp': 'timestamp'},
+                                {'recipient': 'recipient'}]
+                   },
+                  {'name': 'workflows',
+                   'split': 'personaTagIds',
+                   'retained': [{'id': 'workflow_id'}]
+                   },
+                  {'name': 'workflows',
+                   'split': 'contactListIds.steps',
+                   'retained': [{'id': 'workflow_id'}]
+                   }]
+
+
+def legacy_sub_table_mapper(hubspot_object, output):
+    """
+    The sub-table mapper as it was before split plans were compiled,
+    walking the whole mapping for every record.
+    """
+    def get_by_dot_notation(obj, ref):
+        val = obj
+        try:
+            for key in ref.split('.'):
+                val = val[key]
+        except (KeyError, IndexError, TypeError):
+            val = False
+        return val
+
+    def process_record(record):
+        final_returnable_dict = {}
+        for entry in LEGACY_MAPPING:
+            returnable_list = []
+            subtable_data = get_by_dot_notation(record, entry['split'])
+            if entry['name'] == hubspot_object and subtable_data:
+                final_key_split = entry['split'].lower().replace('.', '_')
+                for item in subtable_data:
+                    returnable_dict = {}
+                    if isinstance(item, dict):
+                        returnable_dict = item
+                    elif isinstance(item, (str, int)):
+                        returnable_dict[final_key_split] = item
+                    for retained in entry['retained']:
+                        for k, v in retained.items():
+                            if k in record:
+                                returnable_dict[v] = record[k]
+                    returnable_list.append(returnable_dict)
+            if returnable_list:
+                final_returnable_dict[entry['split']] = returnable_list
+            final_returnable_dict['core'] = record
+        return final_returnable_dict
+
+    output = [process_record(record) for record in output]
+    output_list = [{'core': [e.pop('core') for e in output]}]
+    for entry in LEGACY_MAPPING:
+        if entry['name'] == hubspot_object:
+            rows = [item for e in output if entry['split'] in e
+                    for item in e.pop(entry['split'])]
+            if rows:
+                output_list.append({entry['split']: rows})
+    return output_list
+
+
+@pytest.mark.parametrize('hubspot_object', sorted(OBJECT_FIXTURES))
+def test_matches_the_legacy_mapper(hubspot_object):
+    operator = HubspotToS3Operator(task_id='sub_table_mapper',
+                                   hubspot_conn_id='hubspot',
+                                   hubspot_object=hubspot_object,
+                                   s3_conn_id='s3',
+                                   s3_bucket='hubspot',
+                                   s3_key='hubspot/output.json')
+    records = fixture_records(hubspot_object)
+
+    assert operator.subTableMapper(copy.deepcopy(records)) == \
+        legacy_sub_table_mapper(hubspot_object, copy.deepcopy(records))
@@ -0,0 +1,108 @@
+"""
+Background uploads of part files, on their own and behind the operator
+against a local HubspotServer.
+"""
+from HubspotPlugin.utils.uploader import BackgroundUploader
+import HubspotPlugin.utils.uploader as uploader_module
+from io import BytesIO
+import threading
+import pytest
+
+
+class BlockingWriter(uploader_module.S3MultipartWriter):
+    """
+    Holds every upload until `release` is set, counting the uploads
+    running at once.
+    """
+    release = threading.Event()
+    running = 0
+    most_running = 0
+    lock = threading.Lock()
+
+    def write(self, data):
+        cls = BlockingWriter
+        with cls.lock:
+            cls.running += 1
+            cls.most_running = max(cls.most_running, cls.running)
+        cls.release.wait()
+        with cls.lock:
+            cls.running -= 1
+        super().write(data)
+
+
+class FailingWriter(uploader_module.S3MultipartWriter):
+    """
+    Fails the upload of the fourth part file of the core table.
+    """
+
+    def close(self):
+        if self.key.endswith('_core_4.json'):
+            raise IOError('Injected upload failure.')
+        super().close()
+
+
+@pytest.fixture
+def blocking_writer(monkeypatch):
+    monkeypatch.setattr(uploader_module, 'S3MultipartWriter', BlockingWriter)
+    monkeypatch.setattr(BlockingWriter, 'release', threading.Event())
+    monkeypatch.setattr(BlockingWriter, 'running', 0)
+    monkeypatch.setattr(BlockingWriter, 'most_running', 0)
+    yield BlockingWriter
+    BlockingWriter.release.set()
+
+
+def test_matches_synchronous_uploads(hubspot_server, hubspot_conn,
+                                     make_operator, s3, context):
+    conn_id = hubspot_conn(hubspot_server(records=1000, latency=0.005))
+
+    make_operator(conn_id, 'companies', flush_records=100,
+                  upload_workers=0).execute(context)
+    synchronous = dict(s3)
+    s3.clear()
+    make_operator(conn_id, 'companies', flush_records=100,
+                  upload_workers=3, upload_queue_size=2).execute(context)
+
+    assert len(synchronous) == 10
+    assert s3 == synchronous
+
+
+def test_applies_backpressure(s3, blocking_writer):
+    uploader = BackgroundUploader('s3', 'hubspot', workers=2, max_pending=3)
+    submitted = []
+
+    def submit_all():
+        for i in range(5):
+            submitted.append(uploader.submit('part_{0}'.format(i),
+                                             BytesIO(b'data')))
+
+    thread = threading.Thread(target=submit_all)
+    thread.start()
+    thread.join(0.3)
+    # Two uploads are running and one is queued, so the fourth submit
+    # waits for a slot.
+    assert len(submitted) == 3
+    assert blocking_writer.most_running == 2
+
+    blocking_writer.release.set()
+    thread.join()
+    uploader.wait()
+    uploader.close()
+    assert sorted(s3) == ['part_{0}'.format(i) for i in range(5)]
+    assert blocking_writer.most_running == 2
+
+
+def test_fails_the_run_when_an_upload_fails(hubspot_server, hubspot_conn,
+                                            make_operator, s3, context,
+                                            monkeypatch):
+    monkeypatch.setattr(uploader_module, 'S3MultipartWriter', FailingWriter)
+    conn_id = hubspot_conn(hubspot_server(records=1000))
+    operator = make_operator(conn_id, 'companies', flush_records=100,
+                             upload_workers=2)
+
+    with pytest.raises(IOError):
+        operator.execute(context)
+
+    # Nothing at or after the failed part file is checkpointed.
+    checkpoint = operator.state.get(operator.checkpointName(context))
+    assert checkpoint is None or checkpoint['page'] < 4
+    assert 'hubspot/companies_core_4.json' not in s3
@@ -0,0 +1,45 @@
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# File extension appended to the S3 key and the Content-Encoding
+# set on the uploaded object for each supported compression.
+COMPRESSION_EXTENSIONS = {'gzip': '.gz',
+                          'zstd': '.zst'}
+CONTENT_ENCODINGS = {'gzip': 'gzip',
+                     'zstd': 'zstd'}
+DEFAULT_LEVELS = {'gzip': 6,
+                  'zstd': 3}
+
+
+def validate_compression(compression):
+    if compression is None:
+        return
+    if compression not in COMPRESSION_EXTENSIONS:
+        raise Exception('{0} is not a supported compression. Choose one of: {1}'
+                        .format(compression,
+                                ', '.join(sorted(COMPRESSION_EXTENSIONS))))
+    if compression == 'zstd' and zstandard is None:
+        raise Exception('zstd compression requires the zstandard package.')
+
+
+def get_compressor(compression, level=None):
+    """
+    Returns a streaming compressor for `compression` with a zlib style
+    interface: compress(data) returns the compressed bytes available so
+    far and flush() returns the remainder and ends the stream. Returns
+    None if `compression` is None.
+    """
+    if compression is None:
+        return None
+    validate_compression(compression)
+    if level is None:
+        level = DEFAULT_LEVELS[compression]
+    if compression == 'gzip':
+        # A wbits value of 16 + MAX_WBITS writes a gzip header and trailer.
+        return zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return zstandard.ZstdCompressor(level=level).compressobj()
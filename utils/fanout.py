@@ -0,0 +1,137 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import asyncio
+import queue
+import threading
+
+_DONE = object()
+
+
+def ordered_fan_out(func, items, concurrency):
+    """
+    Applies `func` to every item using a pool of `concurrency` worker
+    threads and yields the results in the same order as `items`.
+
+    At most `concurrency` calls are in flight at any time and `items` is
+    consumed lazily, so this can be fed from a generator without reading
+    it all into memory first. If a call raises, the exception is
+    re-raised in the caller when its result is reached and the remaining
+    queued calls are cancelled.
+    """
+    concurrency = max(int(concurrency), 1)
+    items = iter(items)
+    pending = deque()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        try:
+            for item in items:
+                pending.append(executor.submit(func, item))
+                if len(pending) >= concurrency:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def prefetch(items, depth=1):
+    """
+    Iterates `items` on a background thread, keeping up to `depth` items
+    ready ahead of the caller, and yields them in order.
+
+    This overlaps producing the next item (e.g. waiting on the next page
+    of a cursor paginated endpoint) with the caller's processing of the
+    current one. The source is consumed, and closed, on the background
+    thread only. Exceptions raised by the source are re-raised in the
+    caller when reached. If the caller stops early the background thread
+    is stopped and the source closed.
+    """
+    depth = max(int(depth), 1)
+    buffer = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(entry):
+        while not stop.is_set():
+            try:
+                buffer.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        source = iter(items)
+        try:
+            for item in source:
+                if not put((item, None)):
+                    break
+            else:
+                put((_DONE, None))
+        except BaseException as e:
+            put((_DONE, e))
+        finally:
+            if hasattr(source, 'close'):
+                source.close()
+
+    thread = threading.Thread(target=produce, name='prefetch', daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = buffer.get()
+            if error is not None:
+                raise error
+            if item is _DONE:
+                return
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+async def async_ordered_fan_out(func, items, concurrency):
+    """
+    The asyncio counterpart of ordered_fan_out. Awaits the coroutine
+    function `func` for every item of the async iterable `items`, with
+    at most `concurrency` calls in flight, and yields the results in the
+    same order as `items`.
+    """
+    concurrency = max(int(concurrency), 1)
+    pending = deque()
+    try:
+        async for item in items:
+            pending.append(asyncio.ensure_future(func(item)))
+            if len(pending) >= concurrency:
+                yield await pending.popleft()
+        while pending:
+            yield await pending.popleft()
+    finally:
+        for future in pending:
+            future.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+def iterate_async(items):
+    """
+    Iterates the async generator `items` from synchronous code on a
+    private event loop, yielding its items in order. The loop only runs
+    while the next item is being waited on and is closed, along with
+    `items`, when iteration ends.
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(items.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        loop.run_until_complete(items.aclose())
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        # Let any cleanup scheduled while closing (e.g. of abandoned
+        # async generators) finish before the loop goes away.
+        pending = asyncio.all_tasks(loop)
+        if pending:
+            loop.run_until_complete(asyncio.gather(*pending,
+                                                   return_exceptions=True))
+        loop.close()
@@ -0,0 +1,75 @@
+from airflow.settings import Stats
+from collections import Counter
+import threading
+import re
+
+DEFAULT_PREFIX = 'hubspot'
+
+
+def metricName(value):
+    """
+    Turns an endpoint or table name into a StatsD metric name component:
+    path segments become dot separated, numeric ids become 'id' and any
+    other character StatsD doesn't accept becomes an underscore.
+    """
+    segments = [('id' if segment.isdigit() else segment)
+                for segment in str(value).strip('/').split('/')]
+    return '.'.join(re.sub(r'[^A-Za-z0-9_\-]+', '_', segment)
+                    for segment in segments if segment)
+
+
+class Metrics(object):
+    """
+    Thread-safe collector for a task run's performance metrics.
+
+    Every counter and timing is sent to StatsD through Airflow's Stats as
+    it is recorded (so it only leaves the process if StatsD is enabled
+    in airflow.cfg), named '<prefix>.<name>'. Timings are sent in
+    milliseconds, so StatsD aggregates them into histograms, and gauges
+    (sizes measured now and then) as they are. The run's totals are also
+    kept in memory for summary().
+
+    :param prefix:      The prefix of every metric name.
+    :type prefix:       string
+    """
+
+    def __init__(self, prefix=DEFAULT_PREFIX):
+        self.prefix = prefix
+        self.counters = Counter()
+        self.timers = {}
+        self.gauges = {}
+        self._lock = threading.Lock()
+
+    def incr(self, name, count=1):
+        Stats.incr('{0}.{1}'.format(self.prefix, name), count)
+        with self._lock:
+            self.counters[name] += count
+
+    def timing(self, name, seconds):
+        Stats.timing('{0}.{1}'.format(self.prefix, name), seconds * 1000)
+        self._observe(self.timers, name, seconds)
+
+    def gauge(self, name, value):
+        Stats.gauge('{0}.{1}'.format(self.prefix, name), value)
+        self._observe(self.gauges, name, value)
+
+    def _observe(self, observations, name, value):
+        with self._lock:
+            observed = observations.setdefault(name, {'count': 0,
+                                                      'total': 0.0,
+                                                      'max': 0.0})
+            observed['count'] += 1
+            observed['total'] += value
+            observed['max'] = max(observed['max'], value)
+
+    def summary(self):
+        """
+        Returns the run's counters and, for every timing (in seconds)
+        and gauge, its count, total, mean and max.
+        """
+        with self._lock:
+            return {'counters': dict(self.counters),
+                    'timers': {name: dict(e, mean=e['total'] / e['count'])
+                               for name, e in self.timers.items()},
+                    'gauges': {name: dict(e, mean=e['total'] / e['count'])
+                               for name, e in self.gauges.items()}}
@@ -0,0 +1,113 @@
+from HubspotPlugin.utils.compression import COMPRESSION_EXTENSIONS, \
+    CONTENT_ENCODINGS, get_compressor
+from tempfile import SpooledTemporaryFile
+
+# The default number of (compressed) bytes buffered before part files
+# are flushed to S3.
+DEFAULT_FLUSH_SIZE = 64 * 1024 * 1024
+
+
+class S3PartSink(object):
+    """
+    Collects serialized records for each output table between flushes
+    and uploads every table as its own part file when flushed.
+
+    Each table is buffered in a spooled temporary file that is held in
+    memory up to `part_size` bytes and then spills to local disk, so the
+    memory used does not grow with the amount of data between flushes.
+    Records are separated by newlines to produce NDJSON and, if
+    requested, compressed as they are written. Flushed buffers are
+    handed to `uploader`, which may upload them in the background.
+
+    The rows and bytes buffered since the last flush are tracked in
+    `buffered_records` and `buffered_bytes`, so the caller can flush
+    part files of a similar size whatever the size of its records.
+
+    :param uploader:            The BackgroundUploader for part files.
+    :type uploader:             BackgroundUploader
+    :param compression:         Either 'gzip', 'zstd' or None.
+    :type compression:          string
+    :param compression_level:   The compression level. Defaults to the
+                                compression's own default.
+    :type compression_level:    int
+    """
+
+    def __init__(self,
+                 uploader,
+                 compression=None,
+                 compression_level=None):
+        self.uploader = uploader
+        self.part_size = uploader.part_size
+        self.compression = compression
+        self.compression_level = compression_level
+        self.total_output_files = 0
+        self.buffers = {}
+        self.compressors = {}
+        self.buffered_records = 0
+
+        if compression is None:
+            self.extension = ''
+            self.headers = {}
+        else:
+            self.extension = COMPRESSION_EXTENSIONS[compression]
+            self.headers = {'Content-Encoding': CONTENT_ENCODINGS[compression]}
+
+    def write(self, table, line):
+        buffer = self.buffers.get(table)
+        if buffer is None:
+            buffer = SpooledTemporaryFile(max_size=self.part_size)
+            self.buffers[table] = buffer
+            self.compressors[table] = get_compressor(self.compression,
+                                                     self.compression_level)
+        else:
+            line = b'\n' + line
+        compressor = self.compressors[table]
+        buffer.write(compressor.compress(line) if compressor else line)
+        self.buffered_records += 1
+
+    @property
+    def buffered_bytes(self):
+        """
+        The bytes written to the buffers since the last flush, after
+        compression. Data still held inside a compressor is not counted.
+        """
+        return sum(buffer.tell() for buffer in self.buffers.values())
+
+    def flush_keys(self, key_for_table):
+        """
+        Returns the keys flush(key_for_table) would upload to.
+        """
+        return [key_for_table(table) + self.extension
+                for table in self.buffers]
+
+    def flush(self, key_for_table):
+        """
+        Submits every table written since the last flush for upload to
+        the key returned by `key_for_table(table)` (plus the compression's
+        file extension). Returns the upload futures, whose results are
+        the keys written.
+        """
+        futures = []
+        buffers = self.buffers
+        compressors = self.compressors
+        self.buffers = {}
+        self.compressors = {}
+        self.buffered_records = 0
+        for table, buffer in buffers.items():
+            compressor = compressors[table]
+            if compressor:
+                buffer.write(compressor.flush())
+            buffer.seek(0)
+            futures.append(self.uploader.submit(
+                key_for_table(table) + self.extension,
+                buffer,
+                self.headers))
+        self.total_output_files += len(futures)
+        return futures
+
+    def close(self):
+        for buffer in self.buffers.values():
+            buffer.close()
+        self.buffers = {}
+        self.compressors = {}
+        self.buffered_records = 0
@@ -0,0 +1,331 @@
+from decimal import Decimal, InvalidOperation
+from datetime import datetime
+from tempfile import SpooledTemporaryFile
+from os import path
+import logging
+import json
+import math
+import re
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+DEFAULT_ROW_GROUP_SIZE = 10000
+PARQUET_EXTENSION = '.parquet'
+
+
+def to_int(value, bits=64):
+    """
+    Floats with a fractional part are written as null rather than
+    truncated.
+    """
+    if isinstance(value, float) and not value.is_integer():
+        return None
+    try:
+        value = int(value)
+    except (TypeError, ValueError, OverflowError):
+        return None
+    if -2 ** (bits - 1) <= value < 2 ** (bits - 1):
+        return value
+    return None
+
+
+def to_bool(value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        if value.lower() in ('true', 'false'):
+            return value.lower() == 'true'
+        return None
+    return None if value is None else bool(value)
+
+
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def to_timestamp(value):
+    """
+    HubSpot timestamps are epoch milliseconds, as either numbers or
+    strings. ISO 8601 strings are also accepted. Fractions of a
+    millisecond are dropped.
+    """
+    if isinstance(value, float) and math.isfinite(value):
+        value = int(value)
+    timestamp = to_int(value)
+    if timestamp is None and isinstance(value, str):
+        try:
+            parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+        timestamp = int(parsed.timestamp() * 1000)
+    return timestamp
+
+
+def to_str(value):
+    """
+    Objects and arrays are written as JSON.
+    """
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return str(value)
+
+
+def column_type(redshift_type):
+    """
+    Maps a column type from schemas/hubspot_schema.py to an Arrow type
+    and a function that coerces JSON values to it. Values that cannot be
+    coerced are written as null.
+    """
+    redshift_type = redshift_type.lower()
+    if redshift_type == 'bigint':
+        return pyarrow.int64(), to_int
+    elif redshift_type == 'int':
+        return pyarrow.int32(), lambda value: to_int(value, bits=32)
+    elif redshift_type == 'boolean':
+        return pyarrow.bool_(), to_bool
+    elif redshift_type == 'timestamp':
+        return pyarrow.timestamp('ms'), to_timestamp
+    elif redshift_type == 'double precision':
+        return pyarrow.float64(), to_float
+    elif redshift_type.startswith('decimal'):
+        precision, scale = [int(e) for e in
+                            re.findall(r'\d+', redshift_type)]
+        exponent = Decimal(1).scaleb(-scale)
+
+        def to_decimal(value):
+            try:
+                value = Decimal(str(value)).quantize(exponent)
+            except (InvalidOperation, ValueError):
+                return None
+            return value if len(value.as_tuple().digits) <= precision \
+                else None
+        return pyarrow.decimal128(precision, scale), to_decimal
+    return pyarrow.string(), to_str
+
+
+def compile_table_schema(columns):
+    """
+    Compiles a list of {'name', 'type'} columns into an Arrow schema and
+    the coercion function for each column.
+    """
+    fields = []
+    converters = []
+    for column in columns:
+        arrow_type, converter = column_type(column['type'])
+        fields.append(pyarrow.field(column['name'], arrow_type))
+        converters.append((column['name'], converter))
+    return pyarrow.schema(fields), converters
+
+
+class ParquetTableBuffer(object):
+    """
+    Builds a single Parquet file incrementally, writing a row group
+    every `row_group_size` rows into a spooled temporary file.
+
+    `row_size` is the estimated size in bytes of a row, used to size
+    the pending rows until the first row group has been written.
+    """
+
+    def __init__(self, schema, converters, part_size, row_group_size,
+                 compression, row_size):
+        self.schema = schema
+        self.converters = converters
+        self.row_group_size = row_group_size
+        self.row_size = row_size
+        self.rows = []
+        self.rows_written = 0
+        self.bytes_written = 0
+        self.file = SpooledTemporaryFile(max_size=part_size)
+        self.writer = pyarrow.parquet.ParquetWriter(
+            self.file,
+            schema,
+            compression=compression or 'snappy')
+
+    def write(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.row_group_size:
+            self.write_row_group()
+
+    @property
+    def size(self):
+        """
+        Approximates the size of the file so far: the row groups
+        written plus the pending rows, estimated from the size of the
+        rows already written or, before the first row group, from
+        `row_size`. The footer, written by finish(), is not counted.
+        """
+        written = self.file.tell()
+        if not self.rows_written:
+            return written + int(self.row_size * len(self.rows))
+        return written + written * len(self.rows) // self.rows_written
+
+    def write_row_group(self):
+        if not self.rows:
+            return
+        columns = [pyarrow.array([converter(row.get(name))
+                                  for row in self.rows],
+                                 type=self.schema.field(name).type)
+                   for name, converter in self.converters]
+        self.writer.write_table(pyarrow.Table.from_arrays(columns,
+                                                          schema=self.schema))
+        self.rows_written += len(self.rows)
+        self.rows = []
+
+    def finish(self):
+        """
+        Writes the last row group and the file footer and returns
+        the file, positioned at its start.
+        """
+        self.write_row_group()
+        self.writer.close()
+        self.bytes_written = self.file.tell()
+        self.file.seek(0)
+        return self.file
+
+    def close(self):
+        self.file.close()
+
+
+class S3ParquetSink(object):
+    """
+    Writes each output table as a Parquet file, typed according to
+    its schema in schemas/hubspot_schema.py. Rows are buffered only
+    until a row group is full, so memory is bounded by the row group
+    size rather than by the amount of data between flushes. Fields
+    that are not columns of the table's schema are dropped.
+
+    Until a table's first row group is written, its pending rows are
+    sized from the bytes per row of its previous file or, for its first
+    file, from the NDJSON size of its first row, so `buffered_bytes`
+    tracks the data buffered from the first row on.
+
+    Tables without a schema are passed on to `fallback_sink` (an
+    S3PartSink) and written as NDJSON instead. Parquet files take the
+    '.parquet' extension in place of their key's own.
+
+    :param uploader:            The BackgroundUploader for part files.
+    :type uploader:             BackgroundUploader
+    :param table_columns:       Returns the list of schema columns for
+                                an output table name, or None.
+    :type table_columns:        function
+    :param fallback_sink:       The sink used for tables without a schema.
+    :type fallback_sink:        S3PartSink
+    :param serializer:          Serializes rows sent to `fallback_sink`.
+    :type serializer:           JSONSerializer
+    :param row_group_size:      The number of rows in each row group.
+    :type row_group_size:       int
+    :param compression:         The Parquet compression codec. Defaults
+                                to snappy.
+    :type compression:          string
+    """
+
+    def __init__(self,
+                 uploader,
+                 table_columns,
+                 fallback_sink,
+                 serializer,
+                 row_group_size=DEFAULT_ROW_GROUP_SIZE,
+                 compression=None):
+        if pyarrow is None:
+            raise Exception('Parquet output requires the pyarrow package.')
+        self.uploader = uploader
+        self.table_columns = table_columns
+        self.fallback_sink = fallback_sink
+        self.serializer = serializer
+        self.part_size = uploader.part_size
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.parquet_files = 0
+        self.buffers = {}
+        self.schemas = {}
+        self.row_sizes = {}
+
+    @property
+    def total_output_files(self):
+        return self.parquet_files + self.fallback_sink.total_output_files
+
+    @property
+    def buffered_records(self):
+        return self.fallback_sink.buffered_records + \
+            sum(buffer.rows_written + len(buffer.rows)
+                for buffer in self.buffers.values())
+
+    @property
+    def buffered_bytes(self):
+        return self.fallback_sink.buffered_bytes + \
+            sum(buffer.size for buffer in self.buffers.values())
+
+    def get_schema(self, table):
+        if table not in self.schemas:
+            columns = self.table_columns(table)
+            if columns:
+                self.schemas[table] = compile_table_schema(columns)
+            else:
+                logging.info('No schema for {0}; writing it as NDJSON.'
+                             .format(table))
+                self.schemas[table] = None
+        return self.schemas[table]
+
+    def write(self, table, row):
+        buffer = self.buffers.get(table)
+        if buffer is None:
+            schema = self.get_schema(table)
+            if schema is None:
+                self.fallback_sink.write(table, self.serializer.dumps(row))
+                return
+            row_size = self.row_sizes.get(table)
+            if row_size is None:
+                row_size = len(self.serializer.dumps(row))
+            buffer = ParquetTableBuffer(schema[0],
+                                        schema[1],
+                                        self.part_size,
+                                        self.row_group_size,
+                                        self.compression,
+                                        row_size)
+            self.buffers[table] = buffer
+        buffer.write(row)
+
+    def parquet_key(self, key):
+        return path.splitext(key)[0] + PARQUET_EXTENSION
+
+    def flush_keys(self, key_for_table):
+        """
+        Returns the keys flush(key_for_table) would upload to.
+        """
+        return self.fallback_sink.flush_keys(key_for_table) + \
+            [self.parquet_key(key_for_table(table)) for table in self.buffers]
+
+    def flush(self, key_for_table):
+        """
+        Submits every table written since the last flush for upload to
+        the key returned by `key_for_table(table)`, with its extension
+        replaced by '.parquet' for Parquet files. Returns the upload
+        futures, whose results are the keys written.
+        """
+        futures = self.fallback_sink.flush(key_for_table)
+        buffers = self.buffers
+        self.buffers = {}
+        for table, buffer in buffers.items():
+            key = self.parquet_key(key_for_table(table))
+            futures.append(self.uploader.submit(key, buffer.finish()))
+            if buffer.rows_written:
+                self.row_sizes[table] = \
+                    buffer.bytes_written / buffer.rows_written
+            self.parquet_files += 1
+        return futures
+
+    def close(self):
+        for buffer in self.buffers.values():
+            buffer.close()
+        self.buffers = {}
+        self.fallback_sink.close()
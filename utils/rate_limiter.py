@@ -0,0 +1,142 @@
+import threading
+import time
+
+
+class TokenBucket(object):
+    """
+    Thread-safe token bucket rate limiter.
+
+    Tokens are added continuously at `rate` per second up to `capacity`,
+    and every request consumes one. The rate and the number of available
+    tokens follow HubSpot's X-HubSpot-RateLimit-* response headers, so
+    the limiter tracks the portal's real quota (and any other clients
+    spending it) rather than a fixed guess. The configured rate and
+    capacity are ceilings the headers never raise, so a connection can
+    be limited to its share of a portal's quota.
+
+    :param rate:        The number of tokens added per second.
+    :type rate:         float
+    :param capacity:    The maximum number of tokens that can be banked,
+                        i.e. the largest burst allowed. Defaults to `rate`.
+    :type capacity:     float
+    """
+
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise Exception('rate must be greater than 0.')
+        self.rate = self.max_rate = float(rate)
+        self.capacity = self.max_capacity = float(capacity or rate)
+        self.tokens = self.capacity
+        self.total_wait = 0.0
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def reserve(self):
+        """
+        Takes a token and returns how many seconds the caller must wait
+        before using it. Tokens may go negative, which queues concurrent
+        callers fairly behind each other.
+        """
+        with self._lock:
+            self._refill()
+            self.tokens -= 1
+            wait = max(-self.tokens / self.rate, 0.0)
+            self.total_wait += wait
+            return wait
+
+    def acquire(self):
+        """
+        Blocks until a token is available. Returns the time spent waiting.
+        """
+        wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def configure(self, rate, capacity=None):
+        """
+        Changes the configured rate and capacity, e.g. after the
+        connection's extras were edited. The headers of the next response
+        may lower them again.
+        """
+        if rate <= 0:
+            raise Exception('rate must be greater than 0.')
+        with self._lock:
+            self._refill()
+            self.rate = self.max_rate = float(rate)
+            self.capacity = self.max_capacity = float(capacity or rate)
+            self.tokens = min(self.tokens, self.capacity)
+
+    def update_from_headers(self, headers):
+        """
+        Adjusts the limiter from a HubSpot response's rate limit headers.
+        The rate and capacity are worked out afresh from the configured
+        ones and the headers of every response, so they rise again once
+        HubSpot allows it. Once HubSpot reports no requests remaining, the
+        next request waits for the whole window (a second, or the
+        interval) to pass. Missing or malformed headers are ignored.
+        """
+        def header(name):
+            try:
+                return float(headers['X-HubSpot-RateLimit-' + name])
+            except (KeyError, TypeError, ValueError):
+                return None
+
+        interval_max = header('Max')
+        interval_ms = header('Interval-Milliseconds')
+        secondly = header('Secondly')
+        # The remaining requests, and the seconds until each count resets.
+        remaining = [(count, window) for count, window in
+                     ((header('Remaining'),
+                       interval_ms and interval_ms / 1000),
+                      (header('Secondly-Remaining'), 1.0))
+                     if count is not None]
+
+        with self._lock:
+            self._refill()
+            rate = self.max_rate
+            capacity = self.max_capacity
+            if interval_max and interval_ms:
+                rate = min(rate, interval_max / (interval_ms / 1000))
+            if secondly:
+                rate = min(rate, secondly)
+                capacity = min(capacity, secondly)
+            self.rate = rate
+            self.capacity = capacity
+            self.tokens = min(self.tokens, self.capacity)
+            # Never believe we have more headroom than HubSpot reports.
+            for count, window in remaining:
+                if count > 0:
+                    self.tokens = min(self.tokens, count)
+                elif window:
+                    # Owe the tokens for a whole window, so the next
+                    # request waits until it has passed.
+                    self.tokens = min(self.tokens, -window * self.rate)
+                else:
+                    self.tokens = min(self.tokens, 0.0)
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(name, rate, capacity=None):
+    """
+    Returns the process-wide limiter registered under `name`, creating it
+    on first use. Hooks (and operators) running in the same worker process
+    that use the same connection therefore share a single quota. If
+    `rate` or `capacity` changed since, the limiter is reconfigured.
+    """
+    with _limiters_lock:
+        if name not in _limiters:
+            _limiters[name] = TokenBucket(rate, capacity)
+        limiter = _limiters[name]
+        if (limiter.max_rate, limiter.max_capacity) != \
+           (float(rate), float(capacity or rate)):
+            limiter.configure(rate, capacity)
+        return limiter
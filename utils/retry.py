@@ -0,0 +1,119 @@
+from collections import Counter
+from email.utils import parsedate_to_datetime
+import datetime
+import random
+import threading
+
+# Throttled and server side errors are worth retrying, anything else in
+# the 4xx range will fail the same way every time.
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+
+class RetryPolicy(object):
+    """
+    Thread-safe retry policy with capped exponential backoff and full
+    jitter.
+
+    The n-th retry of a request waits a random time between 0 and
+    `backoff * 2 ** n` seconds (capped at `max_backoff`), or as long as a
+    Retry-After header asks for if there is one. A request is retried at
+    most `max_retries` times.
+
+    Retries also draw on a shared budget of `budget` retries, refilled by
+    `ratio` of a retry for every request made (see record_request) and
+    capped at `budget`. Long runs can therefore keep retrying as long as
+    retries stay under about `ratio` of their requests, while a
+    struggling API fails the task rather than retrying every request in
+    turn.
+
+    Every retry is counted, by reason, along with the time spent waiting.
+
+    :param max_retries:     The number of retries allowed per request.
+    :type max_retries:      int
+    :param backoff:         The base backoff in seconds.
+    :type backoff:          float
+    :param max_backoff:     The longest backoff between two attempts.
+                            Retry-After is always honoured in full.
+    :type max_backoff:      float
+    :param budget:          The largest number of retries that can be
+                            made back to back.
+    :type budget:           int
+    :param ratio:           The share of a retry added to the budget by
+                            every request.
+    :type ratio:            float
+    """
+
+    def __init__(self, max_retries=5, backoff=1.0, max_backoff=60.0,
+                 budget=100, ratio=0.2):
+        self.max_retries = int(max_retries)
+        self.backoff = float(backoff)
+        self.max_backoff = float(max_backoff)
+        self.budget = int(budget)
+        self.ratio = float(ratio)
+        self.tokens = float(self.budget)
+        self.retries = Counter()
+        self.retry_wait = 0.0
+        self.exhausted = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def retryable(status_code):
+        return status_code in RETRYABLE_STATUSES
+
+    def record_request(self):
+        """
+        Counts a request made (including retries) towards the budget.
+        """
+        with self._lock:
+            self.tokens = min(self.tokens + self.ratio, self.budget)
+
+    def wait(self, attempt, reason, retry_after=None):
+        """
+        Returns how many seconds to wait before retrying a request that
+        has failed `attempt` times before (counting from 0) for `reason`
+        (e.g. '429' or 'timeout'), or None if it must not be retried.
+        """
+        with self._lock:
+            if attempt >= self.max_retries or self.tokens < 1:
+                self.exhausted += 1
+                return None
+            self.tokens -= 1
+            wait = parseRetryAfter(retry_after)
+            if wait is None:
+                wait = random.uniform(0, min(self.max_backoff,
+                                             self.backoff * 2 ** attempt))
+            self.retries[reason] += 1
+            self.retry_wait += wait
+            return wait
+
+    def metrics(self):
+        """
+        Returns the retries made so far, in total and by reason, the time
+        spent waiting on them and the number of requests that gave up.
+        """
+        with self._lock:
+            return {'retries': sum(self.retries.values()),
+                    'retries_by_reason': dict(self.retries),
+                    'retry_wait': self.retry_wait,
+                    'retries_exhausted': self.exhausted}
+
+
+def parseRetryAfter(value):
+    """
+    Parses a Retry-After header, given either in seconds or as an HTTP
+    date, into seconds from now. Returns None if missing or malformed.
+    """
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if when is None:
+        return None
+    now = datetime.datetime.now(when.tzinfo or datetime.timezone.utc)
+    return max((when - now).total_seconds(), 0.0)
@@ -0,0 +1,115 @@
+from io import BytesIO
+import logging
+
+
+# S3 rejects multipart parts smaller than 5MB (except for the last one).
+MIN_PART_SIZE = 5 * 1024 * 1024
+DEFAULT_PART_SIZE = 16 * 1024 * 1024
+
+
+def validate_part_size(part_size):
+    if part_size < MIN_PART_SIZE:
+        raise Exception('part_size must be at least {0} bytes.'
+                        .format(MIN_PART_SIZE))
+
+
+class S3MultipartWriter(object):
+    """
+    File-like sink that streams bytes to S3 using a multipart upload.
+
+    Data is buffered until `part_size` bytes are available, at which
+    point the buffer is uploaded as a single part and discarded. Peak
+    memory is therefore bounded by the part size rather than by the
+    size of the object being written. Objects that never fill a whole
+    part are uploaded with a single PUT when the writer is closed.
+
+    :param s3_hook:         An S3Hook instance.
+    :type s3_hook:          S3Hook
+    :param bucket_name:     The destination bucket.
+    :type bucket_name:      string
+    :param key:             The destination key.
+    :type key:              string
+    :param part_size:       The size (in bytes) of each uploaded part.
+    :type part_size:        int
+    :param headers:         Any headers (e.g. Content-Encoding) to set
+                            on the uploaded object.
+    :type headers:          dict
+    """
+
+    def __init__(self,
+                 s3_hook,
+                 bucket_name,
+                 key,
+                 part_size=DEFAULT_PART_SIZE,
+                 headers=None):
+        validate_part_size(part_size)
+        self.s3_hook = s3_hook
+        self.bucket_name = bucket_name
+        self.key = key
+        self.part_size = part_size
+        self.headers = headers or {}
+        self.bytes_written = 0
+        self.closed = False
+
+        self._buffer = BytesIO()
+        self._bucket = None
+        self._upload = None
+        self._part_number = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, data):
+        self._buffer.write(data)
+        self.bytes_written += len(data)
+        if self._buffer.tell() >= self.part_size:
+            self._upload_part()
+
+    def close(self):
+        if self.closed:
+            return
+        if self._upload is None:
+            # Nothing was ever flushed, so skip the multipart
+            # round trips and send the object in one request.
+            self._get_bucket().new_key(self.key) \
+                .set_contents_from_string(self._buffer.getvalue(),
+                                          headers=self.headers,
+                                          replace=True)
+        else:
+            if self._buffer.tell():
+                self._upload_part()
+            self._upload.complete_upload()
+            logging.info('Completed multipart upload of {0} ({1} parts).'
+                         .format(self.key, self._part_number))
+        self._buffer = BytesIO()
+        self.closed = True
+
+    def abort(self):
+        if self.closed:
+            return
+        if self._upload is not None:
+            logging.info('Aborting multipart upload of {0}.'.format(self.key))
+            self._upload.cancel_upload()
+        self._buffer = BytesIO()
+        self.closed = True
+
+    def _get_bucket(self):
+        if self._bucket is None:
+            self._bucket = self.s3_hook.get_bucket(self.bucket_name)
+        return self._bucket
+
+    def _upload_part(self):
+        if self._upload is None:
+            self._upload = self._get_bucket() \
+                .initiate_multipart_upload(self.key, headers=self.headers)
+        self._part_number += 1
+        self._buffer.seek(0)
+        self._upload.upload_part_from_file(self._buffer,
+                                           part_num=self._part_number)
+        self._buffer = BytesIO()
@@ -0,0 +1,68 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class JSONSerializer(object):
+    """
+    Serializes records with the standard library json module.
+
+    Output is compact (no whitespace after separators) UTF-8, like
+    OrjsonSerializer's. Lone surrogates, which UTF-8 can't encode, are
+    written as JSON escapes (e.g. \\udc80), as json.dumps does by
+    default.
+    """
+    name = 'json'
+
+    def dumps(self, record):
+        return json.dumps(record,
+                          separators=(',', ':'),
+                          ensure_ascii=False).encode('utf-8',
+                                                     'backslashreplace')
+
+
+class OrjsonSerializer(JSONSerializer):
+    """
+    Serializes records with orjson, which returns bytes directly
+    and is several times faster than the standard library.
+
+    Records orjson cannot encode (e.g. integers wider than 64 bits or
+    strings with lone surrogates) fall back to the standard library.
+
+    Output otherwise matches JSONSerializer's except for floats: orjson
+    writes exponents without a sign or leading zeros (1e-7 and 1e16
+    rather than 1e-07 and 1e+16) and NaN and infinity as null rather
+    than NaN and Infinity.
+    """
+    name = 'orjson'
+
+    def __init__(self):
+        if orjson is None:
+            raise Exception('orjson is not installed.')
+
+    def dumps(self, record):
+        try:
+            return orjson.dumps(record, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            return super().dumps(record)
+
+
+SERIALIZERS = {'json': JSONSerializer,
+               'orjson': OrjsonSerializer}
+
+
+def get_serializer(name=None):
+    """
+    Returns the serializer registered under `name`. If no name is
+    given, orjson is used when it is installed and the standard
+    library otherwise.
+    """
+    if name is None:
+        name = 'orjson' if orjson is not None else 'json'
+    if name not in SERIALIZERS:
+        raise Exception('{0} is not a supported serializer. Choose one of: {1}'
+                        .format(name, ', '.join(sorted(SERIALIZERS))))
+    return SERIALIZERS[name]()
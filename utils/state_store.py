@@ -0,0 +1,213 @@
+from airflow.models import Variable
+from airflow.hooks import S3Hook
+from airflow import settings
+from contextlib import closing
+import threading
+import sqlite3
+import json
+
+
+_DELETED = object()
+
+
+class StateStore(object):
+    """
+    Stores a task's state between runs: the contacts vidOffset, the
+    incremental watermark and pagination checkpoints.
+
+    Reads are cached, and writes are held in memory until flush() is
+    called, which persists every changed key in a single batch. Callers
+    flush once the data the state refers to is durable (i.e. in S3), so
+    several updates per flush cost one round of writes.
+
+    :param namespace:   Prefix separating this task's keys from others.
+    :type namespace:    string
+    """
+
+    def __init__(self, namespace):
+        self.namespace = namespace
+        self._cache = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._pending:
+                value = self._pending[key]
+            else:
+                if key not in self._cache:
+                    self._cache[key] = self._read(key)
+                value = self._cache[key]
+        return default if value is None or value is _DELETED else value
+
+    def set(self, key, value):
+        with self._lock:
+            self._pending[key] = value
+
+    def delete(self, key):
+        self.set(key, _DELETED)
+
+    def flush(self):
+        with self._lock:
+            changes = {k: v for k, v in self._pending.items()
+                       if k not in self._cache or self._cache[k] != v}
+            self._pending = {}
+            if changes:
+                self._write({k: (None if v is _DELETED else v)
+                             for k, v in changes.items()})
+                self._cache.update(changes)
+
+    def name(self, key):
+        return '{0}_{1}'.format(self.namespace, key)
+
+    def _read(self, key):
+        raise NotImplementedError()
+
+    def _write(self, changes):
+        """
+        Persists `changes`, a dict of key to value. A value of None
+        deletes the key.
+        """
+        raise NotImplementedError()
+
+
+class VariableStateStore(StateStore):
+    """
+    Keeps each key in its own Airflow Variable, named
+    <namespace>_<key> and serialized as JSON. Deleted keys have their
+    Variable deleted.
+    """
+
+    def _read(self, key):
+        try:
+            return Variable.get(self.name(key), deserialize_json=True)
+        except:
+            return None
+
+    def _write(self, changes):
+        for key, value in changes.items():
+            if value is None:
+                self._delete(self.name(key))
+            else:
+                Variable.set(self.name(key), value, serialize_json=True)
+
+    def _delete(self, name):
+        # Variable.delete is missing from older Airflow releases.
+        if hasattr(Variable, 'delete'):
+            Variable.delete(name)
+            return
+        session = settings.Session()
+        try:
+            session.query(Variable).filter(Variable.key == name).delete()
+            session.commit()
+        finally:
+            session.close()
+
+
+class SQLiteStateStore(StateStore):
+    """
+    Keeps state in a local SQLite database, writing each flush in one
+    transaction. Several tasks can share the same file.
+
+    :param path:        The path of the database file.
+    :type path:         string
+    """
+
+    def __init__(self, namespace, path):
+        super().__init__(namespace)
+        self.path = path
+        with closing(self._connect()) as conn, conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS hubspot_state '
+                         '(key TEXT PRIMARY KEY, value TEXT)')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=60)
+
+    def _read(self, key):
+        with closing(self._connect()) as conn:
+            row = conn.execute('SELECT value FROM hubspot_state WHERE key = ?',
+                               (self.name(key),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _write(self, changes):
+        with closing(self._connect()) as conn, conn:
+            for key, value in changes.items():
+                if value is None:
+                    conn.execute('DELETE FROM hubspot_state WHERE key = ?',
+                                 (self.name(key),))
+                else:
+                    conn.execute('INSERT OR REPLACE INTO hubspot_state '
+                                 '(key, value) VALUES (?, ?)',
+                                 (self.name(key), json.dumps(value)))
+
+
+class S3StateStore(StateStore):
+    """
+    Keeps all of a task's state in one JSON object in S3, at
+    <prefix>/<namespace>.json, rewritten with a single PUT per flush.
+
+    :param s3_conn_id:  The s3 connection id.
+    :type s3_conn_id:   string
+    :param bucket_name: The bucket holding the state.
+    :type bucket_name:  string
+    :param prefix:      The key prefix for state objects.
+    :type prefix:       string
+    """
+
+    def __init__(self, namespace, s3_conn_id, bucket_name, prefix):
+        super().__init__(namespace)
+        self.s3_conn_id = s3_conn_id
+        self.bucket_name = bucket_name
+        self.key = '{0}/{1}.json'.format(prefix.strip('/'), namespace) \
+            if prefix.strip('/') else '{0}.json'.format(namespace)
+        self._document = None
+
+    def _load(self):
+        if self._document is None:
+            s3 = S3Hook(self.s3_conn_id)
+            try:
+                key = s3.get_bucket(self.bucket_name).get_key(self.key)
+                self._document = json.loads(
+                    key.get_contents_as_string().decode('utf-8')) \
+                    if key else {}
+            finally:
+                s3.connection.close()
+        return self._document
+
+    def _read(self, key):
+        return self._load().get(key)
+
+    def _write(self, changes):
+        document = dict(self._load())
+        for key, value in changes.items():
+            if value is None:
+                document.pop(key, None)
+            else:
+                document[key] = value
+        s3 = S3Hook(self.s3_conn_id)
+        try:
+            s3.load_string(string_data=json.dumps(document),
+                           key=self.key,
+                           bucket_name=self.bucket_name,
+                           replace=True)
+        finally:
+            s3.connection.close()
+        self._document = document
+
+
+def get_state_store(uri, namespace, s3_conn_id=None):
+    """
+    Returns the state store described by `uri`:
+
+        - None or 'variable':       Airflow Variables.
+        - 'sqlite:///path/to.db':   A local SQLite database.
+        - 's3://bucket/prefix':     JSON objects in S3 (using s3_conn_id).
+    """
+    if uri is None or uri == 'variable':
+        return VariableStateStore(namespace)
+    elif uri.startswith('sqlite:///'):
+        return SQLiteStateStore(namespace, uri[len('sqlite:///'):])
+    elif uri.startswith('s3://'):
+        bucket_name, _, prefix = uri[len('s3://'):].partition('/')
+        return S3StateStore(namespace, s3_conn_id, bucket_name, prefix)
+    raise Exception('{0} is not a supported state store.'.format(uri))
@@ -0,0 +1,130 @@
+from airflow.hooks import S3Hook
+from HubspotPlugin.utils.s3_writer import S3MultipartWriter, DEFAULT_PART_SIZE
+from concurrent.futures import Future, ThreadPoolExecutor
+import threading
+import logging
+import time
+
+
+class BackgroundUploader(object):
+    """
+    Uploads finished part files to S3 on a pool of worker threads so
+    that fetching from HubSpot carries on while earlier parts upload.
+
+    At most `max_pending` uploads can be queued or running at once;
+    submit() blocks until a slot frees up, which applies backpressure
+    to the fetch loop and bounds the memory held by pending parts. An
+    upload that fails is re-raised by the next call to submit() or
+    wait(). With `workers` set to 0 uploads run synchronously. Every
+    upload's duration and size are recorded in `metrics`, if given.
+
+    :param s3_conn_id:      The s3 connection id.
+    :type s3_conn_id:       string
+    :param bucket_name:     The destination bucket.
+    :type bucket_name:      string
+    :param part_size:       The multipart upload part size.
+    :type part_size:        int
+    :param workers:         The number of upload threads.
+    :type workers:          int
+    :param max_pending:     The maximum number of uploads queued or in
+                            progress at once.
+    :type max_pending:      int
+    :param metrics:         The Metrics uploads are recorded to.
+    :type metrics:          Metrics
+    """
+
+    def __init__(self,
+                 s3_conn_id,
+                 bucket_name,
+                 part_size=DEFAULT_PART_SIZE,
+                 workers=2,
+                 max_pending=4,
+                 metrics=None):
+        self.s3_conn_id = s3_conn_id
+        self.bucket_name = bucket_name
+        self.part_size = part_size
+        self.workers = workers
+        self.metrics = metrics
+        self.futures = []
+        self._slots = threading.BoundedSemaphore(max(max_pending, 1))
+        self._executor = ThreadPoolExecutor(max_workers=workers) \
+            if workers else None
+
+    def submit(self, key, fileobj, headers=None):
+        """
+        Queues `fileobj` (positioned at its start) to be uploaded to
+        `key` and closed. Returns a future whose result is the key.
+        """
+        self.raise_for_errors()
+        if self._executor is None:
+            future = Future()
+            future.set_result(self.upload(key, fileobj, headers))
+            return future
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(self.upload, key, fileobj, headers)
+        except:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+        self.futures.append(future)
+        return future
+
+    def upload(self, key, fileobj, headers=None):
+        logging.info('Logging {0} to S3...'.format(key))
+        # Each upload gets its own hook as boto connections
+        # are not safe to share between threads.
+        s3 = S3Hook(self.s3_conn_id)
+        start = time.monotonic()
+        try:
+            with S3MultipartWriter(s3,
+                                   self.bucket_name,
+                                   key,
+                                   part_size=self.part_size,
+                                   headers=headers) as writer:
+                for chunk in iter(lambda: fileobj.read(self.part_size), b''):
+                    writer.write(chunk)
+        finally:
+            fileobj.close()
+            s3.connection.close()
+        if self.metrics is not None:
+            self.metrics.timing('s3_upload', time.monotonic() - start)
+            self.metrics.incr('s3_bytes', writer.bytes_written)
+            self.metrics.incr('s3_files')
+        return key
+
+    def delete(self, keys):
+        """
+        Deletes `keys` from the bucket. Keys that don't exist are ignored.
+        """
+        s3 = S3Hook(self.s3_conn_id)
+        try:
+            s3.get_bucket(self.bucket_name).delete_keys(keys)
+        finally:
+            s3.connection.close()
+
+    def raise_for_errors(self):
+        for future in self.futures:
+            if future.done() and future.exception() is not None:
+                raise future.exception()
+        self.futures = [e for e in self.futures if not e.done()]
+
+    def wait(self):
+        """
+        Blocks until every submitted upload has finished, re-raising
+        the first failure.
+        """
+        for future in self.futures:
+            future.result()
+        self.futures = []
+
+    def close(self):
+        """
+        Cancels any uploads that have not started and waits for the
+        rest to finish.
+        """
+        for future in self.futures:
+            future.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        self.futures = []